@@ -1,9 +1,36 @@
 import bpy
+import gpu
 import os
+import sys
+import re
+import ast
+import glob
+import csv
+import json
+import array
+import hashlib
 import math
+import time
+import shutil
+import shlex
+import argparse
+import tempfile
+import threading
+import collections
+import datetime
+import functools
+import subprocess
+import concurrent.futures
+import numpy as np
 from bpy.types import Operator, Panel, PropertyGroup
 from bpy.props import EnumProperty, FloatProperty, BoolProperty, StringProperty, IntProperty
-from mathutils import Matrix, Vector, Euler
+from bpy.app.handlers import persistent
+from mathutils import Matrix, Vector, Euler, Quaternion
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块,不记录峰值内存
+    resource = None
 
 #---------------------------------------------------------------
 # 插件信息定义
@@ -20,6 +47,27 @@ bl_info = {
     "tracker_url": "",
 }
 
+# 预览提速预设选项
+PLAYBLAST_SPEED_ITEMS = [
+    ('FULL', "完整", "保持场景的分辨率和显示设置"),
+    ('HALF', "半分辨率", "50%分辨率,快速抗锯齿"),
+    ('DRAFT', "草稿", "50%分辨率,隔帧渲染,关闭抗锯齿、阴影和细分,速度最快")
+]
+
+# 预览图像序列格式选项
+PLAYBLAST_SEQUENCE_ITEMS = [
+    ('NONE', "视频", "直接输出视频文件"),
+    ('PNG', "PNG", "输出PNG序列,再单独编码为视频"),
+    ('JPEG', "JPEG", "输出JPEG序列,再单独编码为视频"),
+    ('OPEN_EXR', "EXR", "输出EXR序列,再单独编码为视频")
+]
+
+# 预览编码方式选项
+PLAYBLAST_ENCODER_ITEMS = [
+    ('BLENDER', "内置", "使用Blender内置的FFmpeg写入器"),
+    ('PIPE', "外部FFmpeg", "将视口绘制的原始帧通过管道直接送入外部ffmpeg进程编码")
+]
+
 #---------------------------------------------------------------
 # 工具类定义 - 操作符(Operator)
 #---------------------------------------------------------------
@@ -53,10 +101,19 @@ class PIPELINE_OT_GenerateRig(Operator):
     bl_label = "生成绑定"
     bl_options = {'REGISTER', 'UNDO'}
     
+    force: BoolProperty(
+        name="强制生成",
+        default=False,
+        description="即使Metarig没有变化也重新生成绑定"
+    )
+    
     def execute(self, context):
         if context.active_object and context.active_object.type == 'ARMATURE':
-            bpy.ops.pose.rigify_generate()
-            self.report({'INFO'}, "Rigify绑定已生成")
+            rig, generated, elapsed = generate_rigify_rig(context, context.active_object, self.force)
+            if not generated:
+                self.report({'INFO'}, f"Metarig没有变化,跳过生成: {rig.name}")
+                return {'FINISHED'}
+            self.report({'INFO'}, f"Rigify绑定已生成,用时 {elapsed:.1f} 秒")
             return {'FINISHED'}
         else:
             self.report({'ERROR'}, "请先选择骨骼对象")
@@ -97,62 +154,136 @@ class PIPELINE_OT_Playblast(Operator):
         description="使用默认输出路径而不弹出对话框"
     )
     
+    background: BoolProperty(
+        name="后台渲染",
+        default=False,
+        description="保存场景副本并在后台Blender进程中渲染,渲染期间可以继续操作"
+    )
+    
+    incremental: BoolProperty(
+        name="增量预览",
+        default=False,
+        description="缓存每帧的渲染结果,只重新渲染姿态或摄像机发生变化的帧"
+    )
+    
+    speed: EnumProperty(
+        name="提速预设",
+        items=PLAYBLAST_SPEED_ITEMS,
+        default='FULL'
+    )
+    
+    parallel_workers: IntProperty(
+        name="并行进程数",
+        default=1,
+        min=1,
+        max=64,
+        description="大于1时将帧范围拆分给多个后台Blender进程并行渲染"
+    )
+    
+    profile: BoolProperty(
+        name="性能分析",
+        default=False,
+        description="记录每帧的场景求值、绘制和编码耗时,并在输出文件旁写入CSV/JSON报告"
+    )
+    
+    skip_unchanged: BoolProperty(
+        name="跳过未变化的场景",
+        default=False,
+        description="场景内容指纹与已有输出一致时不重新渲染,直接使用已有的预览文件"
+    )
+    
+    sequence_format: EnumProperty(
+        name="输出序列",
+        items=PLAYBLAST_SEQUENCE_ITEMS,
+        default='NONE'
+    )
+    
+    encoder: EnumProperty(
+        name="编码方式",
+        items=PLAYBLAST_ENCODER_ITEMS,
+        default='BLENDER'
+    )
+    
+    encode_threads: IntProperty(
+        name="编码线程数",
+        default=0,
+        min=0,
+        max=64,
+        description="外部ffmpeg的编码线程数,0表示自动"
+    )
+    
+    codec_options: StringProperty(
+        name="编码参数",
+        default="-c:v libx264 -pix_fmt yuv420p",
+        description="传给外部ffmpeg的输出编码参数,其中的-crf和-preset会覆盖质量档位"
+    )
+    
+    def invoke(self, context, event):
+        load_scene_settings(self, context.scene)
+        return self.execute(context)
+    
     def execute(self, context):
+        if self.background:
+            return self.start_background(context)
+        
         # 保存原始设置
-        original_engine = context.scene.render.engine
-        original_color_type = context.scene.display.shading.color_type
-        original_file_format = context.scene.render.image_settings.file_format
-        original_ffmpeg_format = context.scene.render.ffmpeg.format
-        original_ffmpeg_preset = context.scene.render.ffmpeg.ffmpeg_preset
-        original_crf = context.scene.render.ffmpeg.constant_rate_factor
-        original_filepath = context.scene.render.filepath
+        saved_settings = store_scene_settings(context.scene, PLAYBLAST_SCENE_SETTINGS)
+        profiling = False
         
         try:
-            # 设置渲染引擎
-            context.scene.render.engine = 'BLENDER_WORKBENCH'
-            context.scene.display.shading.color_type = 'RANDOM'
-            
             # 设置输出路径
             if self.use_default_path:
                 # 使用默认路径
-                blend_filepath = context.blend_data.filepath
-                if blend_filepath:
-                    blend_dir = os.path.dirname(blend_filepath)
-                    filepath = os.path.join(blend_dir, "playblast")
-                else:
-                    filepath = os.path.join(os.path.expanduser("~"), "playblast")
+                basepath = default_playblast_basepath(context.blend_data.filepath)
             else:
                 # 使用用户设置的路径
-                filepath = context.scene.pipeline_playblast_filepath
-            
-            # 设置输出格式
-            context.scene.render.image_settings.file_format = 'FFMPEG'
+                basepath = context.scene.pipeline_playblast_filepath
             
-            # 添加文件扩展名
-            if self.format == 'QUICKTIME':
-                context.scene.render.ffmpeg.format = 'QUICKTIME'
-                filepath += ".mov"            
-            elif self.format == 'MP4':
-                context.scene.render.ffmpeg.format = 'MPEG4'
-                filepath += ".mp4"
+            # 设置渲染引擎、输出格式和质量
+            filepath = apply_playblast_settings(context.scene, basepath, self.quality, self.format, self.speed)
+            output_dir = os.path.dirname(filepath)
             
-            context.scene.render.filepath = filepath
+            # 场景内容未变化时直接使用已有的输出
+            fingerprint = scene_content_fingerprint(context.scene) if self.skip_unchanged else None
+            if fingerprint and playblast_unchanged(filepath, fingerprint):
+                bpy.ops.render.play_rendered_anim()
+                context.scene.pipeline_last_playblast = filepath
+                self.report({'INFO'}, f"场景未变化,使用已有预览: {filepath}")
+                return {'FINISHED'}
             
-            # 根据质量设置
-            if self.quality == 'LOW':
-                context.scene.render.ffmpeg.constant_rate_factor = 'LOW'
-                context.scene.render.ffmpeg.ffmpeg_preset = 'REALTIME'
-            else:  # MEDIUM
-                context.scene.render.ffmpeg.constant_rate_factor = 'MEDIUM'
-                context.scene.render.ffmpeg.ffmpeg_preset = 'GOOD'
+            # 性能分析: 用帧变化和渲染回调记录每帧各阶段的时间(图像序列只记录序列的渲染,不含后台编码)
+            if self.profile:
+                start_playblast_profile()
+                profiling = True
             
-            # 确保输出目录存在
-            output_dir = os.path.dirname(filepath)
-            if not os.path.exists(output_dir):
-                os.makedirs(output_dir)
+            # 图像序列: 渲染完成后立即播放序列,视频编码在线程池中进行
+            if self.sequence_format != 'NONE':
+                return self.render_sequence(context, filepath, fingerprint)
             
             # 渲染动画
-            bpy.ops.render.render(animation=True, use_viewport=True)
+            if self.incremental:
+                rendered, total = render_playblast_incremental(context.scene, filepath, self.quality,
+                                                               self.format, use_viewport=True)
+                self.report({'INFO'}, f"增量预览: 重新渲染 {rendered}/{total} 帧")
+            elif self.encoder == 'PIPE':
+                filepath = bpy.path.abspath(filepath)
+                try:
+                    frames = render_playblast_pipe(context, filepath, self.quality, self.encode_threads, self.codec_options)
+                except (RuntimeError, OSError) as e:
+                    self.report({'ERROR'}, f"外部FFmpeg编码失败: {str(e)}")
+                    return {'CANCELLED'}
+                self.report({'INFO'}, f"外部FFmpeg编码: {frames} 帧")
+            elif self.parallel_workers > 1:
+                filepath = bpy.path.abspath(filepath)
+                try:
+                    chunks = render_playblast_parallel(context.scene, filepath, self.quality,
+                                                       self.format, self.parallel_workers)
+                except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+                    self.report({'ERROR'}, f"并行预览失败: {str(e)}")
+                    return {'CANCELLED'}
+                self.report({'INFO'}, f"并行预览: {chunks} 个分段")
+            else:
+                bpy.ops.render.render(animation=True, use_viewport=True)
             
             # 播放动画
             bpy.ops.render.play_rendered_anim()
@@ -164,16 +295,218 @@ class PIPELINE_OT_Playblast(Operator):
             
             # 保存渲染文件路径
             context.scene.pipeline_last_playblast = filepath
+            if fingerprint:
+                save_playblast_fingerprint(filepath, fingerprint)
+            
+            # 复制到版本库,保留历史版本
+            if context.scene.pipeline_playblast_versioned:
+                self.store_version(context, context.scene, filepath)
         finally:
+            # 写入性能分析报告
+            if profiling:
+                rows, summary = stop_playblast_profile(bpy.path.abspath(filepath))
+                report_path = write_playblast_profile(bpy.path.abspath(filepath), rows, summary)
+                context.scene.pipeline_playblast_profile_summary = format_playblast_profile(summary)
+                self.report({'INFO'}, f"性能报告: {report_path}")
+            
             # 恢复原始设置
-            context.scene.render.engine = original_engine
-            context.scene.display.shading.color_type = original_color_type
-            context.scene.render.image_settings.file_format = original_file_format
-            context.scene.render.ffmpeg.format = original_ffmpeg_format
-            context.scene.render.ffmpeg.ffmpeg_preset = original_ffmpeg_preset
-            context.scene.render.ffmpeg.constant_rate_factor = original_crf
-            context.scene.render.filepath = original_filepath
+            restore_scene_settings(context.scene, saved_settings)
+        
+        return {'FINISHED'}
+    
+    def render_sequence(self, context, filepath, fingerprint):
+        """渲染图像序列(可续渲)并提交编码,在已应用预览设置的场景上调用"""
+        scene = context.scene
+        filepath = bpy.path.abspath(filepath)
+        fingerprint = fingerprint or scene_content_fingerprint(scene)
+        frames_dir, existing = prepare_playblast_sequence(scene, filepath, self.sequence_format, fingerprint)
+        if existing:
+            self.report({'INFO'}, f"从已有的 {existing} 帧继续渲染")
+        
+        bpy.ops.render.render(animation=True, use_viewport=True)
+        bpy.ops.render.play_rendered_anim()
+        if self.show_file:
+            bpy.ops.wm.path_open(filepath=frames_dir)
+        
+        ffmpeg = shutil.which("ffmpeg")
+        if not ffmpeg:
+            # 没有ffmpeg时用序列编辑器在当前线程编码
+            extension = PLAYBLAST_SEQUENCE_FORMATS[self.sequence_format][1]
+            frame_paths = sorted(glob.glob(os.path.join(frames_dir, "frame_*" + extension)))
+            encode_image_sequence(scene, frame_paths, filepath, self.quality, self.format)
+            save_playblast_fingerprint(filepath, fingerprint)
+            scene.pipeline_last_playblast = filepath
+            self.report({'INFO'}, f"预览已编码: {filepath}")
+            return {'FINISHED'}
+        
+        queue_playblast_encode(scene, frames_dir, filepath, self.quality, self.format, ffmpeg)
+        self.report({'INFO'}, f"图像序列已渲染,正在后台编码: {filepath}")
+        return {'FINISHED'}
+    
+    def start_background(self, context):
+        """保存场景副本并启动后台渲染进程"""
+        if _background_playblast:
+            self.report({'WARNING'}, "已有后台预览正在渲染")
+            return {'CANCELLED'}
+        
+        scene = context.scene
+        if self.use_default_path:
+            basepath = default_playblast_basepath(context.blend_data.filepath)
+        else:
+            basepath = scene.pipeline_playblast_filepath
+        # 副本保存在临时目录,相对路径需要先按当前文件解析
+        basepath = bpy.path.abspath(basepath)
+        
+        # 保存场景副本,不改变当前文件路径
+        temp_dir, source = save_temp_copy()
+        
+        worker_args = ["--quality", self.quality, "--format", self.format, "--speed", self.speed,
+                       "--output", basepath, "--scene", scene.name]
+        if self.incremental:
+            worker_args.append("--incremental")
+        if self.profile:
+            worker_args.append("--profile")
+        if self.skip_unchanged:
+            worker_args.append("--skip-unchanged")
+        if self.sequence_format != 'NONE':
+            worker_args += ["--sequence", self.sequence_format]
+        try:
+            job = start_blender_worker(source, "playblast-worker", worker_args)
+        except OSError as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.report({'ERROR'}, f"启动后台渲染失败: {str(e)}")
+            return {'CANCELLED'}
+        
+        job.update({
+            'scene': scene.name,
+            'basepath': basepath,
+            'filepath': basepath + PLAYBLAST_FORMATS[self.format][1],
+            'temp_dir': temp_dir,
+            'total': len(range(scene.frame_start, scene.frame_end + 1,
+                               scene.frame_step * PLAYBLAST_SPEED_PRESETS[self.speed][1])),
+        })
+        # 读取线程直接更新job,面板和取消操作都读取同一个字典
+        _background_playblast['job'] = job
+        
+        wm = context.window_manager
+        wm.pipeline_playblast_progress = 0.0
+        wm.pipeline_playblast_status = f"后台预览: 0/{job['total']} 帧"
+        self._timer = wm.event_timer_add(0.5, window=context.window)
+        wm.modal_handler_add(self)
+        self.report({'INFO'}, "后台预览已开始")
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        # 更新面板中的进度
+        job = _background_playblast['job']
+        wm = context.window_manager
+        done = min(job['frames_done'], job['total'])
+        wm.pipeline_playblast_progress = done / max(job['total'], 1)
+        wm.pipeline_playblast_status = f"后台预览: {done}/{job['total']} 帧"
+        tag_redraw_sidebar(context)
+        
+        if job['process'].poll() is None:
+            return {'PASS_THROUGH'}
+        return self.finish_background(context)
+    
+    def finish_background(self, context):
+        """后台渲染结束后清理并登记输出文件"""
+        job = _background_playblast.pop('job')
+        
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.pipeline_playblast_progress = 0.0
+        wm.pipeline_playblast_status = ""
+        tag_redraw_sidebar(context)
+        
+        # 进程已退出,等读取线程读完剩余输出后再判断是否跳过了渲染
+        job['reader'].join()
+        shutil.rmtree(job['temp_dir'], ignore_errors=True)
+        
+        if job['cancelled']:
+            self.report({'WARNING'}, "后台预览已取消")
+            return {'CANCELLED'}
+        if job['process'].returncode != 0:
+            log = "\n".join(job['log'])
+            print(log)
+            self.report({'ERROR'}, f"后台预览失败(退出码 {job['process'].returncode}),详情见控制台")
+            return {'CANCELLED'}
+        
+        # 保存渲染文件路径
+        filepath = job['filepath']
+        scene = bpy.data.scenes.get(job['scene']) or context.scene
+        
+        # 图像序列在编码线程中编码,完成后再登记输出文件
+        if self.sequence_format != 'NONE' and not job['skipped']:
+            frames_dir = playblast_frames_dir(filepath)
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg:
+                queue_playblast_encode(scene, frames_dir, filepath, self.quality, self.format, ffmpeg)
+                self.report({'INFO'}, f"图像序列已渲染,正在后台编码: {filepath}")
+                return {'FINISHED'}
+            extension = PLAYBLAST_SEQUENCE_FORMATS[self.sequence_format][1]
+            frame_paths = sorted(glob.glob(os.path.join(frames_dir, "frame_*" + extension)))
+            encode_image_sequence(scene, frame_paths, filepath, self.quality, self.format)
+        scene.pipeline_last_playblast = filepath
+        
+        # 复制到版本库,保留历史版本(跳过渲染时已有版本无需重复保存)
+        if scene.pipeline_playblast_versioned and not job['skipped']:
+            self.store_version(context, scene, filepath)
+        
+        # 读取后台进程写出的性能分析报告
+        report_path = playblast_profile_basepath(bpy.path.abspath(filepath)) + ".json"
+        if self.profile and os.path.isfile(report_path):
+            with open(report_path, "r", encoding="utf-8") as f:
+                scene.pipeline_playblast_profile_summary = format_playblast_profile(json.load(f).get('summary'))
+        
+        # 播放动画,临时套用预览设置让播放器找到输出文件
+        saved_settings = store_scene_settings(scene, PLAYBLAST_SCENE_SETTINGS)
+        try:
+            apply_playblast_settings(scene, job['basepath'], self.quality, self.format)
+            bpy.ops.render.play_rendered_anim()
+        finally:
+            restore_scene_settings(scene, saved_settings)
+        
+        # 显示文件
+        output_dir = os.path.dirname(filepath)
+        if self.show_file and os.path.exists(output_dir):
+            bpy.ops.wm.path_open(filepath=output_dir)
         
+        if job['skipped']:
+            self.report({'INFO'}, f"场景未变化,使用已有预览: {filepath}")
+            return {'FINISHED'}
+        elapsed = time.perf_counter() - job['start_time']
+        self.report({'INFO'}, f"后台预览完成: {filepath},用时 {elapsed:.1f} 秒")
+        return {'FINISHED'}
+
+    def store_version(self, context, scene, filepath):
+        """将输出登记到版本库,失败时只报告不中断"""
+        try:
+            version_path, evicted = store_playblast_version(filepath, scene, context.blend_data.filepath,
+                                                            scene.pipeline_playblast_store_budget)
+        except OSError as e:
+            self.report({'WARNING'}, f"保存预览版本失败: {str(e)}")
+            return
+        message = f"已保存预览版本: {os.path.basename(version_path)}"
+        if evicted:
+            message += f",超出空间预算淘汰了 {evicted} 个旧版本"
+        self.report({'INFO'}, message)
+
+class PIPELINE_OT_CancelPlayblast(Operator):
+    """取消后台预览操作符"""
+    bl_idname = "pipeline.cancel_playblast"
+    bl_label = "取消后台预览"
+    
+    def execute(self, context):
+        if not _background_playblast:
+            self.report({'WARNING'}, "没有正在渲染的后台预览")
+            return {'CANCELLED'}
+        job = _background_playblast['job']
+        job['cancelled'] = True
+        job['process'].terminate()
         return {'FINISHED'}
 
 class PIPELINE_OT_DeletePlayblast(Operator):
@@ -194,6 +527,57 @@ class PIPELINE_OT_DeletePlayblast(Operator):
             self.report({'WARNING'}, "没有可删除的预览文件")
         return {'FINISHED'}
 
+class PIPELINE_OT_PlayPlayblastVersion(Operator):
+    """播放预览历史版本操作符"""
+    bl_idname = "pipeline.play_playblast_version"
+    bl_label = "播放预览版本"
+    
+    filepath: StringProperty(
+        subtype='FILE_PATH',
+        description="要播放的预览版本文件"
+    )
+    
+    def execute(self, context):
+        if not os.path.isfile(self.filepath):
+            self.report({'WARNING'}, "预览版本文件不存在")
+            return {'CANCELLED'}
+        
+        # 更新最近使用时间,避免正在对比的版本被淘汰
+        store_dir, index, shot, entry = find_playblast_version(self.filepath)
+        if entry:
+            entry['last_used'] = time.time()
+            save_playblast_store(store_dir, index)
+        
+        play_playblast_file(context.scene, self.filepath, entry)
+        return {'FINISHED'}
+
+class PIPELINE_OT_DeletePlayblastVersion(Operator):
+    """删除预览历史版本操作符"""
+    bl_idname = "pipeline.delete_playblast_version"
+    bl_label = "删除预览版本"
+    
+    filepath: StringProperty(
+        subtype='FILE_PATH',
+        description="要删除的预览版本文件"
+    )
+    
+    def execute(self, context):
+        store_dir, index, shot, entry = find_playblast_version(self.filepath)
+        try:
+            if os.path.exists(self.filepath):
+                os.remove(self.filepath)
+        except OSError as e:
+            self.report({'ERROR'}, f"删除失败: {str(e)}")
+            return {'CANCELLED'}
+        
+        if entry:
+            index['shots'][shot].remove(entry)
+            if not index['shots'][shot]:
+                del index['shots'][shot]
+            save_playblast_store(store_dir, index)
+        self.report({'INFO'}, f"已删除预览版本: {os.path.basename(self.filepath)}")
+        return {'FINISHED'}
+
 class PIPELINE_OT_PlayblastPathSelect(Operator):
     """选择预览动画输出路径操作符"""
     bl_idname = "pipeline.playblast_path_select"
@@ -272,25 +656,250 @@ class PIPELINE_OT_KeyframeCharacter(Operator):
     bl_idname = "pipeline.keyframe_character"
     bl_label = "插入角色关键帧"
     
+    bl_options = {'REGISTER', 'UNDO'}
+    
     key_type: EnumProperty(
         name="关键帧类型",
         items=[
-            ('WHOLE', "完整角色", "所有骨骼"),
-            ('SELECTED', "选中骨骼", "仅选中的骨骼")
+            ('WHOLE', "完整角色", "所有骨骼(跳过DEF、MCH、ORG等机制和形变骨骼)"),
+            ('SELECTED', "选中骨骼", "仅选中的骨骼(同样跳过机制和形变骨骼)")
         ],
         default='WHOLE'
     )
     
+    use_frame_range: BoolProperty(
+        name="帧范围",
+        default=False,
+        description="在帧范围内的每一帧插入求值后的姿态关键帧"
+    )
+    
+    use_scene_range: BoolProperty(
+        name="使用场景帧范围",
+        default=True,
+        description="使用场景的起止帧作为关键帧范围"
+    )
+    
+    frame_start: IntProperty(
+        name="起始帧",
+        default=1
+    )
+    
+    frame_end: IntProperty(
+        name="结束帧",
+        default=250
+    )
+    
+    frame_step: IntProperty(
+        name="帧步长",
+        default=1,
+        min=1
+    )
+    
+    def invoke(self, context, event):
+        load_scene_settings(self, context.scene)
+        return self.execute(context)
+    
     def execute(self, context):
         if context.mode != 'POSE':
             self.report({'ERROR'}, "请在姿态模式下操作")
             return {'CANCELLED'}
         
+        # 按骨骼对象收集需要插入关键帧的骨骼
         if self.key_type == 'WHOLE':
-            bpy.ops.anim.keyframe_insert_by_name(type="WholeCharacter")
+            rigs = {obj: list(obj.pose.bones) for obj in context.objects_in_mode if obj.type == 'ARMATURE'}
+        else:
+            rigs = {}
+            for bone in context.selected_pose_bones or ():
+                rigs.setdefault(bone.id_data, []).append(bone)
+        rigs = {rig: bones for rig, bones in rigs.items() if bones}
+        if not rigs:
+            self.report({'ERROR'}, "没有可插入关键帧的骨骼")
+            return {'CANCELLED'}
+        
+        if self.use_frame_range:
+            if self.use_scene_range:
+                frame_start, frame_end = context.scene.frame_start, context.scene.frame_end
+            else:
+                frame_start, frame_end = self.frame_start, self.frame_end
+            if frame_end < frame_start:
+                self.report({'ERROR'}, "结束帧不能小于起始帧")
+                return {'CANCELLED'}
+            frames = list(range(frame_start, frame_end + 1, self.frame_step))
+        else:
+            frames = None
+        
+        start_time = time.perf_counter()
+        curves, keys = keyframe_pose_bones(context.scene, rigs, frames)
+        elapsed = (time.perf_counter() - start_time) * 1000.0
+        
+        self.report({'INFO'}, f"已为 {len(rigs)} 个角色的 {curves} 条曲线插入 {keys} 个关键帧,用时 {elapsed:.1f} 毫秒")
+        return {'FINISHED'}
+
+class PIPELINE_OT_BakeAnimation(Operator):
+    """烘焙动画操作符"""
+    bl_idname = "pipeline.bake_animation"
+    bl_label = "烘焙动画"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    bake_mode: EnumProperty(
+        name="烘焙模式",
+        items=[
+            ('RANGE', "帧范围", "按步长烘焙帧范围内的帧"),
+            ('KEYED', "仅关键帧", "仅烘焙帧范围内已有关键帧的帧")
+        ],
+        default='RANGE'
+    )
+    
+    only_selected: BoolProperty(
+        name="仅选中骨骼",
+        default=False,
+        description="只烘焙选中的骨骼"
+    )
+    
+    use_scene_range: BoolProperty(
+        name="使用场景帧范围",
+        default=True,
+        description="使用场景的起止帧作为烘焙范围"
+    )
+    
+    frame_start: IntProperty(
+        name="起始帧",
+        default=1
+    )
+    
+    frame_end: IntProperty(
+        name="结束帧",
+        default=250
+    )
+    
+    frame_step: IntProperty(
+        name="帧步长",
+        default=1,
+        min=1
+    )
+    
+    simplify: BoolProperty(
+        name="简化曲线",
+        default=True,
+        description="烘焙后按容差用RDP算法删除冗余关键帧"
+    )
+    
+    tolerance: FloatProperty(
+        name="容差",
+        default=0.0001,
+        min=0.0,
+        precision=5,
+        description="简化曲线时允许的最大误差"
+    )
+    
+    clear_constraints: BoolProperty(
+        name="清除约束",
+        default=False,
+        description="烘焙后移除已烘焙骨骼的约束,避免约束被重复应用"
+    )
+    
+    def invoke(self, context, event):
+        load_scene_settings(self, context.scene)
+        return self.execute(context)
+    
+    def execute(self, context):
+        rigs = [obj for obj in context.selected_objects if obj.type == 'ARMATURE']
+        if not rigs:
+            self.report({'ERROR'}, "请选择骨骼对象")
+            return {'CANCELLED'}
+        
+        if self.use_scene_range:
+            frame_start, frame_end = context.scene.frame_start, context.scene.frame_end
+        else:
+            frame_start, frame_end = self.frame_start, self.frame_end
+        if frame_end < frame_start:
+            self.report({'ERROR'}, "结束帧不能小于起始帧")
+            return {'CANCELLED'}
+        
+        # 每个骨骼对象需要烘焙的骨骼
+        selected = {(bone.id_data, bone.name) for bone in context.selected_pose_bones or ()}
+        bones = {rig: [bone.name for bone in rig.pose.bones
+                       if not self.only_selected or (rig, bone.name) in selected] for rig in rigs}
+        bones = {rig: names for rig, names in bones.items() if names}
+        if not bones:
+            self.report({'ERROR'}, "没有可烘焙的骨骼")
+            return {'CANCELLED'}
+        
+        if self.bake_mode == 'KEYED':
+            frames = sorted(set().union(*(collect_keyed_frames(rig, set(names), frame_start, frame_end)
+                                          for rig, names in bones.items())))
         else:
-            bpy.ops.anim.keyframe_insert_by_name(type="WholeCharacterSelected")
+            frames = list(range(frame_start, frame_end + 1, self.frame_step))
+        if not frames:
+            self.report({'WARNING'}, "帧范围内没有可烘焙的关键帧")
+            return {'CANCELLED'}
+        
+        start_time = time.perf_counter()
+        tolerance = self.tolerance if self.simplify else None
+        curves, keys, removed = bake_pose_animation(context, bones, frames, tolerance)
+        elapsed = time.perf_counter() - start_time
+        
+        if self.clear_constraints:
+            for rig, names in bones.items():
+                for name in names:
+                    constraints = rig.pose.bones[name].constraints
+                    for constraint in list(constraints):
+                        constraints.remove(constraint)
+        
+        self.report({'INFO'}, f"已烘焙 {len(frames)} 帧,{curves} 条曲线,{keys} 个关键帧"
+                              f"(简化删除 {removed} 个),用时 {elapsed:.2f} 秒")
+        return {'FINISHED'}
+
+class PIPELINE_OT_ReduceKeyframes(Operator):
+    """精简关键帧操作符"""
+    bl_idname = "pipeline.reduce_keyframes"
+    bl_label = "精简关键帧"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    tolerance: FloatProperty(
+        name="容差",
+        default=0.001,
+        min=0.0,
+        precision=5,
+        description="精简后曲线与原始关键帧之间允许的最大误差"
+    )
+    
+    only_selected: BoolProperty(
+        name="仅选中骨骼",
+        default=False,
+        description="只精简选中骨骼的F曲线"
+    )
+    
+    def invoke(self, context, event):
+        load_scene_settings(self, context.scene)
+        return self.execute(context)
+    
+    def execute(self, context):
+        rigs = [obj for obj in context.selected_objects
+                if obj.type == 'ARMATURE' and obj.animation_data and obj.animation_data.action]
+        if not rigs:
+            self.report({'ERROR'}, "请选择带有动画的骨骼对象")
+            return {'CANCELLED'}
+        
+        selected = {}
+        for bone in context.selected_pose_bones or ():
+            selected.setdefault(bone.id_data, set()).add(bone.name)
         
+        start_time = time.perf_counter()
+        curves = total = removed = 0
+        max_error = 0.0
+        for rig in rigs:
+            bone_names = selected.get(rig, set()) if self.only_selected else None
+            result = reduce_action_keys(rig.animation_data.action, self.tolerance, bone_names)
+            curves += result[0]
+            total += result[1]
+            removed += result[2]
+            max_error = max(max_error, result[3])
+        elapsed = time.perf_counter() - start_time
+        
+        percent = removed / total * 100.0 if total else 0.0
+        self.report({'INFO'}, f"{curves} 条曲线删除 {removed}/{total} 个关键帧({percent:.0f}%),"
+                              f"最大误差 {max_error:.5f},用时 {elapsed:.2f} 秒")
         return {'FINISHED'}
 
 class PIPELINE_OT_SwitchMode(Operator):
@@ -317,17 +926,12 @@ class PIPELINE_OT_InstallExtensions(Operator):
     bl_label = "安装扩展"
     
     def execute(self, context):
-        install_commands = [
-            "bpy.ops.extensions.package_install(repo_index=0, pkg_id='camera_shakify')",
-            # ... 其他安装命令 ...
-        ]
-        
-        for cmd in install_commands:
+        for pkg_id, repo_index in EXTENSION_PACKAGES:
             try:
-                exec(cmd)
-                self.report({'INFO'}, f"已执行命令: {cmd}")
+                bpy.ops.extensions.package_install(repo_index=repo_index, pkg_id=pkg_id)
+                self.report({'INFO'}, f"已安装扩展: {pkg_id}")
             except Exception as e:
-                self.report({'ERROR'}, f"执行命令失败: {cmd} - {str(e)}")
+                self.report({'ERROR'}, f"安装扩展失败: {pkg_id} - {str(e)}")
         
         return {'FINISHED'}
 
@@ -350,26 +954,58 @@ class PIPELINE_OT_FilterIKFKInDopesheet(Operator):
     bl_label = "在摄影表中过滤IK_FK"
     
     def execute(self, context):
-        # 创建新窗口
-        bpy.ops.wm.window_new()
-        
-        # 获取新窗口的区域
-        area = None
-        for a in context.window_manager.windows[-1].screen.areas:
-            if a.type == 'DOPESHEET_EDITOR':
-                area = a
-                break
-        
+        # 优先使用已打开的摄影表或曲线编辑器,没有时才新建一个窗口
+        area = find_animation_editor(context)
         if not area:
-            # 如果没有找到摄影表编辑器，则创建一个
+            bpy.ops.wm.window_new()
             area = context.window_manager.windows[-1].screen.areas[0]
             area.ui_type = 'DOPESHEET'
         
         # 设置过滤条件
         space_data = area.spaces.active
         space_data.dopesheet.filter_text = "IK_FK"
+        space_data.dopesheet.use_filter_invert = False
         space_data.dopesheet.show_only_selected = False
+        area.tag_redraw()
+        
+        channels = sum(len(paths) for rig, paths in collect_ikfk_channels(context.scene))
+        self.report({'INFO'}, f"已过滤 {channels} 条IK_FK曲线")
+        return {'FINISHED'}
+
+class PIPELINE_OT_SelectIKFKCurves(Operator):
+    """选择所有IK_FK曲线操作符"""
+    bl_idname = "pipeline.select_ikfk_curves"
+    bl_label = "选择所有IK_FK曲线"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    extend: BoolProperty(
+        name="扩展选择",
+        default=False,
+        description="保留已选中的其他曲线"
+    )
+    
+    def execute(self, context):
+        curves = 0
+        for rig, paths in collect_ikfk_channels(context.scene):
+            for fcurve in rig.animation_data.action.fcurves:
+                selected = fcurve.data_path in paths
+                if selected or not self.extend:
+                    fcurve.select = selected
+                    # 同时选中或取消选中曲线上的所有关键帧
+                    flags = [selected] * len(fcurve.keyframe_points)
+                    fcurve.keyframe_points.foreach_set("select_control_point", flags)
+                curves += selected
         
+        if not curves:
+            self.report({'WARNING'}, "场景中没有IK_FK曲线")
+            return {'CANCELLED'}
+        
+        # 只重绘动画编辑器
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type in {'DOPESHEET_EDITOR', 'GRAPH_EDITOR'}:
+                    area.tag_redraw()
+        self.report({'INFO'}, f"已选择 {curves} 条IK_FK曲线")
         return {'FINISHED'}
 
 class PIPELINE_OT_IKFKSwitch(Operator):
@@ -377,283 +1013,154 @@ class PIPELINE_OT_IKFKSwitch(Operator):
     bl_idname = "pipeline.ikfk_switch"
     bl_label = "IK/FK切换"
     bl_options = {'REGISTER', 'UNDO'}
+
+    bake_mode: EnumProperty(
+        name="烘焙模式",
+        items=[
+            ('CURRENT', "当前帧", "仅对齐当前帧"),
+            ('RANGE', "帧范围", "对齐并烘焙帧范围内的每一帧"),
+            ('KEYED', "仅关键帧", "仅对齐并烘焙帧范围内已有关键帧的帧")
+        ],
+        default='CURRENT'
+    )
+
+    use_scene_range: BoolProperty(
+        name="使用场景帧范围",
+        default=True,
+        description="使用场景的起止帧作为烘焙范围"
+    )
+
+    frame_start: IntProperty(
+        name="起始帧",
+        default=1
+    )
+
+    frame_end: IntProperty(
+        name="结束帧",
+        default=250
+    )
     
+    def invoke(self, context, event):
+        load_scene_settings(self, context.scene)
+        return self.execute(context)
+
     def execute(self, context):
         # 检查当前模式
         if context.mode != 'POSE':
             self.report({'ERROR'}, "请在姿态模式下操作")
             return {'CANCELLED'}
         
-        # 获取当前选中的骨骼对象
-        rig = context.active_object
-        if not rig or rig.type != 'ARMATURE':
-            self.report({'ERROR'}, "请选择骨骼对象")
-            return {'CANCELLED'}
-        
-        # 获取选中的骨骼
+        # 获取选中的骨骼(多物体姿态模式下包含所有骨骼对象)
         selected_bones = context.selected_pose_bones
         if not selected_bones:
             self.report({'ERROR'}, "请先选择骨骼")
             return {'CANCELLED'}
         
-        # 尝试识别肢体类型
-        limb_type = None
-        for bone in selected_bones:
-            bone_name = bone.name.lower()
+        # 通过肢体索引识别选中骨骼涉及的所有肢体
+        limbs, missing = collect_selected_limbs(selected_bones)
+        for name in missing:
+            self.report({'WARNING'}, f"骨骼 {name} 不存在")
+        
+        # 如果无法识别肢体类型，报告错误
+        if not limbs:
+            if missing:
+                self.report({'ERROR'}, "选中的肢体缺少属性骨骼")
+            else:
+                self.report({'ERROR'}, "无法识别肢体类型,请选择手臂、腿部或手部骨骼")
+            return {'CANCELLED'}
+        
+        # 每个肢体按各自当前帧的IK/FK状态(有动画时按曲线求值)自动切换
+        for limb in limbs:
+            current_value = ikfk_value(limb['rig'], limb['prop_bone'], context.scene.frame_current)
+            limb['to_fk'] = current_value < IKFK_FK_THRESHOLD
+        
+        # 烘焙模式: 对齐并记录帧范围内的每一帧
+        if self.bake_mode != 'CURRENT':
+            if self.use_scene_range:
+                frame_start, frame_end = context.scene.frame_start, context.scene.frame_end
+            else:
+                frame_start, frame_end = self.frame_start, self.frame_end
             
-            # 检查左臂骨骼
-            if ("hand_ik.l" in bone_name or "forearm_fk.l" in bone_name or 
-                "upper_arm_fk.l" in bone_name or "hand_fk.l" in bone_name):
-                limb_type = "ARM_L"
-                break
+            if frame_end < frame_start:
+                self.report({'ERROR'}, "结束帧不能小于起始帧")
+                return {'CANCELLED'}
             
-            # 检查右臂骨骼
-            elif ("hand_ik.r" in bone_name or "hand_fk.r" in bone_name or 
-                  "forearm_fk.r" in bone_name or "upper_arm_fk.r" in bone_name):
-                limb_type = "ARM_R"
-                break
+            jobs = []
+            for limb in limbs:
+                if not limb_chain_complete(limb['chain'], limb['to_fk']):
+                    self.report({'WARNING'}, f"{limb['rig'].name}: {limb['limb_type']} 骨骼链不完整,已跳过")
+                    continue
+                
+                if self.bake_mode == 'KEYED':
+                    # 以源骨骼链和属性骨骼上的关键帧作为烘焙帧
+                    ik_bones, fk_bones, pole, has_pole = limb['chain']
+                    source = ik_bones if limb['to_fk'] else fk_bones
+                    bone_names = {bone.name for bone in source}
+                    bone_names.add(limb['prop_bone'].name)
+                    limb['frames'] = collect_keyed_frames(limb['rig'], bone_names, frame_start, frame_end)
+                else:
+                    limb['frames'] = list(range(frame_start, frame_end + 1))
+                
+                if limb['frames']:
+                    jobs.append(limb)
             
-            # 检查左腿骨骼
-            elif ("foot_ik.l" in bone_name or "foot_fk.l" in bone_name or 
-                  "shin_fk.l" in bone_name or "thigh_fk.l" in bone_name or 
-                  "thigh_ik.l" in bone_name):
-                limb_type = "LEG_L"
-                break
+            if not jobs:
+                self.report({'WARNING'}, "帧范围内没有可烘焙的关键帧")
+                return {'CANCELLED'}
             
-            # 检查右腿骨骼
-            elif ("foot_ik.r" in bone_name or "foot_fk.r" in bone_name or 
-                  "shin_fk.r" in bone_name or "thigh_fk.r" in bone_name or 
-                  "thigh_ik.r" in bone_name):
-                limb_type = "LEG_R"
-                break
+            start_time = time.perf_counter()
+            frame_count = bake_limb_switches(context, jobs)
+            elapsed = time.perf_counter() - start_time
             
-            # 检查手部骨骼
-            elif ("hand_ik" in bone_name or "hand_fk" in bone_name):
-                limb_type = "HAND"
-                break
-        
-        # 如果无法识别肢体类型，报告错误
-        if not limb_type:
-            self.report({'ERROR'}, "无法识别肢体类型,请选择手臂、腿部或手部骨骼")
-            return {'CANCELLED'}
+            self.report({'INFO'}, f"已烘焙 {format_limb_switches(jobs)},共 {frame_count} 帧,用时 {elapsed:.2f} 秒")
+            return {'FINISHED'}
         
-        # 肢体映射到属性骨骼名称
-        bone_map = {
-            'ARM_L': "upper_arm_parent.L",
-            'ARM_R': "upper_arm_parent.R",
-            'LEG_L': "thigh_parent.L",
-            'LEG_R': "thigh_parent.R",
-            'HAND': "hand_ik"  # 手部使用不同的属性骨骼
-        }
+        # 先写入所有属性和骨骼通道,最后统一更新一次视图
+        for limb in limbs:
+            limb['prop_bone']["IK_FK"] = 1.0 if limb['to_fk'] else 0.0
+            snap_limb_chain(context.view_layer, limb['chain'], limb['to_fk'], update=False)
+        context.view_layer.update()
         
-        # 获取属性骨骼名称
-        prop_bone_name = bone_map[limb_type]
+        # 报告结果
+        self.report({'INFO'}, f"已切换 {format_limb_switches(limbs)},骨骼已正确跟随")
         
-        # 检查属性骨骼是否存在
-        if prop_bone_name not in rig.pose.bones:
-            self.report({'ERROR'}, f"骨骼 {prop_bone_name} 不存在")
+        return {'FINISHED'}
+
+class PIPELINE_OT_IKFKSnapSwitches(Operator):
+    """对齐IK/FK切换帧操作符"""
+    bl_idname = "pipeline.ikfk_snap_switches"
+    bl_label = "对齐IK/FK切换帧"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    def execute(self, context):
+        rigs = [obj for obj in context.selected_objects if obj.type == 'ARMATURE']
+        if not rigs and context.active_object and context.active_object.type == 'ARMATURE':
+            rigs = [context.active_object]
+        if not rigs:
+            self.report({'ERROR'}, "请选择骨骼对象")
             return {'CANCELLED'}
         
-        # 获取属性骨骼
-        prop_bone = rig.pose.bones[prop_bone_name]
-        
-        # 获取当前IK/FK状态
-        current_value = prop_bone.get("IK_FK", 0.0)
+        # 一次读取所有肢体的IK_FK曲线,按切换帧汇总需要对齐的肢体
+        boundaries = {}
+        limbs = 0
+        for rig in rigs:
+            for limb_type, spans in build_ikfk_intervals(rig).items():
+                limbs += 1
+                for start, end, mode in spans[1:]:
+                    boundaries.setdefault(start, []).append((rig, limb_type, mode == 'FK'))
         
-        # 自动切换状态
-        new_value = 1.0 if current_value == 0.0 else 0.0
+        if not boundaries:
+            self.report({'WARNING'}, "没有找到IK_FK切换")
+            return {'CANCELLED'}
         
-        # 设置新值
-        prop_bone["IK_FK"] = new_value
-        
-        # 根据切换方向执行相应的操作
-        if new_value == 1.0:  # IK切换到FK
-            if limb_type in ['ARM_L', 'ARM_R']:
-                # 左臂或右臂
-                side = 'L' if limb_type == 'ARM_L' else 'R'
-                
-                # 获取骨骼
-                upper_arm_ik = rig.pose.bones.get(f"upper_arm_ik.{side}")
-                forearm_ik = rig.pose.bones.get(f"forearm_ik.{side}")
-                hand_ik = rig.pose.bones.get(f"hand_ik.{side}")
-                
-                upper_arm_fk = rig.pose.bones.get(f"upper_arm_fk.{side}")
-                forearm_fk = rig.pose.bones.get(f"forearm_fk.{side}")
-                hand_fk = rig.pose.bones.get(f"hand_fk.{side}")
-                
-                # 执行IK到FK的切换操作
-                if upper_arm_ik and forearm_ik and hand_ik and upper_arm_fk and forearm_fk and hand_fk:
-                    # 确保FK骨骼使用四元数旋转
-                    for bone in [upper_arm_fk, forearm_fk, hand_fk]:
-                        if bone.rotation_mode != 'QUATERNION':
-                            bone.rotation_mode = 'QUATERNION'
-                    
-                    # 复制位置和旋转
-                    upper_arm_fk.location = upper_arm_ik.location.copy()
-                    upper_arm_fk.rotation_quaternion = upper_arm_ik.rotation_quaternion.copy()
-                    
-                    forearm_fk.location = forearm_ik.location.copy()
-                    forearm_fk.rotation_quaternion = forearm_ik.rotation_quaternion.copy()
-                    
-                    hand_fk.location = hand_ik.location.copy()
-                    hand_fk.rotation_quaternion = hand_ik.rotation_quaternion.copy()
-                    
-                    # 更新视图
-                    context.view_layer.update()
-            elif limb_type in ['LEG_L', 'LEG_R']:
-                # 左腿或右腿
-                side = 'L' if limb_type == 'LEG_L' else 'R'
-                
-                # 获取骨骼
-                thigh_ik = rig.pose.bones.get(f"thigh_ik.{side}")
-                shin_ik = rig.pose.bones.get(f"shin_ik.{side}")
-                foot_ik = rig.pose.bones.get(f"foot_ik.{side}")
-                toe_ik = rig.pose.bones.get(f"toe_ik.{side}")
-                
-                thigh_fk = rig.pose.bones.get(f"thigh_fk.{side}")
-                shin_fk = rig.pose.bones.get(f"shin_fk.{side}")
-                foot_fk = rig.pose.bones.get(f"foot_fk.{side}")
-                toe_fk = rig.pose.bones.get(f"toe_fk.{side}")
-                
-                # 执行IK到FK的切换操作
-                if thigh_ik and shin_ik and foot_ik and toe_ik and thigh_fk and shin_fk and foot_fk and toe_fk:
-                    # 确保FK骨骼使用四元数旋转
-                    for bone in [thigh_fk, shin_fk, foot_fk, toe_fk]:
-                        if bone.rotation_mode != 'QUATERNION':
-                            bone.rotation_mode = 'QUATERNION'
-                    
-                    # 复制位置和旋转
-                    thigh_fk.location = thigh_ik.location.copy()
-                    thigh_fk.rotation_quaternion = thigh_ik.rotation_quaternion.copy()
-                    
-                    shin_fk.location = shin_ik.location.copy()
-                    shin_fk.rotation_quaternion = shin_ik.rotation_quaternion.copy()
-                    
-                    foot_fk.location = foot_ik.location.copy()
-                    foot_fk.rotation_quaternion = foot_ik.rotation_quaternion.copy()
-                    
-                    toe_fk.location = toe_ik.location.copy()
-                    toe_fk.rotation_quaternion = toe_ik.rotation_quaternion.copy()
-                    
-                    # 更新视图
-                    context.view_layer.update()
-            elif limb_type == 'HAND':
-                # 手部
-                hand_ik = rig.pose.bones.get("hand_ik")
-                hand_fk = rig.pose.bones.get("hand_fk")
-                
-                # 执行IK到FK的切换操作
-                if hand_ik and hand_fk:
-                    # 确保FK骨骼使用四元数旋转
-                    if hand_fk.rotation_mode != 'QUATERNION':
-                        hand_fk.rotation_mode = 'QUATERNION'
-                    
-                    # 复制位置和旋转
-                    hand_fk.location = hand_ik.location.copy()
-                    hand_fk.rotation_quaternion = hand_ik.rotation_quaternion.copy()
-                    
-                    # 更新视图
-                    context.view_layer.update()
-        else:  # FK切换到IK
-            if limb_type in ['ARM_L', 'ARM_R']:
-                # 左臂或右臂
-                side = 'L' if limb_type == 'ARM_L' else 'R'
-                
-                # 获取骨骼
-                upper_arm_fk = rig.pose.bones.get(f"upper_arm_fk.{side}")
-                forearm_fk = rig.pose.bones.get(f"forearm_fk.{side}")
-                hand_fk = rig.pose.bones.get(f"hand_fk.{side}")
-                
-                upper_arm_ik = rig.pose.bones.get(f"upper_arm_ik.{side}")
-                forearm_ik = rig.pose.bones.get(f"forearm_ik.{side}")
-                hand_ik = rig.pose.bones.get(f"hand_ik.{side}")
-                pole_target = rig.pose.bones.get(f"upper_arm_ik_target.{side}")
-                
-                # 执行FK到IK的切换操作
-                if upper_arm_fk and forearm_fk and hand_fk and upper_arm_ik and forearm_ik and hand_ik and pole_target:
-                    # 复制位置和旋转
-                    upper_arm_ik.location = upper_arm_fk.location.copy()
-                    upper_arm_ik.rotation_quaternion = upper_arm_fk.rotation_quaternion.copy()
-                    
-                    forearm_ik.location = forearm_fk.location.copy()
-                    forearm_ik.rotation_quaternion = forearm_fk.rotation_quaternion.copy()
-                    
-                    hand_ik.location = hand_fk.location.copy()
-                    hand_ik.rotation_quaternion = hand_fk.rotation_quaternion.copy()
-                    
-                    # 匹配极目标
-                    match_pole_target(
-                        context.view_layer,
-                        upper_arm_ik,
-                        forearm_ik,
-                        pole_target,
-                        upper_arm_fk.matrix,
-                        1.0  # 长度
-                    )
-                    
-                    # 更新视图
-                    context.view_layer.update()
-            elif limb_type in ['LEG_L', 'LEG_R']:
-                # 左腿或右腿
-                side = 'L' if limb_type == 'LEG_L' else 'R'
-                
-                # 获取骨骼
-                thigh_fk = rig.pose.bones.get(f"thigh_fk.{side}")
-                shin_fk = rig.pose.bones.get(f"shin_fk.{side}")
-                foot_fk = rig.pose.bones.get(f"foot_fk.{side}")
-                toe_fk = rig.pose.bones.get(f"toe_fk.{side}")
-                
-                thigh_ik = rig.pose.bones.get(f"thigh_ik.{side}")
-                shin_ik = rig.pose.bones.get(f"shin_ik.{side}")
-                foot_ik = rig.pose.bones.get(f"foot_ik.{side}")
-                toe_ik = rig.pose.bones.get(f"toe_ik.{side}")
-                pole_target = rig.pose.bones.get(f"thigh_ik_target.{side}")
-                
-                # 执行FK到IK的切换操作
-                if thigh_fk and shin_fk and foot_fk and toe_fk and thigh_ik and shin_ik and foot_ik and toe_ik and pole_target:
-                    # 复制位置和旋转
-                    thigh_ik.location = thigh_fk.location.copy()
-                    thigh_ik.rotation_quaternion = thigh_fk.rotation_quaternion.copy()
-                    
-                    shin_ik.location = shin_fk.location.copy()
-                    shin_ik.rotation_quaternion = shin_fk.rotation_quaternion.copy()
-                    
-                    foot_ik.location = foot_fk.location.copy()
-                    foot_ik.rotation_quaternion = foot_fk.rotation_quaternion.copy()
-                    
-                    toe_ik.location = toe_fk.location.copy()
-                    toe_ik.rotation_quaternion = toe_fk.rotation_quaternion.copy()
-                    
-                    # 匹配极目标
-                    match_pole_target(
-                        context.view_layer,
-                        thigh_ik,
-                        shin_ik,
-                        pole_target,
-                        thigh_fk.matrix,
-                        1.0  # 长度
-                    )
-                    
-                    # 更新视图
-                    context.view_layer.update()
-            elif limb_type == 'HAND':
-                # 手部
-                hand_fk = rig.pose.bones.get("hand_fk")
-                hand_ik = rig.pose.bones.get("hand_ik")
-                
-                # 执行FK到IK的切换操作
-                if hand_fk and hand_ik:
-                    # 复制位置和旋转
-                    hand_ik.location = hand_fk.location.copy()
-                    hand_ik.rotation_quaternion = hand_fk.rotation_quaternion.copy()
-                    
-                    # 更新视图
-                    context.view_layer.update()
-        
-        # 报告结果
-        mode = "FK" if new_value == 1.0 else "IK"
-        self.report({'INFO'}, f"已切换 {limb_type} 到 {mode} 模式,骨骼已正确跟随")
+        start_time = time.perf_counter()
+        snapped, skipped = snap_ikfk_boundaries(context, boundaries)
+        elapsed = time.perf_counter() - start_time
         
+        if skipped:
+            self.report({'WARNING'}, f"{skipped} 处切换的骨骼链不完整,已跳过")
+        self.report({'INFO'}, f"{limbs} 个肢体在 {len(boundaries)} 个切换帧对齐了 {snapped} 处切换,"
+                              f"用时 {elapsed:.2f} 秒")
         return {'FINISHED'}
 
 class PIPELINE_OT_ExecuteInstruction(Operator):
@@ -673,29 +1180,255 @@ class PIPELINE_OT_ExecuteInstruction(Operator):
         default='ARM_IK_TO_FK'
     )
     
+    bake: BoolProperty(
+        name="烘焙帧范围",
+        default=False,
+        description="在IK/FK烘焙帧范围内逐帧执行指令,并为活动骨骼对象的所有骨骼插入关键帧"
+    )
+    
     def execute(self, context):
         # 获取指令
-        if self.instruction_type == 'ARM_IK_TO_FK':
-            instruction = context.scene.pipeline_arm_ik_to_fk_instruction
-        elif self.instruction_type == 'ARM_FK_TO_IK':
-            instruction = context.scene.pipeline_arm_fk_to_ik_instruction
-        elif self.instruction_type == 'LEG_IK_TO_FK':
-            instruction = context.scene.pipeline_leg_ik_to_fk_instruction
-        else:  # LEG_FK_TO_IK
-            instruction = context.scene.pipeline_leg_fk_to_ik_instruction
-        
-        # 执行指令
-        if instruction:
-            try:
-                exec(instruction)
-                self.report({'INFO'}, f"已执行指令: {instruction}")
-            except Exception as e:
-                self.report({'ERROR'}, f"执行指令失败: {str(e)}")
-        else:
+        prop = INSTRUCTION_PROPERTIES[self.instruction_type]
+        instruction = getattr(context.scene, prop)
+        if not instruction.strip():
             self.report({'WARNING'}, "指令为空")
+            return {'CANCELLED'}
+        
+        # 使用缓存的预编译指令,不再每次解析
+        try:
+            run = compile_instruction(prop, instruction)
+        except ValueError as e:
+            self.report({'ERROR'}, f"指令无效: {str(e)}")
+            return {'CANCELLED'}
+        
+        if self.bake:
+            return self.bake_instruction(context, run)
+        
+        try:
+            run()
+            self.report({'INFO'}, f"已执行指令: {instruction}")
+        except (RuntimeError, TypeError, AttributeError) as e:
+            self.report({'ERROR'}, f"执行指令失败: {str(e)}")
+            return {'CANCELLED'}
+        
+        return {'FINISHED'}
+    
+    def bake_instruction(self, context, run):
+        """使用IK/FK烘焙的帧范围,逐帧执行已编译的指令后记录骨骼姿态"""
+        rig = context.active_object
+        if context.mode != 'POSE' or rig is None or rig.type != 'ARMATURE':
+            self.report({'ERROR'}, "请在骨骼对象的姿态模式下烘焙指令")
+            return {'CANCELLED'}
+        
+        scene = context.scene
+        if scene.pipeline_ikfk_bake_use_scene_range:
+            frame_start, frame_end = scene.frame_start, scene.frame_end
+        else:
+            frame_start, frame_end = scene.pipeline_ikfk_bake_frame_start, scene.pipeline_ikfk_bake_frame_end
+        if frame_end < frame_start:
+            self.report({'ERROR'}, "结束帧不能小于起始帧")
+            return {'CANCELLED'}
         
+        start_time = time.perf_counter()
+        try:
+            curves, keys = keyframe_pose_bones(scene, {rig: list(rig.pose.bones)},
+                                               list(range(frame_start, frame_end + 1)), prepare=run)
+        except (RuntimeError, TypeError, AttributeError) as e:
+            self.report({'ERROR'}, f"执行指令失败: {str(e)}")
+            return {'CANCELLED'}
+        elapsed = time.perf_counter() - start_time
+        
+        self.report({'INFO'}, f"已逐帧执行指令并烘焙 {frame_end - frame_start + 1} 帧,{keys} 个关键帧,用时 {elapsed:.2f} 秒")
         return {'FINISHED'}
 
+# 生成的绑定上保存Metarig指纹的自定义属性
+RIGIFY_FINGERPRINT_KEY = "pipeline_metarig_fingerprint"
+
+def rna_values(owner):
+    """读取属性组中所有RNA属性的值,用于计算指纹"""
+    values = []
+    for prop in owner.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(owner, prop.identifier, None)
+        if prop.type == 'POINTER':
+            value = getattr(value, "name", None)
+        elif prop.type == 'COLLECTION':
+            value = len(value)
+        elif hasattr(value, "__len__") and not isinstance(value, str):
+            value = tuple(value)
+        values.append((prop.identifier, value))
+    return values
+
+def metarig_fingerprint(metarig):
+    """计算影响Rigify生成结果的Metarig指纹: 骨骼层级、静止矩阵、Rigify类型和参数"""
+    digest = hashlib.blake2b(digest_size=16)
+    armature = metarig.data
+    bones = armature.bones
+    
+    # 批量读取静止矩阵和长度
+    matrices = array.array('f', bytes(len(bones) * 16 * 4))
+    bones.foreach_get("matrix_local", matrices)
+    digest.update(matrices.tobytes())
+    lengths = array.array('f', bytes(len(bones) * 4))
+    bones.foreach_get("length", lengths)
+    digest.update(lengths.tobytes())
+    
+    for bone in bones:
+        pose_bone = metarig.pose.bones[bone.name]
+        digest.update(repr((
+            bone.name,
+            bone.parent.name if bone.parent else "",
+            bone.use_connect, bone.use_deform, bone.bbone_segments,
+            [collection.name for collection in bone.collections],
+            pose_bone.rigify_type if hasattr(pose_bone, "rigify_type") else "",
+            rna_values(pose_bone.rigify_parameters) if hasattr(pose_bone, "rigify_parameters") else (),
+        )).encode())
+    
+    # 骨骼集合和骨架上的Rigify设置
+    digest.update(repr([(collection.name, collection.get("rigify_ui_row"), collection.get("rigify_color_set_id"))
+                        for collection in armature.collections_all]).encode())
+    digest.update(repr([(prop.identifier, getattr(armature, prop.identifier, None))
+                        for prop in armature.bl_rna.properties
+                        if prop.identifier.startswith("rigify_") and prop.type not in {'POINTER', 'COLLECTION'}]).encode())
+    
+    # Rigify版本变化时也需要重新生成
+    rigify = sys.modules.get("rigify") or sys.modules.get("bl_ext.blender_org.rigify")
+    digest.update(repr(getattr(rigify, "bl_info", {}).get("version")).encode())
+    return digest.hexdigest()
+
+def is_metarig(obj):
+    """判断对象是否为Rigify Metarig(有骨骼设置了Rigify类型)"""
+    if obj.type != 'ARMATURE' or not obj.pose:
+        return False
+    return any(getattr(pose_bone, "rigify_type", "") for pose_bone in obj.pose.bones)
+
+def ensure_rigify_enabled():
+    """确保Rigify插件已启用(后台进程可能没有加载用户偏好设置)"""
+    if "rigify" not in bpy.context.preferences.addons:
+        bpy.ops.preferences.addon_enable(module="rigify")
+
+def generate_rigify_rig(context, metarig, force=False):
+    """生成Metarig对应的Rigify绑定,返回(绑定对象, 是否重新生成, 用时)
+
+    Metarig指纹与生成的绑定上记录的一致时跳过生成,force为True时总是重新生成。
+    """
+    fingerprint = metarig_fingerprint(metarig)
+    target = getattr(metarig.data, "rigify_target_rig", None)
+    if not force and target and target.get(RIGIFY_FINGERPRINT_KEY) == fingerprint:
+        return target, False, 0.0
+    
+    if metarig.name not in context.view_layer.objects:
+        raise RuntimeError(f"{metarig.name} 不在当前视图层中")
+    context.view_layer.objects.active = metarig
+    
+    start_time = time.perf_counter()
+    bpy.ops.pose.rigify_generate()
+    elapsed = time.perf_counter() - start_time
+    
+    # 在生成的绑定上记录Metarig指纹
+    target = getattr(metarig.data, "rigify_target_rig", None)
+    if target:
+        target[RIGIFY_FINGERPRINT_KEY] = fingerprint
+    return target, True, elapsed
+
+# 需要安装的扩展: (扩展ID, 仓库序号)
+EXTENSION_PACKAGES = (
+    ('camera_shakify', 0),
+    # ... 其他扩展 ...
+)
+
+# 指令类型对应的场景属性
+INSTRUCTION_PROPERTIES = {
+    'ARM_IK_TO_FK': "pipeline_arm_ik_to_fk_instruction",
+    'ARM_FK_TO_IK': "pipeline_arm_fk_to_ik_instruction",
+    'LEG_IK_TO_FK': "pipeline_leg_ik_to_fk_instruction",
+    'LEG_FK_TO_IK': "pipeline_leg_fk_to_ik_instruction",
+}
+
+# 指令允许调用的操作符前缀(bpy.ops.pose.rigify_*)
+INSTRUCTION_OPERATOR_PREFIX = "rigify_"
+
+# 已编译的预设指令: 属性名 -> (指令文本, 可调用对象或错误信息),每个预设只保留最近一次的指令
+_instruction_cache = {}
+
+def parse_instruction(instruction):
+    """解析指令文本,只接受参数为字面量的bpy.ops.pose.rigify_*调用,返回[(操作符名, 位置参数, 关键字参数)]"""
+    try:
+        tree = ast.parse(instruction.strip(), mode='exec')
+    except SyntaxError as e:
+        raise ValueError(f"语法错误: {e.msg}") from None
+    
+    calls = []
+    for statement in tree.body:
+        call = statement.value if isinstance(statement, ast.Expr) else None
+        if not isinstance(call, ast.Call):
+            raise ValueError("只允许操作符调用")
+        
+        # 检查调用目标为bpy.ops.pose.rigify_*
+        func = call.func
+        names = []
+        while isinstance(func, ast.Attribute):
+            names.insert(0, func.attr)
+            func = func.value
+        if not isinstance(func, ast.Name):
+            raise ValueError("只允许调用bpy.ops.pose.rigify_*操作符")
+        names.insert(0, func.id)
+        if len(names) != 4 or names[:3] != ["bpy", "ops", "pose"] or not names[3].startswith(INSTRUCTION_OPERATOR_PREFIX):
+            raise ValueError(f"不允许的调用: {'.'.join(names)}")
+        
+        # 参数必须是字面量
+        try:
+            args = tuple(ast.literal_eval(arg) for arg in call.args)
+            kwargs = {keyword.arg: ast.literal_eval(keyword.value) for keyword in call.keywords}
+        except ValueError:
+            raise ValueError(f"{names[3]} 的参数必须是字面量") from None
+        if None in kwargs:
+            raise ValueError("不支持**参数")
+        calls.append((names[3], args, kwargs))
+    
+    if not calls:
+        raise ValueError("指令为空")
+    return calls
+
+def compile_instruction(prop, instruction):
+    """将预设属性中的指令编译为可直接调用的函数,指令不变时只解析一次,无效时抛出ValueError
+    
+    返回的函数可以在烘焙等工具中逐帧重复调用
+    """
+    cached = _instruction_cache.get(prop)
+    if cached is None or cached[0] != instruction:
+        try:
+            calls = parse_instruction(instruction)
+        except ValueError as e:
+            cached = (instruction, str(e))
+        else:
+            def run():
+                for name, args, kwargs in calls:
+                    getattr(bpy.ops.pose, name)(*args, **kwargs)
+            cached = (instruction, run)
+        _instruction_cache[prop] = cached
+    
+    if isinstance(cached[1], str):
+        raise ValueError(cached[1])
+    return cached[1]
+
+def instruction_error(scene, prop):
+    """返回预设指令的错误信息,指令为空或有效时返回空字符串"""
+    instruction = getattr(scene, prop)
+    if not instruction.strip():
+        return ""
+    try:
+        compile_instruction(prop, instruction)
+    except ValueError as e:
+        return str(e)
+    return ""
+
+def precompile_instruction(self, context):
+    """指令属性修改后立即校验并编译,错误信息显示在面板的指令输入框下方"""
+    for prop in INSTRUCTION_PROPERTIES.values():
+        instruction_error(self, prop)
+
 # 辅助函数
 def perpendicular_vector(v):
     """返回一个垂直于给定向量的向量"""
@@ -717,8 +1450,36 @@ def rotation_difference(mat1, mat2):
     q2 = mat2.to_quaternion()
     return q1.rotation_difference(q2).angle
 
-def match_pole_target(view_layer, ik_first, ik_last, pole, match_bone_matrix, length):
-    """匹配极目标位置"""
+def solve_pole_location(head, joint, tail, length):
+    """根据骨骼链根部、关节和末端位置解析计算极目标位置"""
+    axis = tail - head
+    if axis.length_squared < 1e-12:
+        axis = joint - head
+
+    # 关节在根部-末端连线上的投影,关节偏离连线的方向即弯曲方向
+    bend = joint - head
+    if axis.length_squared > 1e-12:
+        bend -= axis * (bend.dot(axis) / axis.length_squared)
+
+    if bend.length < 1e-6:
+        # 骨骼链完全伸直时弯曲平面不确定,退回任意垂直方向
+        bend = perpendicular_vector(axis)
+
+    return head + (axis / 2) + bend.normalized() * length
+
+def match_pole_target(pole, fk_first, fk_second, length):
+    """根据FK骨骼链的姿态矩阵解析匹配极目标位置(不触发场景更新)"""
+    head = fk_first.matrix.to_translation()
+    joint = fk_second.matrix.to_translation()
+    tail = joint + fk_second.vector
+
+    # 只替换姿态空间中的位移,保留极目标原有的旋转和缩放
+    pole_matrix = pole.matrix.copy()
+    pole_matrix.translation = solve_pole_location(head, joint, tail, length)
+    pole.matrix = pole_matrix
+
+def match_pole_target_iterative(view_layer, ik_first, ik_last, pole, match_bone_matrix, length):
+    """通过多次场景更新试探匹配极目标位置(旧算法,保留用于对比)"""
     a = ik_first.matrix.to_translation()
     b = ik_last.matrix.to_translation() + ik_last.vector
     ikv = b - a
@@ -744,6 +1505,2188 @@ def match_pole_target(view_layer, ik_first, ik_last, pole, match_bone_matrix, le
     if ang1 < ang2:
         set_pole(pv1)
 
+# IK/FK肢体骨骼链定义: (IK骨骼, FK骨骼, 极目标骨骼, 属性骨骼)
+IKFK_LIMB_CHAINS = {
+    'ARM': (("upper_arm_ik", "forearm_ik", "hand_ik"),
+            ("upper_arm_fk", "forearm_fk", "hand_fk"),
+            "upper_arm_ik_target",
+            "upper_arm_parent"),
+    'LEG': (("thigh_ik", "shin_ik", "foot_ik", "toe_ik"),
+            ("thigh_fk", "shin_fk", "foot_fk", "toe_fk"),
+            "thigh_ik_target",
+            "thigh_parent"),
+    'HAND': (("hand_ik",), ("hand_fk",), None, "hand_ik"),  # 手部使用不同的属性骨骼
+}
+
+# 肢体索引缓存: 骨架数据指针 -> 肢体索引
+_limb_index_cache = {}
+
+def build_limb_index(armature):
+    """根据Rigify命名规则构建骨架的肢体索引"""
+    existing = armature.bones
+    limbs = {}
+    bones = {}
+    for part, (ik_names, fk_names, pole_name, parent_name) in IKFK_LIMB_CHAINS.items():
+        sides = ((None, ""),) if part == 'HAND' else (('L', ".L"), ('R', ".R"))
+        for side, suffix in sides:
+            limb_type = part if side is None else f"{part}_{side}"
+            limb = {
+                'side': side,
+                'ik': [name + suffix for name in ik_names],
+                'fk': [name + suffix for name in fk_names],
+                'pole': pole_name + suffix if pole_name else None,
+                'parent': parent_name + suffix,
+            }
+
+            # 骨骼 -> (肢体, 侧向, 角色),同名骨骼以先出现的角色为准
+            roles = [(name, 'IK') for name in limb['ik']]
+            roles += [(name, 'FK') for name in limb['fk']]
+            roles += [(limb['pole'], 'POLE'), (limb['parent'], 'PARENT')]
+            found = False
+            for name, role in roles:
+                if name and name in existing:
+                    bones.setdefault(name, (limb_type, side, role))
+                    found = True
+
+            if found:
+                limbs[limb_type] = limb
+
+    return {'limbs': limbs, 'bones': bones, 'bone_count': len(existing)}
+
+def get_limb_index(rig):
+    """获取骨骼对象的肢体索引,按骨架数据缓存"""
+    armature = rig.data
+    key = armature.as_pointer()
+    index = _limb_index_cache.get(key)
+    if index is None or index['bone_count'] != len(armature.bones):
+        index = build_limb_index(armature)
+        _limb_index_cache[key] = index
+    return index
+
+@persistent
+def clear_limb_index(*args):
+    """载入文件或撤销后数据指针不再可靠,清空肢体索引和IK_FK曲线缓存"""
+    _limb_index_cache.clear()
+    _ikfk_channel_cache.clear()
+
+@persistent
+def invalidate_limb_index(scene, depsgraph):
+    """骨架数据变化时使肢体索引缓存失效"""
+    if not _limb_index_cache:
+        return
+    for update in depsgraph.updates:
+        if isinstance(update.id, bpy.types.Armature):
+            _limb_index_cache.pop(update.id.original.as_pointer(), None)
+
+# 动作中IK_FK曲线的数据路径缓存: 动作指针 -> (F曲线数, 数据路径集合)
+_ikfk_channel_cache = {}
+
+def ikfk_channels(action):
+    """返回动作中IK_FK属性曲线的数据路径集合,F曲线数量不变时使用缓存"""
+    key = action.as_pointer()
+    cached = _ikfk_channel_cache.get(key)
+    if cached and cached[0] == len(action.fcurves):
+        return cached[1]
+    paths = {fcurve.data_path for fcurve in action.fcurves if fcurve.data_path.endswith('["IK_FK"]')}
+    _ikfk_channel_cache[key] = (len(action.fcurves), paths)
+    return paths
+
+def collect_ikfk_channels(scene):
+    """收集场景中每个骨骼对象的IK_FK曲线,返回[(骨骼对象, 数据路径集合)]"""
+    channels = []
+    for obj in scene.objects:
+        if obj.type != 'ARMATURE' or not obj.animation_data or not obj.animation_data.action:
+            continue
+        paths = ikfk_channels(obj.animation_data.action)
+        if paths:
+            channels.append((obj, paths))
+    return channels
+
+def find_animation_editor(context):
+    """查找已打开的摄影表或曲线编辑器区域,优先当前窗口,不使用时间线"""
+    windows = [context.window] + [window for window in context.window_manager.windows if window != context.window]
+    for window in windows:
+        if not window:
+            continue
+        for area in window.screen.areas:
+            if area.type == 'GRAPH_EDITOR' or (area.type == 'DOPESHEET_EDITOR' and area.ui_type != 'TIMELINE'):
+                return area
+    return None
+
+def get_limb_chain(rig, limb_type):
+    """获取肢体的IK骨骼链、FK骨骼链和极目标骨骼"""
+    limb = get_limb_index(rig)['limbs'][limb_type]
+    bones = rig.pose.bones
+    ik_bones = [bones.get(name) for name in limb['ik']]
+    fk_bones = [bones.get(name) for name in limb['fk']]
+    pole = bones.get(limb['pole']) if limb['pole'] else None
+    has_pole = limb['pole'] is not None
+    return ik_bones, fk_bones, pole, has_pole
+
+def limb_chain_complete(chain, to_fk):
+    """检查骨骼链是否完整(FK切换到IK时还需要极目标)"""
+    ik_bones, fk_bones, pole, has_pole = chain
+    if not all(ik_bones) or not all(fk_bones):
+        return False
+    if not to_fk and has_pole and pole is None:
+        return False
+    return True
+
+def snap_limb_chain(view_layer, chain, to_fk, update=True):
+    """将目标骨骼链对齐到源骨骼链"""
+    if not limb_chain_complete(chain, to_fk):
+        return False
+
+    ik_bones, fk_bones, pole, has_pole = chain
+    if to_fk:  # IK切换到FK
+        # 确保FK骨骼使用四元数旋转
+        for bone in fk_bones:
+            if bone.rotation_mode != 'QUATERNION':
+                bone.rotation_mode = 'QUATERNION'
+
+        # 复制位置和旋转
+        for ik_bone, fk_bone in zip(ik_bones, fk_bones):
+            fk_bone.location = ik_bone.location.copy()
+            fk_bone.rotation_quaternion = ik_bone.rotation_quaternion.copy()
+    else:  # FK切换到IK
+        # 复制位置和旋转
+        for ik_bone, fk_bone in zip(ik_bones, fk_bones):
+            ik_bone.location = fk_bone.location.copy()
+            ik_bone.rotation_quaternion = fk_bone.rotation_quaternion.copy()
+
+        # 匹配极目标
+        if pole:
+            match_pole_target(
+                pole,
+                fk_bones[0],
+                fk_bones[1],
+                1.0  # 长度
+            )
+
+    # 更新视图
+    if update:
+        view_layer.update()
+    return True
+
+def pose_bone_data_path(bone_name):
+    """返回姿态骨骼的F曲线数据路径,骨骼名中的引号和反斜杠需要转义"""
+    return f'pose.bones["{bpy.utils.escape_identifier(bone_name)}"]'
+
+# F曲线数据路径中的姿态骨骼名称(可能包含转义的引号和反斜杠)
+POSE_BONE_PATH_PATTERN = re.compile(r'pose\.bones\["((?:[^"\\]|\\.)*)"\]')
+
+def pose_bone_name_from_path(data_path):
+    """从F曲线数据路径中解析姿态骨骼名称"""
+    match = POSE_BONE_PATH_PATTERN.match(data_path)
+    if match is None:
+        return None
+    return bpy.utils.unescape_identifier(match.group(1))
+
+def collect_keyed_frames(rig, bone_names, frame_start, frame_end):
+    """收集指定骨骼在帧范围内的所有关键帧(已排序)"""
+    anim_data = rig.animation_data
+    if not anim_data or not anim_data.action:
+        return []
+
+    frames = set()
+    for fcurve in anim_data.action.fcurves:
+        if pose_bone_name_from_path(fcurve.data_path) not in bone_names:
+            continue
+        # 批量读取关键帧坐标
+        co = [0.0] * (len(fcurve.keyframe_points) * 2)
+        fcurve.keyframe_points.foreach_get("co", co)
+        for frame in co[0::2]:
+            frame = int(round(frame))
+            if frame_start <= frame <= frame_end:
+                frames.add(frame)
+    return sorted(frames)
+
+def write_fcurve_keys(action, data_path, index, frames, values, group_name=""):
+    """批量写入一条F曲线的关键帧,替换已有同帧关键帧"""
+    fcurve = action.fcurves.find(data_path, index=index)
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group_name)
+
+    points = fcurve.keyframe_points
+    count = len(points)
+    new_frames = set(frames)
+
+    # 批量读取已有关键帧,保留未被覆盖的部分
+    keys = {}
+    if count:
+        co = [0.0] * (count * 2)
+        handle_left = [0.0] * (count * 2)
+        handle_right = [0.0] * (count * 2)
+        interpolation = [0] * count
+        handle_left_type = [0] * count
+        handle_right_type = [0] * count
+        points.foreach_get("co", co)
+        points.foreach_get("handle_left", handle_left)
+        points.foreach_get("handle_right", handle_right)
+        points.foreach_get("interpolation", interpolation)
+        points.foreach_get("handle_left_type", handle_left_type)
+        points.foreach_get("handle_right_type", handle_right_type)
+        for i in range(count):
+            frame = co[i * 2]
+            if int(round(frame)) in new_frames:
+                continue
+            keys[frame] = (co[i * 2 + 1],
+                           handle_left[i * 2:i * 2 + 2], handle_right[i * 2:i * 2 + 2],
+                           interpolation[i], handle_left_type[i], handle_right_type[i])
+
+    # 新关键帧使用贝塞尔插值和自动钳制控制柄
+    keyframe_props = bpy.types.Keyframe.bl_rna.properties
+    bezier = keyframe_props['interpolation'].enum_items['BEZIER'].value
+    auto_clamped = keyframe_props['handle_left_type'].enum_items['AUTO_CLAMPED'].value
+    for frame, value in zip(frames, values):
+        keys[float(frame)] = (value, [frame, value], [frame, value],
+                              bezier, auto_clamped, auto_clamped)
+
+    # 按帧排序后一次性写回
+    ordered = sorted(keys.items())
+    flat_co, flat_left, flat_right = [], [], []
+    interp, left_type, right_type = [], [], []
+    for frame, (value, left, right, ipo, ltype, rtype) in ordered:
+        flat_co += (frame, value)
+        flat_left += left
+        flat_right += right
+        interp.append(ipo)
+        left_type.append(ltype)
+        right_type.append(rtype)
+
+    points.clear()
+    points.add(len(ordered))
+    points.foreach_set("co", flat_co)
+    points.foreach_set("handle_left", flat_left)
+    points.foreach_set("handle_right", flat_right)
+    points.foreach_set("interpolation", interp)
+    points.foreach_set("handle_left_type", left_type)
+    points.foreach_set("handle_right_type", right_type)
+    fcurve.update()
+    return fcurve
+
+# IK_FK属性值不小于该阈值时视为FK
+IKFK_FK_THRESHOLD = 0.5
+
+def ikfk_data_path(prop_bone_name):
+    """返回属性骨骼上IK_FK属性的F曲线数据路径"""
+    return f'{pose_bone_data_path(prop_bone_name)}["IK_FK"]'
+
+def ikfk_value(rig, prop_bone, frame):
+    """返回IK_FK在指定帧的值,有动画时按F曲线求值"""
+    action = rig.animation_data.action if rig.animation_data else None
+    fcurve = action.fcurves.find(ikfk_data_path(prop_bone.name)) if action else None
+    if fcurve and len(fcurve.keyframe_points):
+        return fcurve.evaluate(frame)
+    return prop_bone.get("IK_FK", 0.0)
+
+def build_ikfk_intervals(rig):
+    """读取骨骼对象所有肢体的IK_FK曲线,返回{肢体类型: [(起始帧, 结束帧, 'IK'或'FK')]}
+    
+    每段从切换到该状态的关键帧开始,到下一次切换的前一帧结束,最后一段结束于最后一个关键帧
+    """
+    action = rig.animation_data.action if rig.animation_data else None
+    if not action:
+        return {}
+    paths = ikfk_channels(action)
+    fcurves = {fcurve.data_path: fcurve for fcurve in action.fcurves if fcurve.data_path in paths}
+    
+    intervals = {}
+    for limb_type, limb in get_limb_index(rig)['limbs'].items():
+        fcurve = fcurves.get(ikfk_data_path(limb['parent']))
+        if not fcurve or not len(fcurve.keyframe_points):
+            continue
+        co = array.array('f', bytes(len(fcurve.keyframe_points) * 2 * 4))
+        fcurve.keyframe_points.foreach_get("co", co)
+        
+        spans = []
+        for frame, value in zip(co[0::2], co[1::2]):
+            frame = int(round(frame))
+            mode = 'FK' if value >= IKFK_FK_THRESHOLD else 'IK'
+            if spans and spans[-1][2] == mode:
+                spans[-1][1] = frame
+                continue
+            if spans:
+                spans[-1][1] = max(spans[-1][0], frame - 1)
+            spans.append([frame, frame, mode])
+        intervals[limb_type] = [tuple(span) for span in spans]
+    return intervals
+
+def snap_ikfk_boundaries(context, boundaries):
+    """在每个切换帧对齐切换后生效的骨骼链并立即插入关键帧,返回(对齐数, 跳过数)
+    
+    boundaries为{帧: [(骨骼对象, 肢体类型, 是否切换到FK)]},每个切换帧只求值一次;
+    按帧顺序处理并立即写入,后面的切换帧会在已写入的关键帧基础上求值
+    """
+    scene = context.scene
+    view_layer = context.view_layer
+    fcurve_maps = {}
+    snapped = skipped = 0
+    
+    original_frame = scene.frame_current
+    try:
+        for frame in sorted(boundaries):
+            scene.frame_set(frame)
+            for rig, limb_type, to_fk in boundaries[frame]:
+                chain = get_limb_chain(rig, limb_type)
+                if not snap_limb_chain(view_layer, chain, to_fk, update=False):
+                    skipped += 1
+                    continue
+                
+                action = rig.animation_data.action
+                if rig not in fcurve_maps:
+                    fcurve_maps[rig] = {(fcurve.data_path, fcurve.array_index): fcurve for fcurve in action.fcurves}
+                fcurve_map = fcurve_maps[rig]
+                
+                ik_bones, fk_bones, pole, has_pole = chain
+                channels = [(bone, "location", bone.location) for bone in (fk_bones if to_fk else ik_bones)]
+                channels += [(bone, "rotation_quaternion", bone.rotation_quaternion)
+                             for bone in (fk_bones if to_fk else ik_bones)]
+                if not to_fk and pole:
+                    channels.append((pole, "location", pole.location))
+                for bone, attribute, values in channels:
+                    data_path = f'{pose_bone_data_path(bone.name)}.{attribute}'
+                    for index, value in enumerate(values):
+                        insert_fcurve_keys(action, fcurve_map, data_path, index, [frame], [value], bone.name)
+                snapped += 1
+    finally:
+        scene.frame_set(original_frame)
+    
+    return snapped, skipped
+
+def collect_selected_limbs(selected_bones):
+    """按骨骼对象和肢体收集选中骨骼涉及的所有IK/FK肢体"""
+    limbs = []
+    missing = []
+    seen = set()
+    for bone in selected_bones:
+        rig = bone.id_data
+        limb_index = get_limb_index(rig)
+        entry = limb_index['bones'].get(bone.name)
+        if not entry or (rig.name, entry[0]) in seen:
+            continue
+        limb_type = entry[0]
+        seen.add((rig.name, limb_type))
+        
+        # 检查属性骨骼是否存在
+        prop_bone_name = limb_index['limbs'][limb_type]['parent']
+        prop_bone = rig.pose.bones.get(prop_bone_name)
+        if prop_bone is None:
+            missing.append(prop_bone_name)
+            continue
+        
+        limbs.append({
+            'rig': rig,
+            'limb_type': limb_type,
+            'prop_bone': prop_bone,
+            'chain': get_limb_chain(rig, limb_type),
+        })
+    return limbs, missing
+
+def format_limb_switches(limbs):
+    """生成切换结果的简要描述"""
+    if len(limbs) == 1:
+        limb = limbs[0]
+        return f"{limb['limb_type']} 到 {'FK' if limb['to_fk'] else 'IK'} 模式"
+    rigs = {limb['rig'].name for limb in limbs}
+    return f"{len(rigs)} 个角色的 {len(limbs)} 个肢体"
+
+def bake_limb_switches(context, jobs):
+    """逐帧对齐多个肢体骨骼链并按F曲线批量写入关键帧,返回求值的帧数"""
+    scene = context.scene
+    view_layer = context.view_layer
+    
+    for job in jobs:
+        # 需要记录的目标骨骼
+        ik_bones, fk_bones, pole, has_pole = job['chain']
+        job['targets'] = fk_bones if job['to_fk'] else ik_bones
+        if job['to_fk']:
+            for bone in fk_bones:
+                if bone.rotation_mode != 'QUATERNION':
+                    bone.rotation_mode = 'QUATERNION'
+        job['frame_set'] = set(job['frames'])
+        # 每条F曲线的采样值: (数据路径, 通道索引, 分组) -> 数值列表
+        job['samples'] = {}
+    
+    def record(samples, bone, prop_name, values):
+        data_path = f'{pose_bone_data_path(bone.name)}.{prop_name}'
+        for index, value in enumerate(values):
+            samples.setdefault((data_path, index, bone.name), []).append(value)
+    
+    frames = sorted(set().union(*(job['frame_set'] for job in jobs)))
+    original_frame = scene.frame_current
+    try:
+        for frame in frames:
+            # 每帧只求值一次,所有肢体共用
+            scene.frame_set(frame)
+            for job in jobs:
+                if frame not in job['frame_set']:
+                    continue
+                to_fk = job['to_fk']
+                job['prop_bone']["IK_FK"] = 1.0 if to_fk else 0.0
+                snap_limb_chain(view_layer, job['chain'], to_fk, update=False)
+                
+                for bone in job['targets']:
+                    record(job['samples'], bone, "location", bone.location)
+                    record(job['samples'], bone, "rotation_quaternion", bone.rotation_quaternion)
+                pole = job['chain'][2]
+                if not to_fk and pole:
+                    record(job['samples'], pole, "location", pole.location)
+        
+        # 循环结束后按F曲线批量写入关键帧
+        for job in jobs:
+            rig = job['rig']
+            anim_data = rig.animation_data_create()
+            if anim_data.action is None:
+                anim_data.action = bpy.data.actions.new(f"{rig.name}Action")
+            action = anim_data.action
+            
+            for (data_path, index, group_name), values in job['samples'].items():
+                write_fcurve_keys(action, data_path, index, job['frames'], values, group_name)
+            
+            # IK/FK属性在整个烘焙范围内保持切换后的值
+            prop_bone = job['prop_bone']
+            new_value = 1.0 if job['to_fk'] else 0.0
+            write_fcurve_keys(action, f'{pose_bone_data_path(prop_bone.name)}["IK_FK"]', 0,
+                              job['frames'], [new_value] * len(job['frames']), prop_bone.name)
+    finally:
+        # 恢复当前帧并按新关键帧重新求值
+        scene.frame_set(original_frame)
+    
+    return len(frames)
+
+# 角色关键帧跳过的骨骼前缀,与Blender内置的WholeCharacter和WholeCharacterSelected键集一致
+KEYFRAME_SKIP_PREFIXES = ("DEF", "GEO", "MCH", "ORG", "COR", "VIS", "WGT")
+
+# 姿态骨骼的变换属性及分量数
+POSE_TRANSFORM_SIZES = {
+    "location": 3,
+    "rotation_quaternion": 4,
+    "rotation_euler": 3,
+    "rotation_axis_angle": 4,
+    "scale": 3,
+}
+
+def pose_rotation_attribute(bone):
+    """返回骨骼旋转模式对应的旋转属性"""
+    if bone.rotation_mode == 'QUATERNION':
+        return "rotation_quaternion"
+    if bone.rotation_mode == 'AXIS_ANGLE':
+        return "rotation_axis_angle"
+    return "rotation_euler"
+
+def pose_keyframe_channels(bone):
+    """列出骨骼需要插入关键帧的变换通道[(属性, 分量)],跳过锁定的分量"""
+    channels = []
+    # 相连骨骼的位置由父骨骼决定
+    if not bone.bone.use_connect:
+        channels += [("location", i) for i in range(3) if not bone.lock_location[i]]
+    
+    rotation = pose_rotation_attribute(bone)
+    if rotation == "rotation_euler":
+        channels += [(rotation, i) for i in range(3) if not bone.lock_rotation[i]]
+    else:
+        if not (bone.lock_rotations_4d and bone.lock_rotation_w):
+            channels.append((rotation, 0))
+        channels += [(rotation, i + 1) for i in range(3) if not bone.lock_rotation[i]]
+    
+    channels += [("scale", i) for i in range(3) if not bone.lock_scale[i]]
+    return channels
+
+def pose_custom_properties(bone):
+    """返回骨骼上可以插入关键帧的数值自定义属性名称"""
+    return [key for key in bone.keys()
+            if not key.startswith("_") and isinstance(bone[key], (int, float)) and not isinstance(bone[key], bool)]
+
+def insert_fcurve_keys(action, fcurve_map, data_path, index, frames, values, group_name=""):
+    """向F曲线插入一组关键帧,返回F曲线
+    
+    空曲线直接批量写入所有关键帧,已有关键帧的曲线逐个快速插入,最后统一重算控制柄
+    """
+    fcurve = fcurve_map.get((data_path, index))
+    if fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group_name)
+        fcurve_map[(data_path, index)] = fcurve
+    
+    points = fcurve.keyframe_points
+    if len(points) == 0:
+        points.add(len(frames))
+        co = array.array('f', bytes(len(frames) * 2 * 4))
+        co[0::2] = array.array('f', frames)
+        co[1::2] = array.array('f', values)
+        points.foreach_set("co", co)
+    else:
+        for frame, value in zip(frames, values):
+            points.insert(frame, value, options={'FAST'})
+    fcurve.update()
+    return fcurve
+
+def keyframe_pose_bones(scene, rigs, frames=None, prepare=None):
+    """为骨骼插入变换和自定义属性关键帧,返回(曲线数, 关键帧数)
+    
+    每帧对每个变换属性只做一次foreach_get批量读取所有骨骼,循环结束后按F曲线批量写入;
+    与WholeCharacter和WholeCharacterSelected键集一样跳过KEYFRAME_SKIP_PREFIXES开头的骨骼;
+    frames为None时在当前帧插入当前姿态,prepare在每帧读取姿态前调用(如逐帧执行预设指令)
+    """
+    sample_frames = frames or [scene.frame_current]
+    
+    # 每个骨骼对象的变换通道(数据路径, 分量, 分组, 属性, 骨骼序号)和自定义属性通道(数据路径, 分组, 骨骼, 属性名)
+    transforms = {}
+    customs = {}
+    for rig, bones in rigs.items():
+        index_of = {bone.name: i for i, bone in enumerate(rig.pose.bones)}
+        transforms[rig], customs[rig] = [], []
+        for bone in bones:
+            if bone.name.startswith(KEYFRAME_SKIP_PREFIXES):
+                continue
+            base = pose_bone_data_path(bone.name)
+            for attribute, component in pose_keyframe_channels(bone):
+                transforms[rig].append((f"{base}.{attribute}", component, bone.name, attribute, index_of[bone.name]))
+            for key in pose_custom_properties(bone):
+                customs[rig].append((f'{base}["{bpy.utils.escape_identifier(key)}"]', bone.name, bone, key))
+    
+    # 逐帧批量读取所有骨骼的变换
+    samples = {rig: {attribute: [] for attribute in POSE_TRANSFORM_SIZES} for rig in rigs}
+    custom_samples = {rig: [] for rig in rigs}
+    original_frame = scene.frame_current
+    try:
+        for frame in sample_frames:
+            if frames:
+                scene.frame_set(frame)
+            if prepare:
+                prepare()
+            for rig in rigs:
+                bone_count = len(rig.pose.bones)
+                for attribute, size in POSE_TRANSFORM_SIZES.items():
+                    values = array.array('f', bytes(bone_count * size * 4))
+                    rig.pose.bones.foreach_get(attribute, values)
+                    samples[rig][attribute].append(values)
+                custom_samples[rig].append([float(bone[key]) for data_path, group, bone, key in customs[rig]])
+    finally:
+        if frames:
+            scene.frame_set(original_frame)
+    
+    # 按F曲线批量写入
+    curves = 0
+    for rig in rigs:
+        anim_data = rig.animation_data_create()
+        if anim_data.action is None:
+            anim_data.action = bpy.data.actions.new(f"{rig.name}Action")
+        action = anim_data.action
+        fcurve_map = {(fcurve.data_path, fcurve.array_index): fcurve for fcurve in action.fcurves}
+        
+        for data_path, component, group, attribute, bone_index in transforms[rig]:
+            offset = bone_index * POSE_TRANSFORM_SIZES[attribute] + component
+            values = [sample[offset] for sample in samples[rig][attribute]]
+            insert_fcurve_keys(action, fcurve_map, data_path, component, sample_frames, values, group)
+        for i, (data_path, group, bone, key) in enumerate(customs[rig]):
+            values = [sample[i] for sample in custom_samples[rig]]
+            insert_fcurve_keys(action, fcurve_map, data_path, 0, sample_frames, values, group)
+        curves += len(transforms[rig]) + len(customs[rig])
+    return curves, curves * len(sample_frames)
+
+def matrices_to_quaternions(matrices):
+    """将(..., 3, 3)旋转矩阵数组批量转换为(..., 4)四元数数组(w, x, y, z),w不小于0
+    
+    按Shepperd方法逐个矩阵选择迹和对角元素中最大的一项开方,其余分量由对称或反对称项相除得到,
+    旋转角接近180度时也能得到正确的轴向符号
+    """
+    m = matrices
+    m00, m11, m22 = m[..., 0, 0], m[..., 1, 1], m[..., 2, 2]
+    anti = (m[..., 2, 1] - m[..., 1, 2], m[..., 0, 2] - m[..., 2, 0], m[..., 1, 0] - m[..., 0, 1])
+    xy, xz, yz = m[..., 0, 1] + m[..., 1, 0], m[..., 0, 2] + m[..., 2, 0], m[..., 1, 2] + m[..., 2, 1]
+    
+    # 四种情况下的4倍四元数: 分别以w、x、y、z为开方项
+    diagonal = np.stack((m00 + m11 + m22, m00 - m11 - m22, m11 - m00 - m22, m22 - m00 - m11), axis=-1)
+    s = np.sqrt(np.maximum(1.0 + diagonal, 0.0)) * 2.0
+    candidates = np.stack((
+        np.stack((s[..., 0] * s[..., 0] / 4.0, anti[0], anti[1], anti[2]), axis=-1),
+        np.stack((anti[0], s[..., 1] * s[..., 1] / 4.0, xy, xz), axis=-1),
+        np.stack((anti[1], xy, s[..., 2] * s[..., 2] / 4.0, yz), axis=-1),
+        np.stack((anti[2], xz, yz, s[..., 3] * s[..., 3] / 4.0), axis=-1),
+    ), axis=-2)
+    case = np.argmax(diagonal, axis=-1)
+    quaternions = np.take_along_axis(candidates, case[..., None, None], axis=-2)[..., 0, :]
+    quaternions /= np.take_along_axis(s, case[..., None], axis=-1)
+    
+    quaternions *= np.where(quaternions[..., :1] < 0.0, -1.0, 1.0)
+    return quaternions / np.linalg.norm(quaternions, axis=-1, keepdims=True)
+
+def pose_matrices_to_basis(rig, matrices):
+    """将逐帧的(帧, 骨骼, 4, 4)姿态空间矩阵批量转换为骨骼的局部变换矩阵
+    
+    按完全继承父骨骼变换计算,不满足该条件的骨骼需要单独换算
+    """
+    bones = rig.data.bones
+    count = len(bones)
+    rest = np.empty(count * 16, dtype=np.float32)
+    bones.foreach_get("matrix_local", rest)
+    # foreach_get按列主序输出矩阵
+    rest = rest.reshape(count, 4, 4).transpose(0, 2, 1).astype(np.float64)
+    
+    # 按姿态骨骼顺序排列静止矩阵和父骨骼序号
+    bone_index = {bone.name: i for i, bone in enumerate(bones)}
+    pose_index = {bone.name: i for i, bone in enumerate(rig.pose.bones)}
+    order = [bone_index[bone.name] for bone in rig.pose.bones]
+    rest = rest[order]
+    parent = np.array([pose_index[bone.parent.name] if bone.parent else -1 for bone in rig.pose.bones])
+    has_parent = parent >= 0
+    
+    # 相对父骨骼的静止矩阵
+    rest_relative = rest.copy()
+    rest_relative[has_parent] = np.linalg.inv(rest[parent[has_parent]]) @ rest[has_parent]
+    
+    parent_pose = np.broadcast_to(np.identity(4), matrices.shape).copy()
+    parent_pose[:, has_parent] = matrices[:, parent[has_parent]]
+    return np.linalg.inv(rest_relative)[None] @ np.linalg.inv(parent_pose) @ matrices
+
+def rdp_keep_mask(frames, values, tolerance):
+    """用Ramer-Douglas-Peucker算法返回需要保留的关键帧掩码
+    
+    误差为采样值与保留关键帧之间线性插值的纵向距离,每次细分都用数组运算计算整段误差。
+    贝塞尔曲线与折线不同,结果需要再经过fit_fcurve_keys按实际求值校正
+    """
+    count = len(values)
+    keep = np.zeros(count, dtype=bool)
+    keep[0] = keep[-1] = True
+    # 变化幅度在容差内的曲线只保留首尾
+    if count < 3 or np.ptp(values) <= tolerance:
+        return keep
+    
+    stack = [(0, count - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        t = (frames[start + 1:end] - frames[start]) / (frames[end] - frames[start])
+        line = values[start] + (values[end] - values[start]) * t
+        errors = np.abs(values[start + 1:end] - line)
+        i = int(np.argmax(errors))
+        if errors[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack += [(start, split), (split, end)]
+    return keep
+
+def fit_fcurve_keys(frames, values, keep, tolerance, write):
+    """写入保留的关键帧并按F曲线的实际求值检查误差,返回(保留掩码, 最大误差)
+    
+    write(keep)写入关键帧并返回F曲线。控制柄重新计算后超出容差的区段补回误差最大的关键帧,直到全部在容差内
+    """
+    keep = keep.copy()
+    while True:
+        fcurve = write(keep)
+        errors = np.abs(np.array([fcurve.evaluate(frame) for frame in frames]) - values)
+        kept = np.flatnonzero(keep)
+        added = False
+        for start, end in zip(kept[:-1], kept[1:]):
+            if end - start < 2:
+                continue
+            i = start + 1 + int(np.argmax(errors[start + 1:end]))
+            if errors[i] > tolerance:
+                keep[i] = True
+                added = True
+        if not added:
+            return keep, float(errors.max())
+
+def write_baked_fcurve(action, fcurve_map, data_path, index, frames, values, group_name=""):
+    """写入烘焙结果,覆盖烘焙范围内的已有关键帧"""
+    fcurve = fcurve_map.get((data_path, index))
+    if fcurve is not None and len(fcurve.keyframe_points):
+        # 烘焙范围外还有关键帧时逐帧合并,否则直接整体替换
+        co = np.empty(len(fcurve.keyframe_points) * 2, dtype=np.float32)
+        fcurve.keyframe_points.foreach_get("co", co)
+        outside = (co[0::2] < frames[0] - 0.5) | (co[0::2] > frames[-1] + 0.5)
+        if outside.any():
+            write_fcurve_keys(action, data_path, index, frames.tolist(), values.tolist(), group_name)
+            # 删除烘焙范围内不在烘焙帧上的旧关键帧
+            baked = set(frames.astype(int).tolist())
+            points = fcurve.keyframe_points
+            for i in reversed(range(len(points))):
+                frame = points[i].co[0]
+                if frames[0] - 0.5 <= frame <= frames[-1] + 0.5 and int(round(frame)) not in baked:
+                    points.remove(points[i], fast=True)
+            fcurve.update()
+            return fcurve
+        fcurve.keyframe_points.clear()
+    elif fcurve is None:
+        fcurve = action.fcurves.new(data_path, index=index, action_group=group_name)
+        fcurve_map[(data_path, index)] = fcurve
+    
+    points = fcurve.keyframe_points
+    points.add(len(frames))
+    co = np.empty(len(frames) * 2, dtype=np.float32)
+    co[0::2] = frames
+    co[1::2] = values
+    points.foreach_set("co", co)
+    fcurve.update()
+    return fcurve
+
+def bake_pose_animation(context, bones, frames, tolerance=None):
+    """逐帧求值并批量读取姿态矩阵,循环结束后换算为局部变换并按F曲线写入,返回(曲线数, 关键帧数, 简化删除数)"""
+    scene = context.scene
+    frame_array = np.array(frames, dtype=np.float64)
+    
+    # 不完全继承父骨骼变换的骨骼按帧单独换算
+    special = {rig: [name for name in names
+                     if rig.pose.bones[name].bone.inherit_scale != 'FULL'
+                     or not rig.pose.bones[name].bone.use_inherit_rotation
+                     or not rig.pose.bones[name].bone.use_local_location]
+               for rig, names in bones.items()}
+    
+    matrices = {rig: np.empty((len(frames), len(rig.pose.bones) * 16), dtype=np.float32) for rig in bones}
+    special_basis = {rig: {name: [] for name in names} for rig, names in special.items()}
+    original_frame = scene.frame_current
+    try:
+        for i, frame in enumerate(frames):
+            # 每帧求值一次,每个骨骼对象一次批量读取
+            scene.frame_set(frame)
+            depsgraph = context.evaluated_depsgraph_get()
+            for rig in bones:
+                rig.evaluated_get(depsgraph).pose.bones.foreach_get("matrix", matrices[rig][i])
+                for name in special[rig]:
+                    bone = rig.pose.bones[name]
+                    special_basis[rig][name].append(
+                        rig.convert_space(pose_bone=bone, matrix=bone.matrix, from_space='POSE', to_space='LOCAL'))
+    finally:
+        scene.frame_set(original_frame)
+    
+    curves = keys = removed = 0
+    for rig, names in bones.items():
+        pose_bones = rig.pose.bones
+        pose_index = {bone.name: i for i, bone in enumerate(pose_bones)}
+        pose = matrices[rig].reshape(len(frames), len(pose_bones), 4, 4).transpose(0, 1, 3, 2).astype(np.float64)
+        basis = pose_matrices_to_basis(rig, pose)
+        for name, values in special_basis[rig].items():
+            basis[:, pose_index[name]] = np.array([[list(row) for row in matrix] for matrix in values])
+        
+        # 分解为位置、旋转和缩放
+        location = basis[..., :3, 3]
+        rotation = basis[..., :3, :3]
+        scale = np.linalg.norm(rotation, axis=-2)
+        scale[..., 0] *= np.sign(np.linalg.det(rotation))
+        rotation = rotation / scale[..., None, :]
+        quaternions = matrices_to_quaternions(rotation)
+        # 保持相邻帧四元数的连续性,避免插值时绕远路
+        dots = np.sum(quaternions[1:] * quaternions[:-1], axis=-1)
+        signs = np.cumprod(np.where(dots < 0.0, -1.0, 1.0), axis=0)
+        quaternions[1:] *= signs[..., None]
+        
+        anim_data = rig.animation_data_create()
+        if anim_data.action is None:
+            anim_data.action = bpy.data.actions.new(f"{rig.name}Action")
+        action = anim_data.action
+        fcurve_map = {(fcurve.data_path, fcurve.array_index): fcurve for fcurve in action.fcurves}
+        
+        for name in names:
+            bone = pose_bones[name]
+            i = pose_index[name]
+            rotation_attribute = pose_rotation_attribute(bone)
+            if rotation_attribute == "rotation_quaternion":
+                rotation_values = quaternions[:, i]
+            else:
+                # 欧拉角和轴角依赖旋转顺序和前一帧,逐帧换算
+                rotation_values, previous = [], None
+                for quaternion in quaternions[:, i]:
+                    quaternion = Quaternion(quaternion.tolist())
+                    if rotation_attribute == "rotation_euler":
+                        if previous is None:
+                            previous = quaternion.to_euler(bone.rotation_mode)
+                        else:
+                            previous = quaternion.to_euler(bone.rotation_mode, previous)
+                        rotation_values.append(tuple(previous))
+                    else:
+                        axis, angle = quaternion.to_axis_angle()
+                        rotation_values.append((angle, *axis))
+                rotation_values = np.array(rotation_values)
+            
+            base = pose_bone_data_path(name)
+            for attribute, channel_values in (("location", location[:, i]),
+                                              (rotation_attribute, rotation_values),
+                                              ("scale", scale[:, i])):
+                for index in range(channel_values.shape[1]):
+                    values = channel_values[:, index]
+                    data_path = f"{base}.{attribute}"
+                    
+                    def write(keep):
+                        return write_baked_fcurve(action, fcurve_map, data_path, index,
+                                                  frame_array[keep], values[keep], name)
+                    
+                    if tolerance is None:
+                        keep = np.ones(len(values), dtype=bool)
+                        write(keep)
+                    else:
+                        keep = fit_fcurve_keys(frame_array, values, rdp_keep_mask(frame_array, values, tolerance),
+                                               tolerance, write)[0]
+                    curves += 1
+                    keys += int(keep.sum())
+                    removed += len(keep) - int(keep.sum())
+    return curves, keys, removed
+
+def reduce_fcurve_keys(fcurve, tolerance):
+    """按容差精简一条F曲线的关键帧,返回(原关键帧数, 删除数, 最大误差)"""
+    points = fcurve.keyframe_points
+    count = len(points)
+    if count < 3:
+        return count, 0, 0.0
+    
+    co = np.empty(count * 2, dtype=np.float32)
+    points.foreach_get("co", co)
+    frames = co[0::2].astype(np.float64)
+    values = co[1::2].astype(np.float64)
+    keep = rdp_keep_mask(frames, values, tolerance)
+    removed = count - int(keep.sum())
+    if not removed:
+        return count, 0, 0.0
+    
+    # 读取全部关键帧属性,保留需要的部分后一次性写回
+    attributes = {}
+    for attribute, size, dtype in (("co", 2, np.float32), ("handle_left", 2, np.float32),
+                                   ("handle_right", 2, np.float32), ("interpolation", 1, np.int32),
+                                   ("handle_left_type", 1, np.int32), ("handle_right_type", 1, np.int32),
+                                   ("easing", 1, np.int32), ("type", 1, np.int32)):
+        data = np.empty(count * size, dtype=dtype)
+        points.foreach_get(attribute, data)
+        attributes[attribute] = data.reshape(count, size)
+    
+    def write(keep):
+        points.clear()
+        points.add(int(keep.sum()))
+        for attribute, data in attributes.items():
+            points.foreach_set(attribute, data[keep].ravel())
+        # 自动控制柄按新的相邻关键帧重新计算
+        fcurve.update()
+        return fcurve
+    
+    # 误差按重新计算控制柄后的实际曲线在原关键帧处求值
+    keep, error = fit_fcurve_keys(frames, values, keep, tolerance, write)
+    return count, count - int(keep.sum()), error
+
+def reduce_action_keys(action, tolerance, bone_names=None):
+    """精简动作中姿态骨骼F曲线的关键帧,返回(曲线数, 原关键帧数, 删除数, 最大误差)"""
+    curves = total = removed = 0
+    max_error = 0.0
+    for fcurve in action.fcurves:
+        if bone_names is not None and pose_bone_name_from_path(fcurve.data_path) not in bone_names:
+            continue
+        count, curve_removed, error = reduce_fcurve_keys(fcurve, tolerance)
+        curves += 1
+        total += count
+        removed += curve_removed
+        max_error = max(max_error, error)
+    return curves, total, removed, max_error
+
+# 预览提速预设: (覆盖的场景设置, 帧步长倍数)
+PLAYBLAST_SPEED_PRESETS = {
+    'FULL': ({}, 1),
+    'HALF': ({
+        "render.resolution_percentage": 50,
+        "display.render_aa": 'FXAA',
+    }, 1),
+    'DRAFT': ({
+        "render.resolution_percentage": 50,
+        "display.render_aa": 'OFF',
+        "display.shading.show_shadows": False,
+        "display.shading.show_cavity": False,
+        "display.shading.show_specular_highlight": False,
+        "render.use_simplify": True,
+        "render.simplify_subdivision": 0,
+        "render.simplify_child_particles": 0.0,
+        "render.simplify_volumes": 0.0,
+    }, 2),
+}
+
+# 预览动画会临时覆盖的场景设置(相对于场景的属性路径)
+PLAYBLAST_SCENE_SETTINGS = (
+    "render.engine",
+    "display.shading.color_type",
+    "render.image_settings.file_format",
+    "render.ffmpeg.format",
+    "render.ffmpeg.codec",
+    "render.ffmpeg.ffmpeg_preset",
+    "render.ffmpeg.constant_rate_factor",
+    "render.filepath",
+    "render.image_settings.color_mode",
+    "render.use_overwrite",
+    "render.use_placeholder",
+    "frame_step",
+    "render.fps_base",
+) + tuple(sorted({path for settings, step in PLAYBLAST_SPEED_PRESETS.values() for path in settings}))
+
+# 预览格式: (FFmpeg容器, 文件扩展名, 内置写入器编码, 外部ffmpeg编码器)
+PLAYBLAST_FORMATS = {
+    'QUICKTIME': ('QUICKTIME', ".mov", 'H264', "libx264"),
+    'MP4': ('MPEG4', ".mp4", 'H264', "libx264"),
+}
+
+# 预览质量: (CRF, FFmpeg预设)
+PLAYBLAST_QUALITIES = {
+    'LOW': ('LOW', 'REALTIME'),
+    'MEDIUM': ('MEDIUM', 'GOOD'),
+}
+
+# 外部ffmpeg编码的质量: (CRF, 编码预设),与内置写入器的质量档位对应
+PLAYBLAST_FFMPEG_QUALITIES = {
+    'LOW': ("26", "ultrafast"),
+    'MEDIUM': ("23", "medium"),
+}
+
+# 图像序列格式: (Blender文件格式, 文件扩展名)
+PLAYBLAST_SEQUENCE_FORMATS = {
+    'PNG': ('PNG', ".png"),
+    'JPEG': ('JPEG', ".jpg"),
+    'OPEN_EXR': ('OPEN_EXR', ".exr"),
+}
+
+# 正在进行的后台预览任务: 'job' -> start_blender_worker返回的任务字典
+_background_playblast = {}
+
+# 图像序列的编码阶段在线程池中运行,与下一次渲染重叠: 'executor' -> 首次编码时创建的线程池
+_playblast_encode_pool = {}
+_playblast_encodes = []
+
+def tag_redraw_sidebar(context):
+    """重绘3D视图侧边栏"""
+    for window in context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                for region in area.regions:
+                    if region.type == 'UI':
+                        region.tag_redraw()
+
+def resolve_attr_path(owner, path):
+    """解析点分隔的属性路径,返回(所属对象, 属性名)"""
+    *parents, attr = path.split(".")
+    for name in parents:
+        owner = getattr(owner, name)
+    return owner, attr
+
+def store_scene_settings(scene, paths):
+    """保存场景设置的原始值"""
+    saved = []
+    for path in paths:
+        owner, attr = resolve_attr_path(scene, path)
+        saved.append((path, getattr(owner, attr)))
+    return saved
+
+def restore_scene_settings(scene, saved):
+    """恢复保存的场景设置"""
+    for path, value in reversed(saved):
+        owner, attr = resolve_attr_path(scene, path)
+        setattr(owner, attr, value)
+
+def default_playblast_basepath(blend_filepath):
+    """返回默认的预览动画输出路径(不含扩展名)"""
+    if blend_filepath:
+        blend_dir = os.path.dirname(blend_filepath)
+        return os.path.join(blend_dir, "playblast")
+    return os.path.join(os.path.expanduser("~"), "playblast")
+
+def apply_playblast_settings(scene, basepath, quality, format, speed='FULL'):
+    """应用预览动画的渲染设置,返回带扩展名的输出路径"""
+    # 设置渲染引擎
+    scene.render.engine = 'BLENDER_WORKBENCH'
+    scene.display.shading.color_type = 'RANDOM'
+    
+    # 设置输出格式并添加文件扩展名
+    container, extension, codec, encoder = PLAYBLAST_FORMATS[format]
+    scene.render.image_settings.file_format = 'FFMPEG'
+    scene.render.ffmpeg.format = container
+    scene.render.ffmpeg.codec = codec
+    filepath = basepath + extension
+    scene.render.filepath = filepath
+    
+    # 根据质量设置
+    crf, preset = PLAYBLAST_QUALITIES[quality]
+    scene.render.ffmpeg.constant_rate_factor = crf
+    scene.render.ffmpeg.ffmpeg_preset = preset
+    
+    # 应用提速预设
+    settings, step_factor = PLAYBLAST_SPEED_PRESETS[speed]
+    for path, value in settings.items():
+        owner, attr = resolve_attr_path(scene, path)
+        setattr(owner, attr, value)
+    if step_factor > 1:
+        # 跳帧渲染时同比放慢帧率,保持视频时长不变
+        scene.frame_step *= step_factor
+        scene.render.fps_base *= step_factor
+    
+    # 确保输出目录存在
+    output_dir = os.path.dirname(filepath)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    return filepath
+
+# 增量预览缓存索引的版本号,格式变化时使旧缓存失效
+PLAYBLAST_CACHE_VERSION = 1
+
+# 增量预览渲染帧序列时额外覆盖的场景设置
+PLAYBLAST_CACHE_SETTINGS = (
+    "frame_start",
+    "frame_end",
+    "frame_step",
+    "frame_current",
+    "render.image_settings.file_format",
+    "render.image_settings.color_mode",
+    "render.filepath",
+)
+
+def playblast_cache_dir(filepath):
+    """返回预览动画的帧缓存目录"""
+    return os.path.splitext(filepath)[0] + "_cache"
+
+def hash_floats(digest, values):
+    """将一组浮点数写入哈希"""
+    digest.update(array.array('f', values).tobytes())
+
+def frame_settings_hash(scene):
+    """计算影响每帧画面的渲染设置哈希,设置变化时全部帧需要重新渲染"""
+    render = scene.render
+    shading = scene.display.shading
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((
+        PLAYBLAST_CACHE_VERSION,
+        render.resolution_x, render.resolution_y, render.resolution_percentage,
+        render.pixel_aspect_x, render.pixel_aspect_y,
+        shading.light, shading.color_type, shading.studio_light,
+        shading.show_shadows, shading.show_cavity, shading.show_specular_highlight,
+        scene.display.render_aa, render.use_simplify, render.simplify_subdivision,
+        scene.camera.name if scene.camera else "",
+        scene.view_settings.view_transform, scene.view_settings.look,
+    )).encode())
+    return digest.hexdigest()
+
+def frame_state_hash(scene):
+    """计算当前帧求值后的物体、骨骼姿态和摄像机状态哈希"""
+    digest = hashlib.blake2b(digest_size=16)
+    for obj in scene.objects:
+        if not obj.visible_get():
+            continue
+        digest.update(obj.name.encode())
+        hash_floats(digest, [value for row in obj.matrix_world for value in row])
+        
+        if obj.type == 'ARMATURE' and obj.pose:
+            # 批量读取所有骨骼的姿态矩阵
+            matrices = array.array('f', bytes(len(obj.pose.bones) * 16 * 4))
+            obj.pose.bones.foreach_get("matrix", matrices)
+            digest.update(matrices.tobytes())
+        elif obj.type == 'CAMERA':
+            camera = obj.data
+            hash_floats(digest, (camera.lens, camera.ortho_scale, camera.shift_x,
+                                 camera.shift_y, camera.sensor_width, camera.sensor_height))
+    return digest.hexdigest()
+
+def hash_action(digest, action):
+    """将动作中所有F曲线的关键帧和控制柄写入哈希"""
+    digest.update(action.name.encode())
+    for fcurve in action.fcurves:
+        digest.update(f"{fcurve.data_path}[{fcurve.array_index}]{fcurve.mute}".encode())
+        count = len(fcurve.keyframe_points) * 2
+        for attribute in ("co", "handle_left", "handle_right"):
+            values = array.array('f', bytes(count * 4))
+            fcurve.keyframe_points.foreach_get(attribute, values)
+            digest.update(values.tobytes())
+        interpolation = array.array('i', bytes(len(fcurve.keyframe_points) * 4))
+        fcurve.keyframe_points.foreach_get("interpolation", interpolation)
+        digest.update(interpolation.tobytes())
+        digest.update(repr([(modifier.type, modifier.mute) for modifier in fcurve.modifiers]).encode())
+
+def animated_channels(owner):
+    """返回由F曲线(含NLA片段)或驱动器控制的(数据路径, 分量)集合,这些通道的当前值随帧变化"""
+    animation = getattr(owner, "animation_data", None)
+    if not animation:
+        return set()
+    fcurves = list(animation.drivers)
+    if animation.action:
+        fcurves += animation.action.fcurves
+    for track in animation.nla_tracks:
+        for strip in track.strips:
+            if strip.action:
+                fcurves += strip.action.fcurves
+    return {(fcurve.data_path, fcurve.array_index) for fcurve in fcurves}
+
+def static_transform_values(owner, base, animated):
+    """返回物体或姿态骨骼的变换通道值,受动画控制的通道记为0
+    
+    动画通道的当前值取决于当前帧,其曲线已经计入动作的哈希
+    """
+    values = []
+    for attribute, size in POSE_TRANSFORM_SIZES.items():
+        path = f"{base}.{attribute}" if base else attribute
+        current = getattr(owner, attribute)
+        values += [0.0 if (path, i) in animated else current[i] for i in range(size)]
+    return values
+
+def scene_content_fingerprint(scene):
+    """计算影响预览结果的场景内容指纹: 动画曲线、静态变换、摄像机、帧范围和预览覆盖的渲染设置"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(frame_settings_hash(scene).encode())
+    digest.update(repr([getattr(*resolve_attr_path(scene, path)) for path in PLAYBLAST_SCENE_SETTINGS
+                        if path != "render.filepath"]).encode())
+    digest.update(repr((scene.frame_start, scene.frame_end, scene.frame_step,
+                        scene.render.fps, scene.render.fps_base)).encode())
+    
+    hashed_actions = set()
+    def hash_animation(owner):
+        animation = getattr(owner, "animation_data", None)
+        if not animation:
+            return
+        # 同一个动作被多个物体共用时只计算一次
+        if animation.action and animation.action.name not in hashed_actions:
+            hashed_actions.add(animation.action.name)
+            hash_action(digest, animation.action)
+        digest.update(repr([(driver.data_path, driver.array_index, driver.driver.expression)
+                            for driver in animation.drivers]).encode())
+    
+    for obj in sorted(scene.objects, key=lambda obj: obj.name):
+        digest.update(f"{obj.name}:{obj.type}:{obj.hide_render}:{obj.parent.name if obj.parent else ''}".encode())
+        # 只计未设动画的变换通道,拖动时间线或在其他帧保存文件不改变指纹
+        animated = animated_channels(obj)
+        digest.update(obj.rotation_mode.encode())
+        hash_floats(digest, static_transform_values(obj, "", animated))
+        hash_animation(obj)
+        if obj.data:
+            hash_animation(obj.data)
+        
+        if obj.type == 'ARMATURE' and obj.pose:
+            # 未设关键帧的静态姿态也会影响画面
+            for bone in obj.pose.bones:
+                digest.update(bone.rotation_mode.encode())
+                hash_floats(digest, static_transform_values(bone, pose_bone_data_path(bone.name), animated))
+        elif obj.type == 'MESH':
+            digest.update(repr((len(obj.data.vertices), len(obj.data.polygons))).encode())
+            if obj.data.shape_keys:
+                hash_animation(obj.data.shape_keys)
+        elif obj.type == 'CAMERA':
+            camera = obj.data
+            hash_floats(digest, (camera.lens, camera.ortho_scale, camera.shift_x,
+                                 camera.shift_y, camera.sensor_width, camera.sensor_height))
+    return digest.hexdigest()
+
+def playblast_fingerprint_path(filepath):
+    """返回预览输出旁保存场景指纹的文件路径"""
+    return os.path.splitext(filepath)[0] + "_fingerprint.json"
+
+def playblast_unchanged(filepath, fingerprint):
+    """输出文件存在且保存的指纹与当前场景一致时返回True"""
+    filepath = bpy.path.abspath(filepath)
+    if not os.path.isfile(filepath):
+        return False
+    try:
+        with open(playblast_fingerprint_path(filepath), encoding="utf-8") as f:
+            return json.load(f).get('fingerprint') == fingerprint
+    except (OSError, ValueError):
+        return False
+
+def save_playblast_fingerprint(filepath, fingerprint):
+    """在预览输出旁保存场景指纹"""
+    filepath = bpy.path.abspath(filepath)
+    with open(playblast_fingerprint_path(filepath), "w", encoding="utf-8") as f:
+        json.dump({
+            'fingerprint': fingerprint,
+            'output': os.path.basename(filepath),
+            'created': datetime.datetime.now().isoformat(timespec="seconds"),
+        }, f, indent=1)
+
+def load_playblast_cache_index(cache_dir, settings_hash):
+    """读取帧缓存索引,渲染设置变化时返回空索引"""
+    index_path = os.path.join(cache_dir, "index.json")
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if index.get('settings') != settings_hash:
+        index = {'settings': settings_hash, 'frames': {}}
+    return index
+
+def save_playblast_cache_index(cache_dir, index):
+    """写入帧缓存索引"""
+    with open(os.path.join(cache_dir, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+
+def contiguous_runs(frames, step):
+    """将排好序的帧号按步长拆分为连续区间"""
+    runs = []
+    for frame in frames:
+        if runs and frame - runs[-1][1] == step:
+            runs[-1][1] = frame
+        else:
+            runs.append([frame, frame])
+    return runs
+
+def render_playblast_incremental(scene, filepath, quality, format, use_viewport=False):
+    """只重新渲染状态变化的帧到缓存序列,再从缓存帧编码视频,返回(重新渲染帧数, 总帧数)"""
+    cache_dir = playblast_cache_dir(filepath)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+    
+    saved_settings = store_scene_settings(scene, PLAYBLAST_CACHE_SETTINGS)
+    try:
+        # 缓存帧使用无损PNG
+        scene.render.image_settings.file_format = 'PNG'
+        scene.render.image_settings.color_mode = 'RGB'
+        scene.render.filepath = os.path.join(cache_dir, "frame_")
+        
+        index = load_playblast_cache_index(cache_dir, frame_settings_hash(scene))
+        frames = list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
+        
+        # 逐帧求值并比较状态哈希,找出需要重新渲染的帧
+        dirty = []
+        hashes = {}
+        for frame in frames:
+            scene.frame_set(frame)
+            hashes[frame] = frame_state_hash(scene)
+            if (index['frames'].get(str(frame)) != hashes[frame]
+                    or not os.path.exists(scene.render.frame_path(frame=frame))):
+                dirty.append(frame)
+        
+        # 按连续区间渲染脏帧
+        for run_start, run_end in contiguous_runs(dirty, scene.frame_step):
+            scene.frame_start = run_start
+            scene.frame_end = run_end
+            bpy.ops.render.render(animation=True, use_viewport=use_viewport, scene=scene.name)
+            for frame in range(run_start, run_end + 1, scene.frame_step):
+                index['frames'][str(frame)] = hashes[frame]
+            save_playblast_cache_index(cache_dir, index)
+        
+        frame_paths = [scene.render.frame_path(frame=frame) for frame in frames]
+    finally:
+        restore_scene_settings(scene, saved_settings)
+        scene.frame_set(scene.frame_current)
+    
+    # 从缓存帧编码最终视频
+    if frame_paths:
+        encode_image_sequence(scene, frame_paths, filepath, quality, format)
+    return len(dirty), len(frames)
+
+# 预览版本库的目录名和索引版本号
+PLAYBLAST_STORE_DIRNAME = "playblast_store"
+PLAYBLAST_STORE_VERSION = 1
+
+# 播放历史版本时额外覆盖的场景设置
+PLAYBLAST_PLAYBACK_SETTINGS = PLAYBLAST_SCENE_SETTINGS + ("frame_start", "frame_end")
+
+# 已读取的版本库索引: 索引路径 -> (修改时间, 索引),避免面板重绘时反复解析
+_playblast_store_cache = {}
+
+def playblast_store_dir(basepath):
+    """返回预览输出路径对应的版本库目录"""
+    return os.path.join(os.path.dirname(bpy.path.abspath(basepath)), PLAYBLAST_STORE_DIRNAME)
+
+def playblast_shot_name(blend_filepath, scene):
+    """用.blend文件名和场景名生成镜头名称"""
+    stem = os.path.splitext(os.path.basename(blend_filepath))[0] if blend_filepath else "untitled"
+    return bpy.path.clean_name(f"{stem}_{scene.name}")
+
+def file_stamp(filepath):
+    """返回文件的(大小, 修改时间),用于标识预览的源文件,文件不存在时返回(0, 0.0)
+    
+    只读取文件状态,不读取内容,几百MB的.blend文件也不会拖慢每次预览
+    """
+    try:
+        stat = os.stat(filepath)
+    except (OSError, ValueError):
+        return 0, 0.0
+    return stat.st_size, stat.st_mtime
+
+def load_playblast_store(store_dir):
+    """读取版本库索引,索引未变化时直接返回缓存"""
+    index_path = os.path.join(store_dir, "index.json")
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        return {'version': PLAYBLAST_STORE_VERSION, 'shots': {}}
+    
+    cached = _playblast_store_cache.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if index.get('version') != PLAYBLAST_STORE_VERSION:
+        index = {'version': PLAYBLAST_STORE_VERSION, 'shots': {}}
+    _playblast_store_cache[index_path] = (mtime, index)
+    return index
+
+def save_playblast_store(store_dir, index):
+    """写入版本库索引"""
+    index_path = os.path.join(store_dir, "index.json")
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, indent=1)
+    os.replace(temp_path, index_path)
+    _playblast_store_cache.pop(index_path, None)
+
+def evict_playblast_versions(store_dir, index, budget_mb, keep=()):
+    """按最近最少使用的顺序删除旧版本,直到总大小不超过预算,返回删除的文件"""
+    entries = []
+    for shot, versions in index['shots'].items():
+        # 丢弃文件已被手动删除的记录
+        versions[:] = [entry for entry in versions if os.path.isfile(os.path.join(store_dir, entry['file']))]
+        entries.extend((shot, entry) for entry in versions)
+    
+    evicted = []
+    total = sum(entry['size'] for shot, entry in entries)
+    if budget_mb <= 0:
+        return evicted
+    for shot, entry in sorted(entries, key=lambda item: item[1]['last_used']):
+        if total <= budget_mb * 1024 * 1024:
+            break
+        if entry['file'] in keep:
+            continue
+        try:
+            os.remove(os.path.join(store_dir, entry['file']))
+        except OSError:
+            continue
+        index['shots'][shot].remove(entry)
+        total -= entry['size']
+        evicted.append(entry['file'])
+    
+    index['shots'] = {shot: versions for shot, versions in index['shots'].items() if versions}
+    return evicted
+
+def store_playblast_version(filepath, scene, blend_filepath, budget_mb, basepath=None):
+    """将预览输出复制到版本库并登记,返回(版本文件路径, 被淘汰的文件数)"""
+    filepath = bpy.path.abspath(filepath)
+    store_dir = playblast_store_dir(basepath or filepath)
+    shot = playblast_shot_name(blend_filepath, scene)
+    shot_dir = os.path.join(store_dir, shot)
+    if not os.path.exists(shot_dir):
+        os.makedirs(shot_dir)
+    
+    # 以时间戳命名版本,同一秒内重复输出时追加序号
+    stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    extension = os.path.splitext(filepath)[1]
+    name = f"{shot}_{stamp}{extension}"
+    counter = 1
+    while os.path.exists(os.path.join(shot_dir, name)):
+        counter += 1
+        name = f"{shot}_{stamp}_{counter}{extension}"
+    version_path = os.path.join(shot_dir, name)
+    shutil.copy2(filepath, version_path)
+    
+    now = time.time()
+    blend_size, blend_mtime = file_stamp(bpy.path.abspath(blend_filepath))
+    entry = {
+        'file': os.path.join(shot, name).replace(os.sep, "/"),
+        'created': now,
+        'last_used': now,
+        'frame_start': scene.frame_start,
+        'frame_end': scene.frame_end,
+        'frame_step': scene.frame_step,
+        'fps': scene.render.fps / scene.render.fps_base,
+        'size': os.path.getsize(version_path),
+        'blend_size': blend_size,
+        'blend_mtime': blend_mtime,
+    }
+    
+    index = load_playblast_store(store_dir)
+    index['shots'].setdefault(shot, []).append(entry)
+    evicted = evict_playblast_versions(store_dir, index, budget_mb, keep=(entry['file'],))
+    save_playblast_store(store_dir, index)
+    return version_path, len(evicted)
+
+def find_playblast_version(filepath):
+    """在版本库索引中查找版本文件,返回(版本库目录, 索引, 镜头, 记录)"""
+    filepath = os.path.abspath(filepath)
+    store_dir = os.path.dirname(os.path.dirname(filepath))
+    index = load_playblast_store(store_dir)
+    relpath = os.path.relpath(filepath, store_dir).replace(os.sep, "/")
+    for shot, versions in index['shots'].items():
+        for entry in versions:
+            if entry['file'] == relpath:
+                return store_dir, index, shot, entry
+    return store_dir, index, None, None
+
+def play_playblast_file(scene, filepath, entry=None):
+    """临时套用预览设置,用Blender的播放器播放指定的预览文件"""
+    format = next((key for key, (container, extension, codec, encoder) in PLAYBLAST_FORMATS.items()
+                   if filepath.lower().endswith(extension)), 'QUICKTIME')
+    saved_settings = store_scene_settings(scene, PLAYBLAST_PLAYBACK_SETTINGS)
+    try:
+        apply_playblast_settings(scene, os.path.splitext(filepath)[0], 'MEDIUM', format)
+        if entry:
+            scene.frame_start = entry['frame_start']
+            scene.frame_end = entry['frame_end']
+            scene.frame_step = entry['frame_step']
+        bpy.ops.render.play_rendered_anim()
+    finally:
+        restore_scene_settings(scene, saved_settings)
+
+# 预览性能分析记录的回调事件(按每帧的发生顺序)
+PLAYBLAST_PROFILE_EVENTS = (
+    "render_pre",
+    "frame_change_pre",
+    "frame_change_post",
+    "render_post",
+)
+
+# 正在进行的性能分析: 开始时间、已安装的回调和每帧的事件时间戳
+_playblast_profile = {}
+
+def start_playblast_profile():
+    """安装帧变化和渲染回调,开始记录每帧的事件时间戳"""
+    stop_playblast_profile()
+    _playblast_profile.update({'start': time.perf_counter(), 'frames': {}, 'handlers': []})
+    
+    for event in PLAYBLAST_PROFILE_EVENTS:
+        def handler(scene, *args, event=event):
+            stamps = _playblast_profile['frames'].setdefault((scene.name, scene.frame_current), {})
+            stamps.setdefault(event, time.perf_counter())
+        getattr(bpy.app.handlers, event).append(handler)
+        _playblast_profile['handlers'].append((event, handler))
+
+def stop_playblast_profile(filepath=None):
+    """移除回调并整理每帧耗时,返回(逐帧记录, 汇总)"""
+    for event, handler in _playblast_profile.get('handlers', ()):
+        handlers = getattr(bpy.app.handlers, event)
+        if handler in handlers:
+            handlers.remove(handler)
+    if 'start' not in _playblast_profile:
+        return [], {}
+    
+    start = _playblast_profile['start']
+    frames = _playblast_profile['frames']
+    elapsed = time.perf_counter() - start
+    _playblast_profile.clear()
+    
+    def span(stamps, begin, end):
+        if begin in stamps and end in stamps:
+            return round((stamps[end] - stamps[begin]) * 1000.0, 3)
+        return None
+    
+    # 按事件发生的先后整理每帧各阶段耗时(毫秒)
+    # 动画渲染在render_post之前就已写出图像或视频帧,render_write紧接着render_post触发,
+    # 无法单独区分编码时间,绘制和写出合计为render_ms
+    rows = []
+    previous_end = start
+    for (scene_name, frame), stamps in sorted(frames.items(), key=lambda item: min(item[1].values())):
+        evaluate_ms = span(stamps, "frame_change_pre", "frame_change_post")
+        render_ms = span(stamps, "render_pre", "render_post")
+        frame_end = max(stamps.values())
+        rows.append({
+            'scene': scene_name,
+            'frame': frame,
+            'evaluate_ms': evaluate_ms,
+            'render_ms': round(render_ms - evaluate_ms, 3) if render_ms is not None and evaluate_ms is not None else render_ms,
+            'frame_ms': round((frame_end - previous_end) * 1000.0, 3),
+        })
+        previous_end = frame_end
+    
+    def mean(key):
+        values = [row[key] for row in rows if row[key] is not None]
+        return round(sum(values) / len(values), 3) if values else None
+    
+    def peak(key):
+        values = [row[key] for row in rows if row[key] is not None]
+        return max(values) if values else None
+    
+    output_size = os.path.getsize(filepath) if filepath and os.path.isfile(filepath) else 0
+    summary = {
+        'output': filepath or "",
+        'frames': len(rows),
+        'total_seconds': round(elapsed, 3),
+        'frames_per_second': round(len(rows) / elapsed, 2) if elapsed else None,
+        'evaluate_ms_mean': mean('evaluate_ms'),
+        'evaluate_ms_max': peak('evaluate_ms'),
+        'render_ms_mean': mean('render_ms'),
+        'render_ms_max': peak('render_ms'),
+        'output_bytes': output_size,
+    }
+    return rows, summary
+
+def playblast_profile_basepath(filepath):
+    """返回预览输出文件对应的性能报告路径(不含扩展名)
+    
+    输出图像序列时也按最终视频路径计算,前台、后台进程和读取报告的一方得到同一路径
+    """
+    return os.path.splitext(filepath)[0] + "_profile"
+
+def write_playblast_profile(filepath, rows, summary):
+    """在输出文件旁写入逐帧CSV和汇总JSON,返回JSON路径"""
+    basepath = playblast_profile_basepath(filepath)
+    output_dir = os.path.dirname(basepath)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    fields = ('scene', 'frame', 'evaluate_ms', 'render_ms', 'frame_ms')
+    with open(basepath + ".csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(basepath + ".json", "w", encoding="utf-8") as f:
+        json.dump({'summary': summary, 'frames': rows}, f, ensure_ascii=False, indent=2)
+    return basepath + ".json"
+
+def format_playblast_profile(summary):
+    """生成面板中显示的性能分析摘要"""
+    if not summary:
+        return ""
+    def ms(value):
+        return "-" if value is None else f"{value:.1f}"
+    return (f"{summary['frames']}帧 {summary['frames_per_second'] or 0:.1f}fps | "
+            f"求值 {ms(summary['evaluate_ms_mean'])}ms 绘制和写出 {ms(summary['render_ms_mean'])}ms")
+
+def save_temp_copy():
+    """将当前文件另存一份副本到临时目录,返回(临时目录, 副本路径)"""
+    temp_dir = tempfile.mkdtemp(prefix="pipeline_playblast_")
+    source = os.path.join(temp_dir, "playblast_source.blend")
+    bpy.ops.wm.save_as_mainfile(filepath=source, copy=True, check_existing=False)
+    return temp_dir, source
+
+def split_frame_range(frame_start, frame_end, frame_step, chunks, min_chunk_frames=10):
+    """将帧范围按步长拆分为若干连续分段,返回[(起始帧, 结束帧)]"""
+    frames = list(range(frame_start, frame_end + 1, frame_step))
+    if not frames:
+        return []
+    # 每个进程都要载入文件,分段太短时并行得不偿失
+    chunks = max(1, min(chunks, math.ceil(len(frames) / min_chunk_frames)))
+    size = math.ceil(len(frames) / chunks)
+    return [(frames[i], frames[min(i + size, len(frames)) - 1]) for i in range(0, len(frames), size)]
+
+def concat_movie_segments(segments, filepath, ffmpeg):
+    """用ffmpeg流复制拼接视频分段,不重新编码"""
+    list_path = os.path.join(os.path.dirname(segments[0]), "segments.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for segment in segments:
+            path = segment.replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{path}'\n")
+    subprocess.run([ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                    "-i", list_path, "-c", "copy", filepath],
+                   check=True, capture_output=True)
+
+def render_playblast_parallel(scene, filepath, quality, format, workers, blender=None):
+    """将帧范围拆分给多个后台Blender进程并行渲染并合并为最终视频,返回分段数
+    
+    场景需要已经应用过预览设置,分段进程直接使用副本中的设置渲染
+    """
+    chunks = split_frame_range(scene.frame_start, scene.frame_end, scene.frame_step, workers)
+    if not chunks:
+        return 0
+    
+    # 有ffmpeg时各分段直接输出视频并流复制拼接,否则所有分段按帧号输出PNG到同一目录再统一编码
+    ffmpeg = shutil.which("ffmpeg")
+    extension = PLAYBLAST_FORMATS[format][1]
+    temp_dir, source = save_temp_copy()
+    try:
+        def render_chunk(index_chunk):
+            index, (chunk_start, chunk_end) = index_chunk
+            worker_args = ["--quality", quality, "--format", format, "--scene", scene.name,
+                           "--frame-start", str(chunk_start), "--frame-end", str(chunk_end)]
+            if ffmpeg:
+                output = os.path.join(temp_dir, f"chunk_{index:03d}")
+            else:
+                output = os.path.join(temp_dir, "frames")
+                worker_args.append("--image-sequence")
+            result = run_blender_worker(source, "playblast-worker", worker_args + ["--output", output], blender)
+            result['output'] = output + extension if ffmpeg else output
+            return result
+        
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(chunks)) as pool:
+            results = list(pool.map(render_chunk, enumerate(chunks)))
+        
+        failed = [r for r in results if r['status'] != 'ok']
+        if failed:
+            raise RuntimeError(f"{len(failed)} 个分段渲染失败:\n{failed[0]['error']}")
+        
+        output_dir = os.path.dirname(filepath)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        if ffmpeg:
+            concat_movie_segments([r['output'] for r in results], filepath, ffmpeg)
+        else:
+            frame_paths = sorted(glob.glob(os.path.join(temp_dir, "frames", "frame_*")))
+            encode_image_sequence(scene, frame_paths, filepath, quality, format)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return len(chunks)
+
+def encode_image_sequence(scene, frame_paths, filepath, quality, format):
+    """用临时场景的序列编辑器将图像序列编码为视频,不重新渲染三维画面
+    
+    图像条带只记录一个目录,所有帧必须位于同一目录中
+    """
+    if not frame_paths:
+        raise ValueError("没有可编码的帧")
+    if len({os.path.dirname(path) for path in frame_paths}) > 1:
+        raise ValueError("图像序列的帧必须位于同一目录")
+    encode_scene = bpy.data.scenes.new("pipeline_playblast_encode")
+    try:
+        render = encode_scene.render
+        render.resolution_x = scene.render.resolution_x * scene.render.resolution_percentage // 100
+        render.resolution_y = scene.render.resolution_y * scene.render.resolution_percentage // 100
+        render.resolution_percentage = 100
+        render.fps = scene.render.fps
+        render.fps_base = scene.render.fps_base
+        render.use_sequencer = True
+        render.use_compositing = False
+        # 缓存帧已经过色彩变换,编码时不再重复转换
+        encode_scene.view_settings.view_transform = 'Standard'
+        
+        # 按顺序添加图像序列
+        editor = encode_scene.sequence_editor_create()
+        strips = getattr(editor, "strips", None) or editor.sequences
+        strip = strips.new_image("playblast", frame_paths[0], 1, 1)
+        for path in frame_paths[1:]:
+            strip.elements.append(os.path.basename(path))
+        encode_scene.frame_start = 1
+        encode_scene.frame_end = len(frame_paths)
+        
+        apply_playblast_settings(encode_scene, os.path.splitext(filepath)[0], quality, format)
+        bpy.ops.render.render(animation=True, scene=encode_scene.name)
+    finally:
+        bpy.data.scenes.remove(encode_scene)
+
+def playblast_frames_dir(filepath):
+    """返回预览图像序列的输出目录"""
+    return os.path.splitext(filepath)[0] + "_frames"
+
+def prepare_playblast_sequence(scene, filepath, sequence_format, fingerprint):
+    """将输出切换为图像序列,场景未变化时保留已渲染的帧以便续渲,返回(序列目录, 已有帧数)"""
+    frames_dir = playblast_frames_dir(bpy.path.abspath(filepath))
+    file_format, extension = PLAYBLAST_SEQUENCE_FORMATS[sequence_format]
+    info_path = os.path.join(frames_dir, "sequence.json")
+    try:
+        with open(info_path, encoding="utf-8") as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        info = {}
+    
+    # 场景或格式变化时已有的帧全部作废
+    if info.get('fingerprint') != fingerprint or info.get('extension') != extension:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+    if not os.path.exists(frames_dir):
+        os.makedirs(frames_dir)
+    
+    # 删除中断时可能残留的空文件,其余已写出的帧不再渲染
+    for path in glob.glob(os.path.join(frames_dir, "frame_*")):
+        if os.path.getsize(path) == 0:
+            os.remove(path)
+    existing = len(glob.glob(os.path.join(frames_dir, "frame_*" + extension)))
+    
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump({
+            'fingerprint': fingerprint,
+            'extension': extension,
+            'fps': scene.render.fps / scene.render.fps_base,
+        }, f, indent=1)
+    
+    scene.render.image_settings.file_format = file_format
+    scene.render.image_settings.color_mode = 'RGB'
+    scene.render.filepath = os.path.join(frames_dir, "frame_")
+    scene.render.use_overwrite = False
+    scene.render.use_placeholder = False
+    return frames_dir, existing
+
+def encode_playblast_sequence(frames_dir, filepath, quality, format, ffmpeg, threads=0):
+    """用外部ffmpeg将图像序列编码为视频并保存场景指纹,返回用时(秒)
+    
+    只使用文件和子进程,不访问Blender数据,可以在编码线程中运行
+    """
+    start_time = time.perf_counter()
+    with open(os.path.join(frames_dir, "sequence.json"), encoding="utf-8") as f:
+        info = json.load(f)
+    frame_paths = sorted(glob.glob(os.path.join(frames_dir, "frame_*" + info['extension'])))
+    if not frame_paths:
+        raise RuntimeError(f"没有可编码的帧: {frames_dir}")
+    
+    # 用concat列表给出每帧的时长,跳帧渲染的序列编号不连续也能编码
+    list_path = os.path.join(frames_dir, "frames.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for frame_path in frame_paths:
+            path = frame_path.replace("\\", "/").replace("'", "'\\''")
+            f.write(f"file '{path}'\nduration {1.0 / info['fps']:.6f}\n")
+        # 最后一帧需要重复一次,否则其时长会被忽略
+        f.write(f"file '{path}'\n")
+    
+    crf, preset = PLAYBLAST_FFMPEG_QUALITIES[quality]
+    encoder = PLAYBLAST_FORMATS[format][3]
+    cmd = [ffmpeg, "-y", "-loglevel", "error"]
+    if info['extension'] == ".exr":
+        # EXR为线性数据,编码前转换到sRGB
+        cmd += ["-apply_trc", "iec61966_2_1"]
+    cmd += ["-f", "concat", "-safe", "0", "-i", list_path, "-r", f"{info['fps']:.6f}",
+            "-threads", str(threads), "-c:v", encoder, "-crf", crf, "-preset", preset,
+            "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", filepath]
+    subprocess.run(cmd, check=True, capture_output=True)
+    
+    with open(playblast_fingerprint_path(filepath), "w", encoding="utf-8") as f:
+        json.dump({
+            'fingerprint': info['fingerprint'],
+            'output': os.path.basename(filepath),
+            'created': datetime.datetime.now().isoformat(timespec="seconds"),
+        }, f, indent=1)
+    return time.perf_counter() - start_time
+
+def poll_playblast_encodes():
+    """定时检查编码线程,完成后登记输出文件"""
+    for job in list(_playblast_encodes):
+        if not job['future'].done():
+            continue
+        _playblast_encodes.remove(job)
+        error = job['future'].exception()
+        if error:
+            print(f"预览编码失败: {job['filepath']}: {error}")
+            continue
+        
+        scene = bpy.data.scenes.get(job['scene'])
+        if scene:
+            scene.pipeline_last_playblast = job['filepath']
+            if scene.pipeline_playblast_versioned:
+                try:
+                    store_playblast_version(job['filepath'], scene, bpy.data.filepath,
+                                            scene.pipeline_playblast_store_budget)
+                except OSError as e:
+                    print(f"保存预览版本失败: {str(e)}")
+        print(f"预览编码完成: {job['filepath']},用时 {job['future'].result():.1f} 秒")
+    
+    tag_redraw_sidebar(bpy.context)
+    return 0.5 if _playblast_encodes else None
+
+def queue_playblast_encode(scene, frames_dir, filepath, quality, format, ffmpeg):
+    """将图像序列的编码提交到编码线程池"""
+    executor = _playblast_encode_pool.get('executor')
+    if executor is None:
+        executor = _playblast_encode_pool['executor'] = concurrent.futures.ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="pipeline_encode")
+    future = executor.submit(encode_playblast_sequence, frames_dir, filepath, quality, format, ffmpeg)
+    _playblast_encodes.append({'future': future, 'scene': scene.name, 'filepath': filepath})
+    if not bpy.app.timers.is_registered(poll_playblast_encodes):
+        bpy.app.timers.register(poll_playblast_encodes, first_interval=0.5)
+
+def find_view3d(context):
+    """返回当前窗口中的第一个三维视图(区域, 视图空间)"""
+    areas = [context.area] if context.area and context.area.type == 'VIEW_3D' else []
+    areas += [area for area in context.screen.areas if area.type == 'VIEW_3D']
+    for area in areas:
+        for region in area.regions:
+            if region.type == 'WINDOW':
+                return region, area.spaces.active
+    return None, None
+
+def apply_view3d_playblast_shading(scene, space):
+    """让离屏绘制使用预览设置写入场景的Workbench显示设置,返回恢复用的原始值
+    
+    draw_view3d按视图自身的着色绘制,需要把场景显示设置(颜色类型、阴影等)临时复制到视图上
+    """
+    saved = {'shading': {}, 'overlay': space.overlay.show_overlays, 'viewport_aa': scene.display.viewport_aa}
+    for prop in space.shading.bl_rna.properties:
+        if prop.is_readonly or prop.type in {'POINTER', 'COLLECTION'}:
+            continue
+        saved['shading'][prop.identifier] = getattr(space.shading, prop.identifier)
+    
+    space.shading.type = 'SOLID'
+    for identifier in saved['shading']:
+        if identifier == 'type':
+            continue
+        try:
+            setattr(space.shading, identifier, getattr(scene.display.shading, identifier))
+        except (AttributeError, TypeError, ValueError):
+            # 部分属性(如工作室灯光)的可选值随视图而变,无法复制时保持原值
+            pass
+    space.overlay.show_overlays = False
+    scene.display.viewport_aa = scene.display.render_aa
+    return saved
+
+def restore_view3d_shading(scene, space, saved):
+    """恢复apply_view3d_playblast_shading修改的视图和场景设置"""
+    for identifier, value in saved['shading'].items():
+        try:
+            setattr(space.shading, identifier, value)
+        except (AttributeError, TypeError, ValueError):
+            pass
+    space.overlay.show_overlays = saved['overlay']
+    scene.display.viewport_aa = saved['viewport_aa']
+
+def render_playblast_pipe(context, filepath, quality='MEDIUM', threads=0, codec_options=""):
+    """在离屏缓冲中逐帧绘制视口,将原始像素通过管道直接送入外部ffmpeg编码,返回帧数
+    
+    像素从GPU读入一块复用的缓冲区后整块写入管道,不生成中间图像文件;
+    视口着色使用场景的预览显示设置,质量档位给出CRF和预设,编码参数中的同名选项优先
+    """
+    scene = context.scene
+    ffmpeg = shutil.which("ffmpeg")
+    if not ffmpeg:
+        raise RuntimeError("没有找到ffmpeg,请将其加入PATH")
+    if not scene.camera:
+        raise RuntimeError("场景没有活动摄像机")
+    region, space = find_view3d(context)
+    if not region:
+        raise RuntimeError("需要一个三维视图用于绘制")
+    
+    # yuv420p要求宽高为偶数
+    render = scene.render
+    width = render.resolution_x * render.resolution_percentage // 100 // 2 * 2
+    height = render.resolution_y * render.resolution_percentage // 100 // 2 * 2
+    # 与内置写入器一致,跳帧的提速预设已同比调整fps_base
+    fps = render.fps / render.fps_base
+    
+    # GPU读回的像素自下而上排列,由ffmpeg翻转
+    crf, preset = PLAYBLAST_FFMPEG_QUALITIES[quality]
+    cmd = [ffmpeg, "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "rgba", "-s", f"{width}x{height}", "-r", f"{fps:.6f}",
+           "-i", "-", "-vf", "vflip", "-threads", str(threads), "-crf", crf, "-preset", preset]
+    # ffmpeg对重复的输出选项取最后一个,编码参数可以覆盖质量档位
+    cmd += shlex.split(codec_options) + [filepath]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    saved_shading = apply_view3d_playblast_shading(scene, space)
+    offscreen = gpu.types.GPUOffScreen(width, height)
+    pixels = gpu.types.Buffer('UBYTE', width * height * 4)
+    frame_current = scene.frame_current
+    frames = 0
+    try:
+        for frame in range(scene.frame_start, scene.frame_end + 1, scene.frame_step):
+            scene.frame_set(frame)
+            depsgraph = context.evaluated_depsgraph_get()
+            camera = scene.camera.evaluated_get(depsgraph)
+            projection = camera.calc_matrix_camera(depsgraph, x=width, y=height,
+                                                   scale_x=render.pixel_aspect_x, scale_y=render.pixel_aspect_y)
+            offscreen.draw_view3d(scene, context.view_layer, space, region,
+                                  camera.matrix_world.inverted(), projection, do_color_management=True)
+            with offscreen.bind():
+                gpu.state.active_framebuffer_get().read_color(0, 0, width, height, 4, 0, 'UBYTE', data=pixels)
+            try:
+                process.stdin.write(pixels)
+            except BrokenPipeError:
+                # ffmpeg提前退出,下面读取它的错误信息
+                break
+            frames += 1
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        error = process.stderr.read().decode(errors="replace")
+        if process.wait() != 0:
+            raise RuntimeError(error.strip() or f"ffmpeg退出码 {process.returncode}")
+    finally:
+        restore_view3d_shading(scene, space, saved_shading)
+        offscreen.free()
+        if process.poll() is None:
+            process.kill()
+        scene.frame_set(frame_current)
+    return frames
+
+# 面板按钮调用操作符时从场景属性读取的设置: 操作符类名 -> ((操作符属性, 场景属性), ...)
+OPERATOR_SCENE_SETTINGS = {
+    "PIPELINE_OT_Playblast": (
+        ("quality", "pipeline_playblast_quality"),
+        ("format", "pipeline_playblast_format"),
+        ("speed", "pipeline_playblast_speed"),
+        ("show_file", "pipeline_playblast_show_file"),
+        ("use_default_path", "pipeline_playblast_use_default_path"),
+        ("background", "pipeline_playblast_background"),
+        ("incremental", "pipeline_playblast_incremental"),
+        ("parallel_workers", "pipeline_playblast_workers"),
+        ("profile", "pipeline_playblast_profile"),
+        ("skip_unchanged", "pipeline_playblast_skip_unchanged"),
+        ("sequence_format", "pipeline_playblast_sequence_format"),
+        ("encoder", "pipeline_playblast_encoder"),
+        ("encode_threads", "pipeline_playblast_encode_threads"),
+        ("codec_options", "pipeline_playblast_codec_options"),
+    ),
+    "PIPELINE_OT_KeyframeCharacter": (
+        ("use_frame_range", "pipeline_keyframe_use_range"),
+        ("use_scene_range", "pipeline_keyframe_use_scene_range"),
+        ("frame_start", "pipeline_keyframe_frame_start"),
+        ("frame_end", "pipeline_keyframe_frame_end"),
+        ("frame_step", "pipeline_keyframe_frame_step"),
+    ),
+    "PIPELINE_OT_BakeAnimation": (
+        ("bake_mode", "pipeline_bake_mode"),
+        ("only_selected", "pipeline_bake_only_selected"),
+        ("use_scene_range", "pipeline_keyframe_use_scene_range"),
+        ("frame_start", "pipeline_keyframe_frame_start"),
+        ("frame_end", "pipeline_keyframe_frame_end"),
+        ("frame_step", "pipeline_keyframe_frame_step"),
+        ("simplify", "pipeline_bake_simplify"),
+        ("tolerance", "pipeline_bake_tolerance"),
+        ("clear_constraints", "pipeline_bake_clear_constraints"),
+    ),
+    "PIPELINE_OT_ReduceKeyframes": (
+        ("tolerance", "pipeline_reduce_tolerance"),
+        ("only_selected", "pipeline_reduce_only_selected"),
+    ),
+    "PIPELINE_OT_MeasurePanelRedraw": (
+        ("duration", "pipeline_redraw_duration"),
+    ),
+    # 烘焙模式由按钮指定,不指定时只对齐当前帧
+    "PIPELINE_OT_IKFKSwitch": (
+        ("use_scene_range", "pipeline_ikfk_bake_use_scene_range"),
+        ("frame_start", "pipeline_ikfk_bake_frame_start"),
+        ("frame_end", "pipeline_ikfk_bake_frame_end"),
+    ),
+}
+
+def load_scene_settings(operator, scene):
+    """在invoke中从场景属性读取操作符设置,调用时显式传入的参数优先
+    
+    面板不再在每次重绘时给按钮赋值
+    """
+    for prop, scene_prop in OPERATOR_SCENE_SETTINGS[type(operator).__name__]:
+        if not operator.properties.is_property_set(prop, ghost=False):
+            setattr(operator, prop, getattr(scene, scene_prop))
+
+# 操作符性能记录的环形缓冲区容量
+OPERATOR_TIMING_CAPACITY = 200
+
+# 不记录耗时的操作符(性能记录自身的操作符)
+OPERATOR_TIMING_IGNORED = {"pipeline.export_operator_timings", "pipeline.clear_operator_timings"}
+
+# 最近的操作符执行记录
+_operator_timings = collections.deque(maxlen=OPERATOR_TIMING_CAPACITY)
+
+# 记录开启时被替换的原始execute: 操作符类 -> 函数
+_operator_timing_originals = {}
+
+# 记录开启期间的场景更新次数
+_operator_timing_state = {'depsgraph_updates': 0}
+
+@persistent
+def count_depsgraph_update(scene, depsgraph):
+    """统计场景更新次数(仅在性能记录开启时注册)"""
+    _operator_timing_state['depsgraph_updates'] += 1
+
+def peak_memory_mb():
+    """返回进程启动以来的峰值内存(MB),没有resource模块的平台返回None
+    
+    ru_maxrss只增不减,两次读取之差是这段时间内进程峰值被推高的量,而不是新分配的内存
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位,Linux以KB为单位
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def timed_execute(cls, execute):
+    """包装操作符的execute,记录耗时、场景更新次数和进程峰值内存的增长"""
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        updates = _operator_timing_state['depsgraph_updates']
+        memory = peak_memory_mb()
+        start_time = time.perf_counter()
+        result = None
+        try:
+            result = execute(self, context)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start_time
+            peak = peak_memory_mb()
+            _operator_timings.append({
+                'time': datetime.datetime.now().isoformat(timespec="seconds"),
+                'operator': cls.bl_idname,
+                'label': cls.bl_label,
+                'result': ",".join(sorted(result)) if result else "EXCEPTION",
+                'ms': round(elapsed * 1000.0, 3),
+                'depsgraph_updates': _operator_timing_state['depsgraph_updates'] - updates,
+                # 操作符的内存用量没有超过之前的进程峰值时为0
+                'process_peak_growth_mb': round(peak - memory, 3) if memory is not None else None,
+            })
+    return wrapper
+
+def enable_operator_timing():
+    """替换所有操作符的execute以记录耗时"""
+    if _operator_timing_originals:
+        return
+    for cls in classes:
+        if not issubclass(cls, Operator) or not hasattr(cls, "execute") or cls.bl_idname in OPERATOR_TIMING_IGNORED:
+            continue
+        _operator_timing_originals[cls] = cls.execute
+        cls.execute = timed_execute(cls, cls.execute)
+    bpy.app.handlers.depsgraph_update_post.append(count_depsgraph_update)
+
+def disable_operator_timing():
+    """恢复原始execute,关闭后不再有任何额外开销"""
+    for cls, execute in _operator_timing_originals.items():
+        cls.execute = execute
+    _operator_timing_originals.clear()
+    if count_depsgraph_update in bpy.app.handlers.depsgraph_update_post:
+        bpy.app.handlers.depsgraph_update_post.remove(count_depsgraph_update)
+
+def update_operator_timing(self, context):
+    """性能记录开关的更新回调"""
+    if self.pipeline_operator_timing:
+        enable_operator_timing()
+    else:
+        disable_operator_timing()
+
+@persistent
+def sync_operator_timing(*args):
+    """注册和加载文件后按场景中保存的开关状态开启或关闭性能记录"""
+    # 启动时注册插件的上下文受限,没有场景,由加载文件后的回调同步
+    scene = getattr(bpy.context, "scene", None)
+    if scene and getattr(scene, "pipeline_operator_timing", False):
+        enable_operator_timing()
+    else:
+        disable_operator_timing()
+
+def write_operator_timings(filepath):
+    """导出操作符执行记录,扩展名为.csv时导出CSV,否则导出JSON"""
+    rows = list(_operator_timings)
+    output_dir = os.path.dirname(filepath)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    if filepath.lower().endswith(".csv"):
+        fields = ('time', 'operator', 'label', 'result', 'ms', 'depsgraph_updates', 'process_peak_growth_mb')
+        with open(filepath, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(filepath, "w", encoding="utf-8") as f:
+            json.dump({'capacity': OPERATOR_TIMING_CAPACITY, 'runs': rows}, f, ensure_ascii=False, indent=2)
+    return len(rows)
+
+class PIPELINE_OT_ExportOperatorTimings(Operator):
+    """导出操作符性能记录操作符"""
+    bl_idname = "pipeline.export_operator_timings"
+    bl_label = "导出性能记录"
+    
+    filepath: StringProperty(
+        subtype='FILE_PATH',
+        description="导出路径,扩展名为.csv时导出CSV,否则导出JSON"
+    )
+    
+    def execute(self, context):
+        if not _operator_timings:
+            self.report({'WARNING'}, "没有可导出的性能记录")
+            return {'CANCELLED'}
+        filepath = bpy.path.abspath(self.filepath)
+        try:
+            count = write_operator_timings(filepath)
+        except OSError as e:
+            self.report({'ERROR'}, f"导出失败: {str(e)}")
+            return {'CANCELLED'}
+        self.report({'INFO'}, f"已导出 {count} 条性能记录: {filepath}")
+        return {'FINISHED'}
+    
+    def invoke(self, context, event):
+        if not self.filepath:
+            blend_filepath = context.blend_data.filepath
+            base_dir = os.path.dirname(blend_filepath) if blend_filepath else os.path.expanduser("~")
+            self.filepath = os.path.join(base_dir, "operator_timings.json")
+        
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class PIPELINE_OT_ClearOperatorTimings(Operator):
+    """清空操作符性能记录操作符"""
+    bl_idname = "pipeline.clear_operator_timings"
+    bl_label = "清空性能记录"
+    
+    def execute(self, context):
+        _operator_timings.clear()
+        return {'FINISHED'}
+
+# 面板重绘测量期间被替换的原始draw: 面板类 -> 函数
+_panel_draw_originals = {}
+
+# 面板重绘测量结果: 面板类名 -> [绘制次数, 总耗时]
+_panel_draw_stats = {}
+
+def timed_draw(cls, draw):
+    """包装面板的draw,累计绘制次数和耗时"""
+    @functools.wraps(draw)
+    def wrapper(self, context):
+        start_time = time.perf_counter()
+        try:
+            draw(self, context)
+        finally:
+            stats = _panel_draw_stats.setdefault(cls.__name__, [0, 0.0])
+            stats[0] += 1
+            stats[1] += time.perf_counter() - start_time
+    return wrapper
+
+def restore_panel_draws():
+    """恢复被重绘测量替换的面板draw"""
+    for cls, draw in _panel_draw_originals.items():
+        cls.draw = draw
+    _panel_draw_originals.clear()
+
+class PIPELINE_OT_MeasurePanelRedraw(Operator):
+    """测量播放动画时工具箱面板的重绘耗时"""
+    bl_idname = "pipeline.measure_panel_redraw"
+    bl_label = "测量面板重绘"
+    
+    duration: FloatProperty(
+        name="测量时长",
+        default=5.0,
+        min=1.0,
+        max=60.0,
+        subtype='TIME_ABSOLUTE',
+        description="播放动画并持续重绘侧边栏的时间(秒)"
+    )
+    
+    def invoke(self, context, event):
+        if _panel_draw_originals:
+            self.report({'WARNING'}, "正在测量面板重绘")
+            return {'CANCELLED'}
+        load_scene_settings(self, context.scene)
+        
+        # 只在测量期间包装面板的draw
+        _panel_draw_stats.clear()
+        for cls in classes:
+            if issubclass(cls, Panel):
+                _panel_draw_originals[cls] = cls.draw
+                cls.draw = timed_draw(cls, cls.draw)
+        
+        self._started_playback = not context.screen.is_animation_playing
+        if self._started_playback:
+            bpy.ops.screen.animation_play()
+        self._end_time = time.perf_counter() + self.duration
+        self._timer = context.window_manager.event_timer_add(1 / 60, window=context.window)
+        context.window_manager.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            return self.finish(context)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        
+        # 模拟播放时打开侧边栏的情况: 每次计时都重绘侧边栏
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                for region in area.regions:
+                    if region.type == 'UI':
+                        region.tag_redraw()
+        
+        if time.perf_counter() >= self._end_time:
+            return self.finish(context)
+        return {'PASS_THROUGH'}
+    
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        if self._started_playback and context.screen.is_animation_playing:
+            bpy.ops.screen.animation_cancel(restore_frame=True)
+        restore_panel_draws()
+        
+        # 以主面板的绘制次数作为侧边栏的重绘次数
+        redraws = _panel_draw_stats.get(PIPELINE_PT_MainPanel.__name__, [0, 0.0])[0]
+        total = sum(seconds for count, seconds in _panel_draw_stats.values())
+        panels = {
+            name: {'draws': count, 'total_ms': round(seconds * 1000.0, 3), 'mean_ms': round(seconds / count * 1000.0, 4)}
+            for name, (count, seconds) in _panel_draw_stats.items() if count
+        }
+        per_redraw = total / redraws * 1000.0 if redraws else 0.0
+        slowest = max(panels, key=lambda name: panels[name]['total_ms'], default="")
+        
+        context.scene.pipeline_redraw_summary = f"{redraws}次重绘 平均 {per_redraw:.3f}ms/次 最慢: {slowest}"
+        print(json.dumps({
+            'section': context.scene.pipeline_active_section,
+            'redraws': redraws,
+            'ms_per_redraw': round(per_redraw, 4),
+            'panels': panels,
+        }, ensure_ascii=False, indent=2))
+        self.report({'INFO'}, f"面板重绘: {context.scene.pipeline_redraw_summary}")
+        return {'FINISHED'}
+
 #---------------------------------------------------------------
 # 面板类定义 - 用户界面(Panel)
 #---------------------------------------------------------------
@@ -758,246 +3701,339 @@ class PIPELINE_PT_MainPanel(Panel):
     def draw(self, context):
         layout = self.layout
         
-        # 功能分区选择
-        box = layout.box()
-        row = box.row()
-        row.label(text="功能分区")
-        row.prop(context.scene, "pipeline_active_section", expand=True)
-        
-        # 根据选择的分区显示不同的工具
-        if context.scene.pipeline_active_section == 'DEFAULT':
-            self.draw_default_section(layout, context)
-        elif context.scene.pipeline_active_section == 'ANIMATION':
-            self.draw_animation_section(layout, context)
-        elif context.scene.pipeline_active_section == 'RIGGING':
-            self.draw_rigging_section(layout, context)
-        else:  # SETTINGS   #
-            self.draw_settings_section(layout, context)
-
-    def draw_default_section(self, layout, context):            
-        # 模式切换
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_mode_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_mode_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="模式切换")
+        # 功能分区选择,各分区的工具由子面板绘制
+        box = layout.box()
+        row = box.row()
+        row.label(text="功能分区")
+        row.prop(context.scene, "pipeline_active_section", expand=True)
+
+class PipelineSubPanel:
+    """子面板基类,只在所属的功能分区中绘制
+    
+    折叠状态由Blender管理,折叠或不在当前分区的子面板不会调用draw
+    """
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Pipeline ToolBox"
+    bl_parent_id = "PIPELINE_PT_MainPanel"
+    sections = ()
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.pipeline_active_section in cls.sections
+
+class PIPELINE_PT_ModeTools(PipelineSubPanel, Panel):
+    """模式切换子面板"""
+    bl_label = "模式切换"
+    sections = ('DEFAULT', 'ANIMATION', 'RIGGING')
+    
+    def draw(self, context):
+        row = self.layout.row()
+        row.operator("pipeline.switch_mode", text="物体模式").mode = 'OBJECT'
+        if context.scene.pipeline_active_section != 'DEFAULT':
+            row.operator("pipeline.switch_mode", text="姿态模式").mode = 'POSE'
+
+class PIPELINE_PT_EmptyTools(PipelineSubPanel, Panel):
+    """空物体工具子面板"""
+    bl_label = "空物体工具"
+    sections = ('DEFAULT',)
+    
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.prop(context.scene, "pipeline_empty_type", text="类型")
+        row.prop(context.scene, "pipeline_empty_size", text="大小")
+        layout.operator("pipeline.add_empty", text="添加空物体")
+
+class PIPELINE_PT_CameraTools(PipelineSubPanel, Panel):
+    """摄像机工具子面板"""
+    bl_label = "摄像机工具"
+    sections = ('DEFAULT',)
+    
+    def draw(self, context):
+        self.layout.operator("pipeline.set_active_camera", text="设为活动摄像机")
+
+class PIPELINE_PT_KeyframeTools(PipelineSubPanel, Panel):
+    """关键帧工具子面板"""
+    bl_label = "关键帧工具"
+    sections = ('ANIMATION',)
+    
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        
+        # 帧范围等设置在操作符invoke时从场景属性读取
+        row = layout.row()
+        row.operator("pipeline.keyframe_character", text="完整角色关键帧").key_type = 'WHOLE'
+        row.operator("pipeline.keyframe_character", text="选中骨骼关键帧").key_type = 'SELECTED'
+        
+        # 帧范围(帧范围关键帧和烘焙共用)
+        row = layout.row()
+        row.prop(scene, "pipeline_keyframe_use_range", text="帧范围关键帧")
+        row.prop(scene, "pipeline_keyframe_use_scene_range", text="场景帧范围")
+        row = layout.row(align=True)
+        if not scene.pipeline_keyframe_use_scene_range:
+            row.prop(scene, "pipeline_keyframe_frame_start", text="起始帧")
+            row.prop(scene, "pipeline_keyframe_frame_end", text="结束帧")
+        row.prop(scene, "pipeline_keyframe_frame_step", text="步长")
+
+class PIPELINE_PT_BakeTools(PipelineSubPanel, Panel):
+    """烘焙和精简关键帧子面板"""
+    bl_label = "烘焙动画"
+    bl_parent_id = "PIPELINE_PT_KeyframeTools"
+    bl_options = {'DEFAULT_CLOSED'}
+    sections = ('ANIMATION',)
+    
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        
+        # 烘焙动画
+        row = layout.row()
+        row.prop(scene, "pipeline_bake_mode", text="烘焙")
+        row.prop(scene, "pipeline_bake_only_selected", text="仅选中骨骼")
+        row = layout.row(align=True)
+        row.prop(scene, "pipeline_bake_simplify", text="简化")
+        if scene.pipeline_bake_simplify:
+            row.prop(scene, "pipeline_bake_tolerance", text="容差")
+        row = layout.row()
+        row.prop(scene, "pipeline_bake_clear_constraints", text="清除约束")
+        layout.operator("pipeline.bake_animation", text="烘焙动画", icon='ACTION')
+        
+        # 精简关键帧
+        row = layout.row(align=True)
+        row.prop(scene, "pipeline_reduce_tolerance", text="容差")
+        row.prop(scene, "pipeline_reduce_only_selected", text="仅选中骨骼")
+        layout.operator("pipeline.reduce_keyframes", text="精简关键帧", icon='FCURVE')
+
+class PIPELINE_PT_IKFKTools(PipelineSubPanel, Panel):
+    """Rigify IK/FK工具子面板"""
+    bl_label = "Rigfy骨骼IK/FK工具"
+    sections = ('ANIMATION',)
+    
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        
+        layout.operator("pipeline.ikfk_switch", text="切换IK/FK")
+        row = layout.row(align=True)
+        row.operator("pipeline.filter_ikfk_in_dopesheet", text="在摄影表中过滤IK_FK")
+        row.operator("pipeline.select_ikfk_curves", text="选择IK_FK曲线", icon='RESTRICT_SELECT_OFF')
+        layout.operator("pipeline.ikfk_snap_switches", text="对齐所有IK/FK切换帧", icon='SNAP_ON')
+        
+        # IK/FK烘焙
+        row = layout.row()
+        row.prop(scene, "pipeline_ikfk_bake_mode", text="烘焙")
+        row.prop(scene, "pipeline_ikfk_bake_use_scene_range", text="场景帧范围")
+        if not scene.pipeline_ikfk_bake_use_scene_range:
+            row = layout.row(align=True)
+            row.prop(scene, "pipeline_ikfk_bake_frame_start", text="起始帧")
+            row.prop(scene, "pipeline_ikfk_bake_frame_end", text="结束帧")
+        
+        # 与"切换IK/FK"共用同一个操作符,只有烘焙模式需要赋给按钮,帧范围在invoke时从场景读取
+        layout.operator("pipeline.ikfk_switch", text="烘焙IK/FK切换", icon='KEYFRAME').bake_mode = scene.pipeline_ikfk_bake_mode
+
+class PIPELINE_PT_IKFKInstructions(PipelineSubPanel, Panel):
+    """IK/FK指令工具子面板"""
+    bl_label = "IK/FK指令工具"
+    bl_parent_id = "PIPELINE_PT_IKFKTools"
+    bl_options = {'DEFAULT_CLOSED'}
+    sections = ('ANIMATION',)
+    
+    def draw(self, context):
+        layout = self.layout
+        
+        # 预设指令
+        layout.label(text="预设指令（直接执行）", icon='SCRIPT')
+        for prop, text, button, instruction_type in (
+            ("pipeline_arm_ik_to_fk_instruction", "手臂IK->FK", "IK->FK", 'ARM_IK_TO_FK'),
+            ("pipeline_arm_fk_to_ik_instruction", "手臂FK->IK", "FK->IK", 'ARM_FK_TO_IK'),
+            ("pipeline_leg_ik_to_fk_instruction", "腿部IK->FK", "IK->FK", 'LEG_IK_TO_FK'),
+            ("pipeline_leg_fk_to_ik_instruction", "腿部FK->IK", "FK->IK", 'LEG_FK_TO_IK'),
+        ):
+            row = layout.row()
+            row.prop(context.scene, prop, text=text)
+            row.operator("pipeline.execute_instruction", text=button, icon='PLAY').instruction_type = instruction_type
+            op = row.operator("pipeline.execute_instruction", text="", icon='KEYFRAME')
+            op.instruction_type = instruction_type
+            op.bake = True
+            error = instruction_error(context.scene, prop)
+            if error:
+                layout.label(text=error, icon='ERROR')
         
-        if context.scene.pipeline_show_mode_tools:
-            row = box.row()
-            row.operator("pipeline.switch_mode", text="物体模式").mode = 'OBJECT'
+        # 提示
+        layout.label(text="指令格式: bpy.ops.pose.rigify_...", icon='INFO')
+        layout.label(text="例如: bpy.ops.pose.rigify_limb_ik2fk_unu81nec92ae7d86(...)")
+        layout.label(text="烘焙按钮使用上方IK/FK烘焙的帧范围", icon='KEYFRAME')
+
+class PIPELINE_PT_PlayblastTools(PipelineSubPanel, Panel):
+    """预览动画子面板"""
+    bl_label = "预览动画"
+    sections = ('ANIMATION',)
     
-        # 空物体工具
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_empty_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_empty_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="空物体工具")
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
         
-        if context.scene.pipeline_show_empty_tools:
-            row = box.row()
-            row.prop(context.scene, "pipeline_empty_type", text="类型")
-            row.prop(context.scene, "pipeline_empty_size", text="大小")
-            box.operator("pipeline.add_empty", text="添加空物体")
+        # 质量、格式和提速预设
+        layout.prop(scene, "pipeline_playblast_quality", text="质量")
+        layout.prop(scene, "pipeline_playblast_format", text="格式")
+        layout.prop(scene, "pipeline_playblast_speed", text="提速")
         
-        # 摄像机工具
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_camera_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_camera_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="摄像机工具")
+        # 文件选项
+        layout.prop(scene, "pipeline_playblast_show_file", text="完成后显示文件")
+        layout.prop(scene, "pipeline_playblast_use_default_path", text="使用默认路径")
         
-        if context.scene.pipeline_show_camera_tools:
-            box.operator("pipeline.set_active_camera", text="设为活动摄像机")
-    
-    def draw_animation_section(self, layout, context):
-        # 模式切换
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_mode_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_mode_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="模式切换")
+        # 后台渲染选项
+        row = layout.row()
+        row.prop(scene, "pipeline_playblast_background", text="后台渲染")
+        row.prop(scene, "pipeline_playblast_incremental", text="增量预览")
+        row = layout.row()
+        row.prop(scene, "pipeline_playblast_workers", text="并行进程数")
+        row.prop(scene, "pipeline_playblast_profile", text="性能分析")
+        layout.prop(scene, "pipeline_playblast_skip_unchanged", text="跳过未变化的场景")
         
-        if context.scene.pipeline_show_mode_tools:
-            row = box.row()
-            row.operator("pipeline.switch_mode", text="物体模式").mode = 'OBJECT'
-            row.operator("pipeline.switch_mode", text="姿态模式").mode = 'POSE'
+        # 输出序列和编码方式
+        layout.prop(scene, "pipeline_playblast_sequence_format", text="输出")
+        row = layout.row()
+        row.prop(scene, "pipeline_playblast_encoder", text="编码")
+        if scene.pipeline_playblast_encoder == 'PIPE':
+            row.prop(scene, "pipeline_playblast_encode_threads", text="线程")
+            layout.prop(scene, "pipeline_playblast_codec_options", text="参数")
         
-        # 关键帧工具
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_keyframe_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_keyframe_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="关键帧工具")
+        # 渲染按钮,设置在操作符invoke时从场景属性读取
+        layout.operator("pipeline.playblast", text="创建预览动画")
         
-        if context.scene.pipeline_show_keyframe_tools:
-            row = box.row()
-            row.operator("pipeline.keyframe_character", text="完整角色关键帧").key_type = 'WHOLE'
-            row.operator("pipeline.keyframe_character", text="选中骨骼关键帧").key_type = 'SELECTED'
+        # 性能分析摘要
+        if scene.pipeline_playblast_profile and scene.pipeline_playblast_profile_summary:
+            layout.label(text=scene.pipeline_playblast_profile_summary, icon='TIME')
         
-        # IK/FK切换(rigfy)
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_ikfk_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_ikfk_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="Rigfy骨骼IK/FK工具")
+        # 编码线程中的图像序列
+        if _playblast_encodes:
+            layout.label(text=f"正在编码 {len(_playblast_encodes)} 个预览", icon='SEQUENCE')
         
-        if context.scene.pipeline_show_ikfk_tools:
-            box.operator("pipeline.ikfk_switch", text="切换IK/FK")
-            box.operator("pipeline.filter_ikfk_in_dopesheet", text="在摄影表中过滤IK_FK")
-            
-            # IK/FK指令工具
-            row = box.row()
-            row.prop(context.scene, "pipeline_show_ikfk_instructions", 
-                     icon='TRIA_DOWN' if context.scene.pipeline_show_ikfk_instructions else 'TRIA_RIGHT',
-                     icon_only=True, emboss=False
-            )
-            row.label(text="IK/FK指令工具")
-            
-            if context.scene.pipeline_show_ikfk_instructions:
-                # 预设指令
-                box.label(text="预设指令（直接执行）", icon='SCRIPT')
-                
-                # 手臂IK切换到FK指令
-                row = box.row()
-                row.prop(context.scene, "pipeline_arm_ik_to_fk_instruction", text="手臂IK->FK")
-                op = row.operator("pipeline.execute_instruction", text="IK->FK", icon='PLAY')
-                op.instruction_type = 'ARM_IK_TO_FK'
-                
-                # 手臂FK切换到IK指令
-                row = box.row()
-                row.prop(context.scene, "pipeline_arm_fk_to_ik_instruction", text="手臂FK->IK")
-                op = row.operator("pipeline.execute_instruction", text="FK->IK", icon='PLAY')
-                op.instruction_type = 'ARM_FK_TO_IK'
-                
-                # 腿部IK切换到FK指令
-                row = box.row()
-                row.prop(context.scene, "pipeline_leg_ik_to_fk_instruction", text="腿部IK->FK")
-                op = row.operator("pipeline.execute_instruction", text="IK->FK", icon='PLAY')
-                op.instruction_type = 'LEG_IK_TO_FK'
-                
-                # 腿部FK切换到IK指令
-                row = box.row()
-                row.prop(context.scene, "pipeline_leg_fk_to_ik_instruction", text="腿部FK->IK")
-                op = row.operator("pipeline.execute_instruction", text="FK->IK", icon='PLAY')
-                op.instruction_type = 'LEG_FK_TO_IK'
-                
-                # 提示
-                box.label(text="指令格式: bpy.ops.pose.rigify_...", icon='INFO')
-                box.label(text="例如: bpy.ops.pose.rigify_limb_ik2fk_unu81nec92ae7d86(...)")
+        # 后台渲染进度
+        if context.window_manager.pipeline_playblast_status:
+            row = layout.row()
+            row.progress(factor=context.window_manager.pipeline_playblast_progress,
+                         text=context.window_manager.pipeline_playblast_status)
+            row.operator("pipeline.cancel_playblast", text="", icon='CANCEL')
         
-        # 预览工具
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_playblast_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_playblast_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="预览动画")
+        # 路径选择按钮
+        if not scene.pipeline_playblast_use_default_path:
+            layout.operator("pipeline.playblast_path_select", text="选择输出路径")
+            if scene.pipeline_playblast_filepath:
+                layout.label(text=f"路径: {scene.pipeline_playblast_filepath}")
         
-        if context.scene.pipeline_show_playblast_tools:
-            # 质量设置
-            row = box.row()
-            row.prop(context.scene, "pipeline_playblast_quality", text="质量")
-            
-            # 格式设置
-            row = box.row()
-            row.prop(context.scene, "pipeline_playblast_format", text="格式")
-            
-            # 文件选项
-            row = box.row()
-            row.prop(context.scene, "pipeline_playblast_show_file", text="完成后显示文件")
-            
-            # 使用默认路径选项
-            row = box.row()
-            row.prop(context.scene, "pipeline_playblast_use_default_path", text="使用默认路径")
-
-            # 渲染按钮
-            row = box.row()
-            op = row.operator("pipeline.playblast", text="创建预览动画")
-            op.quality = context.scene.pipeline_playblast_quality
-            op.format = context.scene.pipeline_playblast_format
-            op.show_file = context.scene.pipeline_playblast_show_file
-            op.use_default_path = context.scene.pipeline_playblast_use_default_path
-
-            # 路径选择按钮
-            if not context.scene.pipeline_playblast_use_default_path:
-                row = box.row()
-                row.operator("pipeline.playblast_path_select", text="选择输出路径")
-                if context.scene.pipeline_playblast_filepath:
-                    row = box.row()
-                    row.label(text=f"路径: {context.scene.pipeline_playblast_filepath}")
-           
-            # 删除按钮
-            if context.scene.pipeline_last_playblast:
-                row = box.row()
-                row.operator("pipeline.delete_playblast", text="删除预览动画", icon='TRASH')
-    
-    def draw_rigging_section(self, layout, context):
-        # 模式切换子分区
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_mode_tools_rigging", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_mode_tools_rigging else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="模式切换")
+        # 删除按钮
+        if scene.pipeline_last_playblast:
+            layout.operator("pipeline.delete_playblast", text="删除预览动画", icon='TRASH')
+
+class PIPELINE_PT_PlayblastVersions(PipelineSubPanel, Panel):
+    """预览历史版本子面板"""
+    bl_label = "历史版本"
+    bl_parent_id = "PIPELINE_PT_PlayblastTools"
+    bl_options = {'DEFAULT_CLOSED'}
+    sections = ('ANIMATION',)
+    
+    def draw_header(self, context):
+        self.layout.prop(context.scene, "pipeline_playblast_versioned", text="")
+    
+    def draw(self, context):
+        layout = self.layout
+        layout.active = context.scene.pipeline_playblast_versioned
+        layout.prop(context.scene, "pipeline_playblast_store_budget", text="空间预算(MB)")
+        if context.scene.pipeline_playblast_versioned:
+            self.draw_playblast_versions(layout, context)
+    
+    def draw_playblast_versions(self, layout, context):
+        """列出当前镜头最近的预览版本"""
+        if context.scene.pipeline_playblast_use_default_path:
+            basepath = default_playblast_basepath(context.blend_data.filepath)
+        else:
+            basepath = context.scene.pipeline_playblast_filepath
+        store_dir = playblast_store_dir(basepath)
+        index = load_playblast_store(store_dir)
+        versions = index['shots'].get(playblast_shot_name(context.blend_data.filepath, context.scene), [])
         
-        if context.scene.pipeline_show_mode_tools_rigging:
-            # 模式切换按钮
-            row = box.row()
-            row.operator("pipeline.switch_mode", text="物体模式").mode = 'OBJECT'
-            row.operator("pipeline.switch_mode", text="姿态模式").mode = 'POSE'
+        for entry in sorted(versions, key=lambda entry: entry['created'], reverse=True)[:5]:
+            filepath = os.path.join(store_dir, entry['file'])
+            created = datetime.datetime.fromtimestamp(entry['created']).strftime("%m-%d %H:%M")
+            row = layout.row(align=True)
+            row.label(text=f"{created}  {entry['frame_start']}-{entry['frame_end']}  "
+                           f"{entry['size'] / (1024 * 1024):.1f}MB", icon='FILE_MOVIE')
+            row.operator("pipeline.play_playblast_version", text="", icon='PLAY').filepath = filepath
+            row.operator("pipeline.delete_playblast_version", text="", icon='TRASH').filepath = filepath
 
-        # 骨骼工具子分区
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_rig_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_rig_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False  
-        )
-        row.label(text="骨骼工具")
-        if context.scene.pipeline_show_rig_tools:
-            # 添加骨骼按钮
-            row = box.row()
-            row.operator("pipeline.add_metarig", text="Human Metarig").rig_type = 'METARIG'
-            row.operator("pipeline.add_metarig", text="Basic Human").rig_type = 'BASIC'
-            
-            # 生成绑定按钮
-            row = box.row()
-            row.operator("pipeline.generate_rig", text="生成绑定")
+class PIPELINE_PT_RigTools(PipelineSubPanel, Panel):
+    """骨骼工具子面板"""
+    bl_label = "骨骼工具"
+    sections = ('RIGGING',)
     
-    def draw_settings_section(self, layout, context):
-        box = layout.box()
-        row = box.row()
-        row.prop(context.scene, "pipeline_show_extension_tools", 
-                 icon='TRIA_DOWN' if context.scene.pipeline_show_extension_tools else 'TRIA_RIGHT',
-                 icon_only=True, emboss=False
-        )
-        row.label(text="安装我需要使用的扩展")
+    def draw(self, context):
+        layout = self.layout
+        
+        # 添加骨骼按钮
+        row = layout.row()
+        row.operator("pipeline.add_metarig", text="Human Metarig").rig_type = 'METARIG'
+        row.operator("pipeline.add_metarig", text="Basic Human").rig_type = 'BASIC'
+        
+        # 生成绑定按钮
+        row = layout.row()
+        row.operator("pipeline.generate_rig", text="生成绑定")
+        row.operator("pipeline.generate_rig", text="强制生成", icon='FILE_REFRESH').force = True
+
+class PIPELINE_PT_ExtensionTools(PipelineSubPanel, Panel):
+    """扩展工具子面板"""
+    bl_label = "安装我需要使用的扩展"
+    bl_options = {'DEFAULT_CLOSED'}
+    sections = ('SETTINGS',)
+    
+    def draw(self, context):
+        layout = self.layout
+        row = layout.row()
+        row.operator("pipeline.update_extensions", text="在线更新已安装的扩展")
+        row.operator("pipeline.install_extensions", text="在线安装需要的扩展")
         
-        if context.scene.pipeline_show_extension_tools:
-            row = box.row()
-            row.operator("pipeline.update_extensions", text="在线更新已安装的扩展")
-            row.operator("pipeline.install_extensions", text="在线安装需要的扩展")
+        # 提示
+        layout.label(text="提示: 不建议使用安装扩展的功能", icon='INFO')
+        layout.label(text="提示: 下载安装扩展的时候会需要很长时间", icon='INFO')
+        layout.label(text="提示: 在安装时不要乱动blender,请保证有充足的时间情况下在下载和安装扩展.", icon='INFO')
+        layout.label(text="提示: 请保证有充足的时间情况下在下载和安装扩展.", icon='INFO')
+        layout.label(text="提示: 更新扩展可能需要重新启动Blender", icon='INFO')
 
-            # 提示
-            box.label(text="提示: 不建议使用安装扩展的功能", icon='INFO')
-            box.label(text="提示: 下载安装扩展的时候会需要很长时间", icon='INFO')
-            box.label(text="提示: 在安装时不要乱动blender,请保证有充足的时间情况下在下载和安装扩展.", icon='INFO')
-            box.label(text="提示: 请保证有充足的时间情况下在下载和安装扩展.", icon='INFO')
-            box.label(text="提示: 更新扩展可能需要重新启动Blender", icon='INFO')
+class PIPELINE_PT_OperatorTimings(PipelineSubPanel, Panel):
+    """操作符性能记录子面板"""
+    bl_label = "操作符性能记录"
+    bl_options = {'DEFAULT_CLOSED'}
+    sections = ('SETTINGS',)
+    
+    def draw(self, context):
+        layout = self.layout
+        scene = context.scene
+        row = layout.row()
+        row.prop(scene, "pipeline_operator_timing", text="记录耗时")
+        row.prop(scene, "pipeline_operator_timing_rows", text="显示条数")
+        
+        col = layout.column(align=True)
+        for entry in reversed(list(_operator_timings)[-scene.pipeline_operator_timing_rows:]):
+            memory = entry['process_peak_growth_mb']
+            memory = f"  进程峰值+{memory:.1f}MB" if memory else ""
+            col.label(text=f"{entry['label']}  {entry['ms']:.1f}ms  更新{entry['depsgraph_updates']}次{memory}",
+                      icon='ERROR' if entry['result'] == "EXCEPTION" else 'TIME')
+        if not _operator_timings:
+            col.label(text="暂无记录")
+        
+        row = layout.row()
+        row.operator("pipeline.export_operator_timings", text="导出JSON/CSV", icon='EXPORT')
+        row.operator("pipeline.clear_operator_timings", text="清空", icon='TRASH')
+        
+        # 面板重绘耗时
+        row = layout.row()
+        row.prop(scene, "pipeline_redraw_duration", text="测量时长")
+        row.operator("pipeline.measure_panel_redraw", text="测量面板重绘", icon='PLAY')
+        if scene.pipeline_redraw_summary:
+            layout.label(text=scene.pipeline_redraw_summary, icon='TIME')
 
 #---------------------------------------------------------------
 # 属性注册 - 自定义场景属性
@@ -1023,6 +4059,12 @@ def register_properties():
         default='QUICKTIME'
     )
     
+    bpy.types.Scene.pipeline_playblast_speed = EnumProperty(
+        name="预览提速预设",
+        items=PLAYBLAST_SPEED_ITEMS,
+        default='FULL'
+    )
+    
     bpy.types.Scene.pipeline_playblast_show_file = BoolProperty(
         name="完成后显示文件",
         default=True
@@ -1047,6 +4089,97 @@ def register_properties():
         description="最后创建的预览动画路径"
     )
     
+    bpy.types.Scene.pipeline_playblast_background = BoolProperty(
+        name="后台渲染",
+        default=False,
+        description="保存场景副本并在后台Blender进程中渲染,渲染期间可以继续操作"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_incremental = BoolProperty(
+        name="增量预览",
+        default=False,
+        description="缓存每帧的渲染结果,只重新渲染姿态或摄像机发生变化的帧"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_workers = IntProperty(
+        name="并行进程数",
+        default=1,
+        min=1,
+        max=64,
+        description="大于1时将帧范围拆分给多个后台Blender进程并行渲染"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_sequence_format = EnumProperty(
+        name="输出序列",
+        items=PLAYBLAST_SEQUENCE_ITEMS,
+        default='NONE'
+    )
+    
+    bpy.types.Scene.pipeline_playblast_encoder = EnumProperty(
+        name="编码方式",
+        items=PLAYBLAST_ENCODER_ITEMS,
+        default='BLENDER'
+    )
+    
+    bpy.types.Scene.pipeline_playblast_encode_threads = IntProperty(
+        name="编码线程数",
+        default=0,
+        min=0,
+        max=64,
+        description="外部ffmpeg的编码线程数,0表示自动"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_codec_options = StringProperty(
+        name="编码参数",
+        default="-c:v libx264 -pix_fmt yuv420p",
+        description="传给外部ffmpeg的输出编码参数,其中的-crf和-preset会覆盖质量档位"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_skip_unchanged = BoolProperty(
+        name="跳过未变化的场景",
+        default=False,
+        description="场景内容指纹与已有输出一致时不重新渲染,直接使用已有的预览文件"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_versioned = BoolProperty(
+        name="保留历史版本",
+        default=False,
+        description="每次预览后将输出复制到版本库,方便对比之前的预览"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_store_budget = IntProperty(
+        name="版本库空间预算",
+        default=2048,
+        min=0,
+        description="版本库的最大占用空间(MB),超出时删除最久未使用的版本,0表示不限制"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_profile = BoolProperty(
+        name="性能分析",
+        default=False,
+        description="记录每帧的场景求值、绘制和编码耗时,并在输出文件旁写入CSV/JSON报告"
+    )
+    
+    bpy.types.Scene.pipeline_playblast_profile_summary = StringProperty(
+        name="性能分析摘要",
+        default="",
+        description="最近一次预览的性能分析摘要"
+    )
+    
+    # 后台预览进度(仅运行时使用,不保存到文件)
+    bpy.types.WindowManager.pipeline_playblast_progress = FloatProperty(
+        name="后台预览进度",
+        default=0.0,
+        min=0.0,
+        max=1.0,
+        subtype='FACTOR'
+    )
+    
+    bpy.types.WindowManager.pipeline_playblast_status = StringProperty(
+        name="后台预览状态",
+        default=""
+    )
+    
     # 空物体属性
     bpy.types.Scene.pipeline_empty_type = EnumProperty(
         name="空物体类型",
@@ -1078,89 +4211,190 @@ def register_properties():
         default='DEFAULT'
     )
     
-    # 折叠面板显示状态
-    bpy.types.Scene.pipeline_show_empty_tools = BoolProperty(
-        name="显示空物体工具",
-        default=True
+    # 操作符性能记录属性
+    bpy.types.Scene.pipeline_operator_timing = BoolProperty(
+        name="记录操作符耗时",
+        default=False,
+        description="记录每次执行工具箱操作符的耗时、场景更新次数和进程峰值内存的增长,关闭后没有额外开销",
+        update=update_operator_timing
     )
     
-    bpy.types.Scene.pipeline_show_camera_tools = BoolProperty(
-        name="显示摄像机工具",
-        default=True
+    bpy.types.Scene.pipeline_operator_timing_rows = IntProperty(
+        name="显示条数",
+        default=10,
+        min=1,
+        max=OPERATOR_TIMING_CAPACITY
     )
     
-    bpy.types.Scene.pipeline_show_mode_tools = BoolProperty(
-        name="显示模式工具",
-        default=True
+    # 面板重绘测量属性
+    bpy.types.Scene.pipeline_redraw_duration = FloatProperty(
+        name="测量时长",
+        default=5.0,
+        min=1.0,
+        max=60.0,
+        subtype='TIME_ABSOLUTE',
+        description="播放动画并持续重绘侧边栏的时间(秒)"
     )
     
-    bpy.types.Scene.pipeline_show_keyframe_tools = BoolProperty(
-        name="显示关键帧工具",
-        default=True
+    bpy.types.Scene.pipeline_redraw_summary = StringProperty(
+        name="面板重绘耗时",
+        default=""
     )
     
-    bpy.types.Scene.pipeline_show_ikfk_tools = BoolProperty(
-        name="显示IK/FK工具",
-        default=True
+    # 角色关键帧属性
+    bpy.types.Scene.pipeline_keyframe_use_range = BoolProperty(
+        name="关键帧帧范围",
+        default=False,
+        description="在帧范围内的每一帧插入求值后的姿态关键帧"
     )
     
-    bpy.types.Scene.pipeline_show_playblast_tools = BoolProperty(
-        name="显示预览工具",
-        default=True
+    bpy.types.Scene.pipeline_keyframe_use_scene_range = BoolProperty(
+        name="关键帧使用场景帧范围",
+        default=True,
+        description="使用场景的起止帧作为关键帧范围"
     )
     
-    bpy.types.Scene.pipeline_show_rig_tools = BoolProperty(
-        name="显示骨骼工具",
-        default=True
+    bpy.types.Scene.pipeline_keyframe_frame_start = IntProperty(
+        name="关键帧起始帧",
+        default=1
     )
     
-    bpy.types.Scene.pipeline_show_extension_tools = BoolProperty(
-        name="显示扩展工具",
-        default=True
-    )        
-    bpy.types.Scene.pipeline_show_mode_tools_rigging = BoolProperty(
-        name="显示模式工具（骨骼分区）",
-        default=True
+    bpy.types.Scene.pipeline_keyframe_frame_end = IntProperty(
+        name="关键帧结束帧",
+        default=250
     )
     
-    bpy.types.Scene.pipeline_show_ikfk_instructions = BoolProperty(
-        name="显示IK/FK指令工具",
-        default=True
+    bpy.types.Scene.pipeline_keyframe_frame_step = IntProperty(
+        name="关键帧步长",
+        default=1,
+        min=1
+    )
+    
+    # 动画烘焙和精简关键帧属性
+    bpy.types.Scene.pipeline_bake_mode = EnumProperty(
+        name="动画烘焙模式",
+        items=[
+            ('RANGE', "帧范围", "按步长烘焙帧范围内的帧"),
+            ('KEYED', "仅关键帧", "仅烘焙帧范围内已有关键帧的帧")
+        ],
+        default='RANGE'
+    )
+    
+    bpy.types.Scene.pipeline_bake_only_selected = BoolProperty(
+        name="仅烘焙选中骨骼",
+        default=False
+    )
+    
+    bpy.types.Scene.pipeline_bake_simplify = BoolProperty(
+        name="烘焙后简化曲线",
+        default=True,
+        description="烘焙后按容差用RDP算法删除冗余关键帧"
     )
     
+    bpy.types.Scene.pipeline_bake_tolerance = FloatProperty(
+        name="简化容差",
+        default=0.0001,
+        min=0.0,
+        precision=5
+    )
+    
+    bpy.types.Scene.pipeline_bake_clear_constraints = BoolProperty(
+        name="烘焙后清除约束",
+        default=False,
+        description="烘焙后移除已烘焙骨骼的约束,避免约束被重复应用"
+    )
+    
+    bpy.types.Scene.pipeline_reduce_tolerance = FloatProperty(
+        name="精简容差",
+        default=0.001,
+        min=0.0,
+        precision=5,
+        description="精简后曲线与原始关键帧之间允许的最大误差"
+    )
+    
+    bpy.types.Scene.pipeline_reduce_only_selected = BoolProperty(
+        name="仅精简选中骨骼",
+        default=False
+    )
+    
+    # IK/FK烘焙属性
+    bpy.types.Scene.pipeline_ikfk_bake_mode = EnumProperty(
+        name="IK/FK烘焙模式",
+        items=[
+            ('RANGE', "帧范围", "对齐并烘焙帧范围内的每一帧"),
+            ('KEYED', "仅关键帧", "仅对齐并烘焙帧范围内已有关键帧的帧")
+        ],
+        default='RANGE'
+    )
+
+    bpy.types.Scene.pipeline_ikfk_bake_use_scene_range = BoolProperty(
+        name="使用场景帧范围",
+        default=True,
+        description="使用场景的起止帧作为烘焙范围"
+    )
+
+    bpy.types.Scene.pipeline_ikfk_bake_frame_start = IntProperty(
+        name="烘焙起始帧",
+        default=1
+    )
+
+    bpy.types.Scene.pipeline_ikfk_bake_frame_end = IntProperty(
+        name="烘焙结束帧",
+        default=250
+    )
+
     # 预设指令属性
     bpy.types.Scene.pipeline_arm_ik_to_fk_instruction = StringProperty(
         name="手臂IK切换到FK指令",
         default="",
-        description="输入bpy.ops指令,用于手臂IK切换到FK"
+        update=precompile_instruction,
+        description="输入bpy.ops.pose.rigify_*指令(参数须为字面量),用于手臂IK切换到FK"
     )
     
     bpy.types.Scene.pipeline_arm_fk_to_ik_instruction = StringProperty(
         name="手臂FK切换到IK指令",
         default="",
-        description="输入bpy.ops指令,用于手臂FK切换到IK"
+        update=precompile_instruction,
+        description="输入bpy.ops.pose.rigify_*指令(参数须为字面量),用于手臂FK切换到IK"
     )
     
     bpy.types.Scene.pipeline_leg_ik_to_fk_instruction = StringProperty(
         name="腿部IK切换到FK指令",
         default="",
-        description="输入bpy.ops指令,用于腿部IK切换到FK"
+        update=precompile_instruction,
+        description="输入bpy.ops.pose.rigify_*指令(参数须为字面量),用于腿部IK切换到FK"
     )
     
     bpy.types.Scene.pipeline_leg_fk_to_ik_instruction = StringProperty(
         name="腿部FK切换到IK指令",
         default="",
-        description="输入bpy.ops指令,用于腿部FK切换到IK"
+        update=precompile_instruction,
+        description="输入bpy.ops.pose.rigify_*指令(参数须为字面量),用于腿部FK切换到IK"
     )
 
 def unregister_properties():
     # 预览动画属性
     del bpy.types.Scene.pipeline_playblast_quality
     del bpy.types.Scene.pipeline_playblast_format
+    del bpy.types.Scene.pipeline_playblast_speed
     del bpy.types.Scene.pipeline_playblast_show_file
     del bpy.types.Scene.pipeline_playblast_use_default_path
     del bpy.types.Scene.pipeline_playblast_filepath
     del bpy.types.Scene.pipeline_last_playblast
+    del bpy.types.Scene.pipeline_playblast_background
+    del bpy.types.Scene.pipeline_playblast_incremental
+    del bpy.types.Scene.pipeline_playblast_workers
+    del bpy.types.Scene.pipeline_playblast_sequence_format
+    del bpy.types.Scene.pipeline_playblast_encoder
+    del bpy.types.Scene.pipeline_playblast_encode_threads
+    del bpy.types.Scene.pipeline_playblast_codec_options
+    del bpy.types.Scene.pipeline_playblast_skip_unchanged
+    del bpy.types.Scene.pipeline_playblast_versioned
+    del bpy.types.Scene.pipeline_playblast_store_budget
+    del bpy.types.Scene.pipeline_playblast_profile
+    del bpy.types.Scene.pipeline_playblast_profile_summary
+    del bpy.types.WindowManager.pipeline_playblast_progress
+    del bpy.types.WindowManager.pipeline_playblast_status
     
     # 空物体属性
     del bpy.types.Scene.pipeline_empty_type
@@ -1169,18 +4403,34 @@ def unregister_properties():
     # 分区选择
     del bpy.types.Scene.pipeline_active_section
     
-    # 折叠面板显示状态
-    del bpy.types.Scene.pipeline_show_empty_tools
-    del bpy.types.Scene.pipeline_show_camera_tools
-    del bpy.types.Scene.pipeline_show_mode_tools
-    del bpy.types.Scene.pipeline_show_keyframe_tools
-    del bpy.types.Scene.pipeline_show_ikfk_tools
-    del bpy.types.Scene.pipeline_show_playblast_tools
-    del bpy.types.Scene.pipeline_show_rig_tools
-    del bpy.types.Scene.pipeline_show_extension_tools
-    del bpy.types.Scene.pipeline_show_mode_tools_rigging
-    del bpy.types.Scene.pipeline_show_ikfk_instructions
+    # 操作符性能记录和面板重绘测量属性
+    del bpy.types.Scene.pipeline_operator_timing
+    del bpy.types.Scene.pipeline_operator_timing_rows
+    del bpy.types.Scene.pipeline_redraw_duration
+    del bpy.types.Scene.pipeline_redraw_summary
+
+    # 角色关键帧属性
+    del bpy.types.Scene.pipeline_keyframe_use_range
+    del bpy.types.Scene.pipeline_keyframe_use_scene_range
+    del bpy.types.Scene.pipeline_keyframe_frame_start
+    del bpy.types.Scene.pipeline_keyframe_frame_end
+    del bpy.types.Scene.pipeline_keyframe_frame_step
+    
+    # 动画烘焙和精简关键帧属性
+    del bpy.types.Scene.pipeline_bake_mode
+    del bpy.types.Scene.pipeline_bake_only_selected
+    del bpy.types.Scene.pipeline_bake_simplify
+    del bpy.types.Scene.pipeline_bake_tolerance
+    del bpy.types.Scene.pipeline_bake_clear_constraints
+    del bpy.types.Scene.pipeline_reduce_tolerance
+    del bpy.types.Scene.pipeline_reduce_only_selected
     
+    # IK/FK烘焙属性
+    del bpy.types.Scene.pipeline_ikfk_bake_mode
+    del bpy.types.Scene.pipeline_ikfk_bake_use_scene_range
+    del bpy.types.Scene.pipeline_ikfk_bake_frame_start
+    del bpy.types.Scene.pipeline_ikfk_bake_frame_end
+
     # 预设指令属性
     del bpy.types.Scene.pipeline_arm_ik_to_fk_instruction
     del bpy.types.Scene.pipeline_arm_fk_to_ik_instruction
@@ -1196,18 +4446,40 @@ classes = (
     PIPELINE_OT_Addrigfy,
     PIPELINE_OT_GenerateRig,
     PIPELINE_OT_Playblast,
+    PIPELINE_OT_CancelPlayblast,
     PIPELINE_OT_DeletePlayblast,
+    PIPELINE_OT_PlayPlayblastVersion,
+    PIPELINE_OT_DeletePlayblastVersion,
     PIPELINE_OT_PlayblastPathSelect,
     PIPELINE_OT_AddEmpty,
     PIPELINE_OT_SetActiveCamera,
     PIPELINE_OT_KeyframeCharacter,
+    PIPELINE_OT_BakeAnimation,
+    PIPELINE_OT_ReduceKeyframes,
     PIPELINE_OT_SwitchMode,
     PIPELINE_OT_InstallExtensions,
     PIPELINE_OT_UpdateExtensions,
     PIPELINE_OT_FilterIKFKInDopesheet,
+    PIPELINE_OT_SelectIKFKCurves,
     PIPELINE_OT_IKFKSwitch,
+    PIPELINE_OT_IKFKSnapSwitches,
     PIPELINE_OT_ExecuteInstruction,
-    PIPELINE_PT_MainPanel
+    PIPELINE_OT_ExportOperatorTimings,
+    PIPELINE_OT_ClearOperatorTimings,
+    PIPELINE_OT_MeasurePanelRedraw,
+    PIPELINE_PT_MainPanel,
+    PIPELINE_PT_ModeTools,
+    PIPELINE_PT_EmptyTools,
+    PIPELINE_PT_CameraTools,
+    PIPELINE_PT_KeyframeTools,
+    PIPELINE_PT_BakeTools,
+    PIPELINE_PT_IKFKTools,
+    PIPELINE_PT_IKFKInstructions,
+    PIPELINE_PT_PlayblastTools,
+    PIPELINE_PT_PlayblastVersions,
+    PIPELINE_PT_RigTools,
+    PIPELINE_PT_ExtensionTools,
+    PIPELINE_PT_OperatorTimings
 )
 
 def register():
@@ -1217,9 +4489,44 @@ def register():
     
     # 注册属性
     register_properties()
+    
+    # 注册肢体索引缓存的失效回调
+    bpy.app.handlers.depsgraph_update_post.append(invalidate_limb_index)
+    bpy.app.handlers.load_post.append(clear_limb_index)
+    bpy.app.handlers.undo_post.append(clear_limb_index)
+    bpy.app.handlers.redo_post.append(clear_limb_index)
+    
+    # 按场景设置同步操作符性能记录,加载文件后再次同步
+    bpy.app.handlers.load_post.append(sync_operator_timing)
+    sync_operator_timing()
     print("Null Project Pipeline Tool Box 已注册")
 
 def unregister():
+    # 移除肢体索引缓存的失效回调
+    bpy.app.handlers.depsgraph_update_post.remove(invalidate_limb_index)
+    bpy.app.handlers.load_post.remove(clear_limb_index)
+    bpy.app.handlers.undo_post.remove(clear_limb_index)
+    bpy.app.handlers.redo_post.remove(clear_limb_index)
+    bpy.app.handlers.load_post.remove(sync_operator_timing)
+    _limb_index_cache.clear()
+    _ikfk_channel_cache.clear()
+    
+    # 结束未完成的后台预览,停止编码轮询
+    if _background_playblast:
+        _background_playblast['job']['process'].terminate()
+    if bpy.app.timers.is_registered(poll_playblast_encodes):
+        bpy.app.timers.unregister(poll_playblast_encodes)
+    
+    # 取消排队的编码并关闭线程池,正在运行的ffmpeg进程编码完当前文件后退出
+    if _playblast_encode_pool:
+        _playblast_encode_pool.pop('executor').shutdown(wait=False, cancel_futures=True)
+    _playblast_encodes.clear()
+    
+    # 恢复被性能记录替换的execute和重绘测量替换的draw
+    disable_operator_timing()
+    restore_panel_draws()
+    _operator_timings.clear()
+    
     # 注销所有类
     for cls in classes:
         bpy.utils.unregister_class(cls)
@@ -1228,6 +4535,805 @@ def unregister():
     unregister_properties()
     print("Null Project Pipeline Tool Box 已注销")
 
-# 当脚本直接运行时注册插件
+#---------------------------------------------------------------
+# 命令行入口 - 后台批处理
+#---------------------------------------------------------------
+# 用法: blender -b -P __init__.py -- <命令> [参数]
+#   playblast           批量预览多个.blend文件
+#   playblast-worker    单个文件的后台预览(由playblast命令内部调用)
+#   playblast-benchmark 比较单进程和并行分段预览的耗时
+#   rigify              批量重新生成多个.blend文件中的Rigify绑定
+#   rigify-worker       单个文件的后台生成(由rigify命令内部调用)
+#   benchmark           用程序生成的Rigify角色测试各操作符的耗时
+#   pole-check          检查解析极目标算法与旧的迭代算法的误差
+
+# worker每写出一帧时输出的进度标记
+WORKER_FRAME_MARKER = "PIPELINE_FRAME"
+
+# worker因场景未变化跳过渲染时输出的标记
+WORKER_SKIPPED_MARKER = "PIPELINE_SKIPPED"
+
+def expand_blend_files(patterns, list_file=None):
+    """展开文件列表、目录和通配符,返回去重后的.blend文件路径"""
+    if list_file:
+        with open(list_file, encoding="utf-8") as f:
+            patterns = list(patterns) + [line.strip() for line in f if line.strip()]
+    
+    files = []
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(glob.escape(pattern), "**", "*.blend"), recursive=True))
+        elif glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [pattern]
+        for path in matches:
+            path = os.path.abspath(path)
+            if path.endswith(".blend") and os.path.isfile(path) and path not in seen:
+                seen.add(path)
+                files.append(path)
+    return files
+
+def blender_worker_command(blend_file, command, worker_args, blender=None):
+    """构建在后台Blender进程中打开文件并执行本脚本子命令的命令行"""
+    return [
+        blender or bpy.app.binary_path,
+        "-b", blend_file,
+        "--python-exit-code", "1",
+        "-P", os.path.abspath(__file__),
+        "--", command,
+    ] + list(worker_args)
+
+def run_blender_worker(blend_file, command, worker_args, blender=None, timeout=None):
+    """在后台Blender进程中打开文件并执行本脚本的子命令,返回结果字典"""
+    cmd = blender_worker_command(blend_file, command, worker_args, blender)
+    
+    result = {'file': blend_file, 'status': 'ok', 'returncode': 0, 'error': ""}
+    start_time = time.perf_counter()
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace", timeout=timeout)
+        result['returncode'] = proc.returncode
+        if proc.returncode != 0:
+            result['status'] = 'failed'
+            result['error'] = "\n".join((proc.stdout + proc.stderr).splitlines()[-20:])
+        elif WORKER_SKIPPED_MARKER in proc.stdout:
+            result['status'] = 'skipped'
+    except subprocess.TimeoutExpired:
+        result['status'] = 'failed'
+        result['returncode'] = None
+        result['error'] = f"超时({timeout}秒)"
+    except OSError as e:
+        result['status'] = 'failed'
+        result['returncode'] = None
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start_time, 3)
+    return result
+
+def start_blender_worker(blend_file, command, worker_args, blender=None):
+    """启动不等待结束的后台Blender进程,由读取线程统计worker输出的进度"""
+    cmd = blender_worker_command(blend_file, command, worker_args, blender)
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, errors="replace")
+    job = {
+        'process': process,
+        'frames_done': 0,
+        'log': collections.deque(maxlen=20),
+        'cancelled': False,
+        'skipped': False,
+        'start_time': time.perf_counter(),
+    }
+    
+    def read_output():
+        for line in process.stdout:
+            if line.startswith(WORKER_FRAME_MARKER):
+                job['frames_done'] += 1
+            elif line.startswith(WORKER_SKIPPED_MARKER):
+                job['skipped'] = True
+            else:
+                job['log'].append(line.rstrip())
+    
+    job['reader'] = threading.Thread(target=read_output, daemon=True)
+    job['reader'].start()
+    return job
+
+def run_worker_pool(blend_files, submit, workers):
+    """用线程池驱动多个后台Blender进程,按完成顺序返回结果"""
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(submit, blend_file) for blend_file in blend_files]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            state = {'ok': "完成", 'skipped': "跳过"}.get(result['status'], "失败")
+            print(f"[{len(results)}/{len(futures)}] {state} {result['file']} ({result['seconds']:.1f}s)", flush=True)
+    return results
+
+def write_batch_summary(path, results, workers, elapsed, **extra):
+    """写入批处理的JSON汇总"""
+    summary = {
+        'created': datetime.datetime.now().isoformat(timespec="seconds"),
+        'workers': workers,
+        'total_seconds': round(elapsed, 3),
+        'succeeded': sum(1 for r in results if r['status'] == 'ok'),
+        'skipped': sum(1 for r in results if r['status'] == 'skipped'),
+        'failed': sum(1 for r in results if r['status'] not in ('ok', 'skipped')),
+        **extra,
+        'results': sorted(results, key=lambda r: r['file']),
+    }
+    output_dir = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+def cli_playblast(args):
+    """批量预览: 将多个.blend文件分发到后台Blender进程池"""
+    blend_files = expand_blend_files(args.files, args.list)
+    if not blend_files:
+        print("没有找到需要预览的.blend文件")
+        return 1
+    
+    ffmpeg = shutil.which("ffmpeg")
+    if args.sequence and not ffmpeg:
+        print("输出图像序列需要ffmpeg,请将其加入PATH")
+        return 1
+    
+    # 图像序列的编码在单独的线程池中进行,与后续镜头的渲染重叠
+    encode_pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.encode_workers))
+    encodes = {}
+    
+    def submit(blend_file):
+        # 指定输出目录时按文件名输出,否则与操作符一致输出到.blend文件所在目录
+        if args.output_dir:
+            stem = os.path.splitext(os.path.basename(blend_file))[0]
+            basepath = os.path.join(os.path.abspath(args.output_dir), stem)
+        else:
+            basepath = default_playblast_basepath(blend_file)
+        
+        worker_args = ["--quality", args.quality, "--format", args.format, "--speed", args.speed,
+                       "--output", basepath]
+        if args.scene:
+            worker_args += ["--scene", args.scene]
+        if args.incremental:
+            worker_args.append("--incremental")
+        if args.profile:
+            worker_args.append("--profile")
+        if args.skip_unchanged:
+            worker_args.append("--skip-unchanged")
+        if args.sequence:
+            worker_args += ["--sequence", args.sequence]
+        result = run_blender_worker(blend_file, "playblast-worker", worker_args, args.blender, args.timeout)
+        result['output'] = basepath + PLAYBLAST_FORMATS[args.format][1]
+        if args.sequence and result['status'] == 'ok':
+            encodes[blend_file] = encode_pool.submit(encode_playblast_sequence, playblast_frames_dir(result['output']),
+                                                     result['output'], args.quality, args.format, ffmpeg)
+        return result
+    
+    print(f"预览 {len(blend_files)} 个文件,{args.workers} 个后台进程", flush=True)
+    start_time = time.perf_counter()
+    with encode_pool:
+        results = run_worker_pool(blend_files, submit, args.workers)
+        
+        # 等待剩余的编码完成,编码失败的镜头计为失败
+        for result in results:
+            future = encodes.get(result['file'])
+            if not future:
+                continue
+            try:
+                result['encode_seconds'] = round(future.result(), 3)
+            except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+                result['status'] = 'failed'
+                result['error'] = getattr(e, "stderr", None) or str(e)
+                if isinstance(result['error'], bytes):
+                    result['error'] = result['error'].decode(errors="replace")
+    elapsed = time.perf_counter() - start_time
+    
+    summary = write_batch_summary(args.summary, results, args.workers, elapsed,
+                                  quality=args.quality, format=args.format)
+    print(f"完成 {summary['succeeded']} 个,跳过 {summary['skipped']} 个,失败 {summary['failed']} 个,用时 {elapsed:.1f} 秒,汇总: {args.summary}")
+    return 1 if summary['failed'] else 0
+
+def cli_playblast_worker(args):
+    """后台预览当前打开的.blend文件"""
+    scene = bpy.data.scenes[args.scene] if args.scene else bpy.context.scene
+    basepath = args.output or default_playblast_basepath(bpy.data.filepath)
+    filepath = apply_playblast_settings(scene, basepath, args.quality, args.format, args.speed)
+    
+    # 并行分段渲染时只渲染指定的帧范围
+    if args.frame_start is not None:
+        scene.frame_start = args.frame_start
+    if args.frame_end is not None:
+        scene.frame_end = args.frame_end
+    
+    # 输出PNG序列时output为目录
+    if args.image_sequence:
+        scene.render.image_settings.file_format = 'PNG'
+        scene.render.image_settings.color_mode = 'RGB'
+        scene.render.filepath = os.path.join(basepath, "frame_")
+        filepath = basepath
+    
+    # 场景内容未变化时跳过渲染(并行分段和帧序列由调用方管理,不做检查)
+    fingerprint = None
+    if args.skip_unchanged and not args.image_sequence and args.frame_start is None and args.frame_end is None:
+        fingerprint = scene_content_fingerprint(scene)
+        if playblast_unchanged(filepath, fingerprint):
+            print(WORKER_SKIPPED_MARKER, flush=True)
+            print(f"场景未变化,跳过预览: {filepath}")
+            return 0
+    
+    # 输出可续渲的图像序列,视频由调用方单独编码后再保存指纹;性能报告仍按视频路径写出
+    output_path = filepath
+    if args.sequence:
+        frames_dir, existing = prepare_playblast_sequence(scene, filepath, args.sequence,
+                                                          fingerprint or scene_content_fingerprint(scene))
+        if existing:
+            print(f"从已有的 {existing} 帧继续渲染")
+        filepath, fingerprint = frames_dir, None
+    
+    # 每写出一帧输出一行进度标记,供调用方统计进度
+    def report_frame(*args):
+        print(WORKER_FRAME_MARKER, scene.frame_current, flush=True)
+    bpy.app.handlers.render_write.append(report_frame)
+    
+    if args.profile:
+        start_playblast_profile()
+    
+    # 后台模式没有视口,直接用Workbench引擎渲染
+    if args.incremental and not args.sequence:
+        rendered, total = render_playblast_incremental(scene, filepath, args.quality, args.format)
+        print(f"增量预览: 重新渲染 {rendered}/{total} 帧")
+    else:
+        bpy.ops.render.render(animation=True, scene=scene.name)
+    
+    if fingerprint:
+        save_playblast_fingerprint(filepath, fingerprint)
+    
+    if args.profile:
+        rows, summary = stop_playblast_profile(filepath)
+        report_path = write_playblast_profile(output_path, rows, summary)
+        print(f"{format_playblast_profile(summary)}\n性能报告: {report_path}")
+    print(f"预览已输出: {filepath}")
+    return 0
+
+def cli_playblast_benchmark(args):
+    """比较单进程预览和并行分段预览的墙钟时间"""
+    blend_file = os.path.abspath(args.file)
+    bpy.ops.wm.open_mainfile(filepath=blend_file)
+    scene = bpy.context.scene
+    frame_step = scene.frame_step * PLAYBLAST_SPEED_PRESETS[args.speed][1]
+    frame_count = len(range(scene.frame_start, scene.frame_end + 1, frame_step))
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    results = []
+    for workers in args.workers:
+        basepath = os.path.join(output_dir, f"benchmark_{workers}")
+        start_time = time.perf_counter()
+        status, error = 'ok', ""
+        if workers <= 1:
+            # 单进程路径: 一个后台进程按顺序渲染全部帧
+            worker_args = ["--quality", args.quality, "--format", args.format, "--speed", args.speed,
+                           "--output", basepath, "--scene", scene.name]
+            result = run_blender_worker(blend_file, "playblast-worker", worker_args, args.blender)
+            status, error = result['status'], result['error']
+        else:
+            saved_settings = store_scene_settings(scene, PLAYBLAST_SCENE_SETTINGS)
+            try:
+                filepath = apply_playblast_settings(scene, basepath, args.quality, args.format, args.speed)
+                render_playblast_parallel(scene, filepath, args.quality,
+                                          args.format, workers, args.blender)
+            except (RuntimeError, OSError, subprocess.CalledProcessError) as e:
+                status, error = 'failed', str(e)
+            finally:
+                restore_scene_settings(scene, saved_settings)
+        elapsed = time.perf_counter() - start_time
+        results.append({
+            'workers': workers,
+            'status': status,
+            'error': error,
+            'seconds': round(elapsed, 3),
+            'frames_per_second': round(frame_count / elapsed, 2) if elapsed else None,
+        })
+        print(f"{workers} 个进程: {elapsed:.1f} 秒 ({status})", flush=True)
+    
+    # 以单进程(或第一项)结果为基准计算加速比
+    baseline = next((r for r in results if r['workers'] <= 1 and r['status'] == 'ok'), results[0])
+    for result in results:
+        result['speedup'] = round(baseline['seconds'] / result['seconds'], 2) if result['seconds'] else None
+    
+    summary = {
+        'file': blend_file,
+        'frames': frame_count,
+        'quality': args.quality,
+        'format': args.format,
+        'speed': args.speed,
+        'ffmpeg': shutil.which("ffmpeg") or "",
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.summary}")
+    return 0 if all(r['status'] == 'ok' for r in results) else 1
+
+def cli_rigify(args):
+    """批量生成: 将多个.blend文件中的Metarig分发到后台Blender进程池重新生成"""
+    blend_files = expand_blend_files(args.files, args.list)
+    if not blend_files:
+        print("没有找到需要生成绑定的.blend文件")
+        return 1
+    
+    with tempfile.TemporaryDirectory(prefix="pipeline_rigify_") as report_dir:
+        def submit(blend_file):
+            # 每个文件的逐绑定结果由worker写入单独的报告文件
+            report = os.path.join(report_dir, hashlib.sha1(blend_file.encode()).hexdigest() + ".json")
+            worker_args = ["--report", report]
+            if args.force:
+                worker_args.append("--force")
+            if args.no_save:
+                worker_args.append("--no-save")
+            for name in args.metarig or []:
+                worker_args += ["--metarig", name]
+            result = run_blender_worker(blend_file, "rigify-worker", worker_args, args.blender, args.timeout)
+            result['rigs'] = []
+            if os.path.exists(report):
+                with open(report, encoding="utf-8") as f:
+                    result['rigs'] = json.load(f)
+            return result
+        
+        print(f"生成 {len(blend_files)} 个文件中的绑定,{args.workers} 个后台进程", flush=True)
+        start_time = time.perf_counter()
+        results = run_worker_pool(blend_files, submit, args.workers)
+        elapsed = time.perf_counter() - start_time
+    
+    rigs = [rig for result in results for rig in result['rigs']]
+    summary = write_batch_summary(args.summary, results, args.workers, elapsed, force=args.force,
+                                  rigs_generated=sum(1 for rig in rigs if rig['status'] == 'ok'),
+                                  rigs_skipped=sum(1 for rig in rigs if rig['status'] == 'skipped'),
+                                  rigs_failed=sum(1 for rig in rigs if rig['status'] == 'failed'))
+    print(f"生成 {summary['rigs_generated']} 个绑定,跳过 {summary['rigs_skipped']} 个,失败 {summary['rigs_failed']} 个,"
+          f"文件失败 {summary['failed']} 个,用时 {elapsed:.1f} 秒,汇总: {args.summary}")
+    return 1 if summary['failed'] else 0
+
+def cli_rigify_worker(args):
+    """后台重新生成当前打开的.blend文件中的所有Metarig并保存"""
+    ensure_rigify_enabled()
+    if bpy.context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    
+    metarigs = [obj for obj in bpy.data.objects
+                if is_metarig(obj) and (not args.metarig or obj.name in args.metarig)]
+    rigs = []
+    for metarig in metarigs:
+        entry = {'metarig': metarig.name, 'rig': None, 'status': 'ok', 'seconds': 0.0, 'error': ""}
+        try:
+            rig, generated, elapsed = generate_rigify_rig(bpy.context, metarig, args.force)
+            entry['rig'] = rig.name if rig else None
+            entry['status'] = 'ok' if generated else 'skipped'
+            entry['seconds'] = round(elapsed, 3)
+        except RuntimeError as e:
+            entry['status'] = 'failed'
+            entry['error'] = str(e)
+        rigs.append(entry)
+        print(f"{entry['status']} {metarig.name} ({entry['seconds']:.1f}s) {entry['error']}".rstrip(), flush=True)
+    
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(rigs, f, ensure_ascii=False, indent=2)
+    
+    generated = sum(1 for entry in rigs if entry['status'] == 'ok')
+    failed = sum(1 for entry in rigs if entry['status'] == 'failed')
+    if generated and not args.no_save:
+        bpy.ops.wm.save_mainfile()
+        print(f"已保存: {bpy.data.filepath}")
+    elif not generated and not failed:
+        print(WORKER_SKIPPED_MARKER, flush=True)
+        print("没有需要重新生成的绑定")
+    return 1 if failed else 0
+
+# 基准测试中为FK骨骼设置的弯曲角度(弧度),每个角色略有不同以避免完全相同的姿态
+BENCHMARK_BEND_ANGLES = (0.2, 0.9, 0.4)
+
+# 基准测试的阶段
+BENCHMARK_STAGES = ("generate", "keyframe_character", "ikfk_switch", "pole", "playblast")
+
+def benchmark_commit():
+    """返回插件所在git仓库的当前提交,便于比较不同提交的结果"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def build_benchmark_characters(context, count, frame_start, frame_end):
+    """在空场景中生成指定数量的Rigify角色并为FK肢体设置动画,返回(绑定列表, 每个角色的生成用时)"""
+    rigs = []
+    timings = []
+    for index in range(count):
+        context.scene.cursor.location = (index * 2.0, 0.0, 0.0)
+        bpy.ops.object.armature_human_metarig_add()
+        metarig = context.active_object
+        rig, generated, elapsed = generate_rigify_rig(context, metarig, force=True)
+        metarig.hide_set(True)
+        rigs.append(rig)
+        timings.append(elapsed)
+        
+        # 在起止帧和中间帧为FK骨骼设置不同的弯曲,使每帧的切换都有实际计算
+        frames = (frame_start, (frame_start + frame_end) // 2, frame_end)
+        for limb_type in ('ARM_L', 'ARM_R', 'LEG_L', 'LEG_R'):
+            ik_bones, fk_bones, pole, has_pole = get_limb_chain(rig, limb_type)
+            for bone in fk_bones[:2]:
+                if bone is None or bone.rotation_mode == 'AXIS_ANGLE':
+                    continue
+                attr = "rotation_quaternion" if bone.rotation_mode == 'QUATERNION' else "rotation_euler"
+                for frame, angle in zip(frames, BENCHMARK_BEND_ANGLES):
+                    rotation = Euler((angle + index * 0.01, 0.0, 0.0))
+                    setattr(bone, attr, rotation.to_quaternion() if attr == "rotation_quaternion" else rotation)
+                    bone.keyframe_insert(data_path=attr, frame=frame, group=bone.name)
+    return rigs, timings
+
+def enter_benchmark_pose_mode(context, rigs):
+    """让指定的绑定(且只有这些绑定)进入姿态模式"""
+    if context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    for obj in context.view_layer.objects:
+        obj.select_set(obj in rigs)
+    context.view_layer.objects.active = rigs[0]
+    bpy.ops.object.mode_set(mode='POSE')
+
+def benchmark_operator(name, call):
+    """执行一个基准测试阶段,返回结果字典"""
+    result = {'status': 'ok', 'seconds': 0.0, 'error': ""}
+    start_time = time.perf_counter()
+    try:
+        outcome = call()
+        if isinstance(outcome, set) and 'FINISHED' not in outcome:
+            result['status'] = 'failed'
+            result['error'] = f"{name} 返回 {sorted(outcome)}"
+    except (RuntimeError, KeyError, ValueError) as e:
+        result['status'] = 'failed'
+        result['error'] = str(e)
+    result['seconds'] = round(time.perf_counter() - start_time, 4)
+    return result
+
+# 极目标对比: FK骨骼链姿态的数量和允许的方向误差(度)
+POLE_CHECK_POSES = 12
+POLE_CHECK_TOLERANCE = 1.0
+
+def build_pole_test_rig(context, name, location=(0.0, 0.0, 0.0)):
+    """创建骨骼命名与IKFK_LIMB_CHAINS一致的双骨骼IK/FK测试手臂,返回骨架对象
+    
+    极目标骨骼没有父级且静止矩阵为单位矩阵,两种极目标算法都可以直接使用
+    """
+    (upper_ik, lower_ik, hand_ik), (upper_fk, lower_fk, hand_fk), pole_name, parent_name = \
+        [[name + ".L" for name in names] if isinstance(names, tuple) else names + ".L"
+         for names in IKFK_LIMB_CHAINS['ARM']]
+    
+    rig = bpy.data.objects.new(name, bpy.data.armatures.new(name))
+    rig.location = location
+    context.scene.collection.objects.link(rig)
+    if context.mode != 'OBJECT':
+        bpy.ops.object.mode_set(mode='OBJECT')
+    context.view_layer.objects.active = rig
+    bpy.ops.object.mode_set(mode='EDIT')
+    
+    edit_bones = rig.data.edit_bones
+    def add_bone(bone_name, head, tail, parent=None):
+        bone = edit_bones.new(bone_name)
+        bone.head, bone.tail = head, tail
+        if parent:
+            bone.parent = edit_bones[parent]
+            bone.use_connect = bone.head == bone.parent.tail
+        return bone
+    
+    # 静止姿态略微弯曲,确定IK的弯曲平面
+    add_bone(parent_name, (0.0, 0.0, 0.0), (0.0, 0.0, -0.3))
+    for upper, lower in ((upper_fk, lower_fk), (upper_ik, lower_ik)):
+        add_bone(upper, (0.0, 0.0, 0.0), (1.0, 0.0, -0.01), parent_name)
+        add_bone(lower, (1.0, 0.0, -0.01), (2.0, 0.0, 0.0), upper)
+    add_bone(hand_fk, (2.0, 0.0, 0.0), (2.3, 0.0, 0.0), lower_fk)
+    add_bone(hand_ik, (2.0, 0.0, 0.0), (2.3, 0.0, 0.0))
+    add_bone(pole_name, (0.0, 0.0, 0.0), (0.0, 0.2, 0.0))
+    bpy.ops.object.mode_set(mode='POSE')
+    
+    pose_bones = rig.pose.bones
+    for bone in pose_bones:
+        bone.rotation_mode = 'QUATERNION'
+    constraint = pose_bones[lower_ik].constraints.new('IK')
+    constraint.target = rig
+    constraint.subtarget = hand_ik
+    constraint.pole_target = rig
+    constraint.pole_subtarget = pole_name
+    constraint.pole_angle = -math.pi / 2
+    constraint.chain_count = 2
+    return rig
+
+def compare_pole_solvers(context, rigs, poses=POLE_CHECK_POSES, tolerance=POLE_CHECK_TOLERANCE):
+    """在测试手臂上比较解析和迭代两种极目标匹配算法的耗时和误差
+    
+    每个FK姿态下两种算法都从相同的IK目标和复位的极目标开始,误差为IK与FK骨骼方向的最大夹角(度)。
+    解析算法的误差超过容差或比迭代算法大超过容差时状态为failed
+    """
+    view_layer = context.view_layer
+    solvers = {'analytic': {'seconds': [], 'errors': []}, 'iterative': {'seconds': [], 'errors': []}}
+    for rig in rigs:
+        ik_bones, fk_bones, pole, has_pole = get_limb_chain(rig, 'ARM_L')
+        hand_ik, hand_fk = ik_bones[-1], fk_bones[-1]
+        rest_pole = pole.matrix_basis.copy()
+        for i in range(poses):
+            # 上臂任意方向旋转,前臂在弯曲平面内逐渐弯曲
+            fk_bones[0].rotation_quaternion = Euler((0.3 * math.sin(i), 0.7 * math.cos(1.3 * i),
+                                                     0.5 * math.sin(0.7 * i))).to_quaternion()
+            fk_bones[1].rotation_quaternion = Euler((-(0.3 + 1.2 * (i % 5) / 4), 0.0, 0.0)).to_quaternion()
+            view_layer.update()
+            hand_ik.matrix = hand_fk.matrix.copy()
+            view_layer.update()
+            
+            for solver, stats in solvers.items():
+                pole.matrix_basis = rest_pole
+                view_layer.update()
+                
+                start_time = time.perf_counter()
+                if solver == 'analytic':
+                    match_pole_target(pole, fk_bones[0], fk_bones[1], 1.0)
+                    view_layer.update()
+                else:
+                    match_pole_target_iterative(view_layer, ik_bones[0], ik_bones[1], pole, fk_bones[0].matrix.copy(), 1.0)
+                stats['seconds'].append(time.perf_counter() - start_time)
+                stats['errors'].append(max(math.degrees(ik_bone.vector.angle(fk_bone.vector))
+                                           for ik_bone, fk_bone in zip(ik_bones[:2], fk_bones[:2])))
+        pole.matrix_basis = rest_pole
+    
+    result = {}
+    for solver, stats in solvers.items():
+        samples = len(stats['seconds'])
+        result[solver] = {
+            'limbs': samples,
+            'mean_ms': round(sum(stats['seconds']) / samples * 1000.0, 4) if samples else None,
+            'mean_error_deg': round(sum(stats['errors']) / samples, 4) if samples else None,
+            'max_error_deg': round(max(stats['errors']), 4) if samples else None,
+        }
+    if result['analytic']['mean_ms'] and result['iterative']['mean_ms']:
+        result['speedup'] = round(result['iterative']['mean_ms'] / result['analytic']['mean_ms'], 2)
+    
+    # 解析算法必须与FK骨骼链一致,且每个姿态都不比迭代算法差
+    failures = [i for i, (analytic, iterative) in enumerate(zip(solvers['analytic']['errors'], solvers['iterative']['errors']))
+                if analytic > tolerance or analytic > iterative + tolerance]
+    result['tolerance_deg'] = tolerance
+    result['status'] = 'failed' if failures or not solvers['analytic']['errors'] else 'ok'
+    result['error'] = f"{len(failures)} 个姿态超出容差" if failures else ""
+    return result
+
+def run_benchmark_scale(count, args, output_dir):
+    """在新的空场景中以指定角色数量运行所有阶段"""
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    ensure_rigify_enabled()
+    context = bpy.context
+    scene = context.scene
+    scene.frame_start, scene.frame_end = 1, args.frames
+    
+    stages = {}
+    start_time = time.perf_counter()
+    rigs, timings = build_benchmark_characters(context, count, scene.frame_start, scene.frame_end)
+    stages['generate'] = {
+        'status': 'ok',
+        'seconds': round(time.perf_counter() - start_time, 4),
+        'per_character_seconds': [round(elapsed, 4) for elapsed in timings],
+    }
+    result = {'characters': count, 'bones': sum(len(rig.pose.bones) for rig in rigs), 'stages': stages}
+    
+    if "keyframe_character" in args.stages:
+        enter_benchmark_pose_mode(context, rigs)
+        with context.temp_override(active_object=rigs[0], object=rigs[0], objects_in_mode=rigs):
+            stages['keyframe_character'] = benchmark_operator("pipeline.keyframe_character", lambda: bpy.ops.pipeline.keyframe_character(
+                key_type='WHOLE', use_frame_range=True, use_scene_range=True))
+    
+    if "ikfk_switch" in args.stages:
+        # Rigify绑定的IK骨骼链是MCH-forearm_ik等机制骨骼,肢体索引识别不到;
+        # 每个角色配一个骨骼命名与插件一致、IK控制骨骼带动画的测试手臂,每个手臂单独进入姿态模式,只计切换操作符的时间
+        stage = {'status': 'ok', 'seconds': 0.0, 'error': "", 'limbs': 0}
+        for index in range(count):
+            rig = build_pole_test_rig(context, f"IKFKTest{index}", (index * 2.0, 8.0, 0.0))
+            rig.pose.bones["upper_arm_parent.L"]["IK_FK"] = 0.0
+            bone = rig.pose.bones["hand_ik.L"]
+            for frame, location in ((scene.frame_start, (0.0, 0.0, 0.0)), (scene.frame_end, (-0.4, 0.3, 0.2))):
+                bone.location = location
+                bone.keyframe_insert("location", frame=frame)
+            
+            enter_benchmark_pose_mode(context, [rig])
+            with context.temp_override(active_object=rig, object=rig, selected_pose_bones=[bone]):
+                rig_result = benchmark_operator("pipeline.ikfk_switch", lambda: bpy.ops.pipeline.ikfk_switch(
+                    bake_mode='RANGE', use_scene_range=True))
+            stage['seconds'] = round(stage['seconds'] + rig_result['seconds'], 4)
+            if rig_result['status'] != 'ok':
+                stage.update(status='failed', error=rig_result['error'])
+                break
+            
+            # 确认FK骨骼链确实写入了烘焙的关键帧
+            fcurve = rig.animation_data.action.fcurves.find(
+                f'{pose_bone_data_path("forearm_fk.L")}.rotation_quaternion', index=0)
+            if fcurve is None or not len(fcurve.keyframe_points):
+                stage.update(status='failed', error=f"{rig.name} 的FK骨骼链没有烘焙关键帧")
+                break
+            stage['limbs'] += 1
+        stages['ikfk_switch'] = stage
+    
+    if "pole" in args.stages:
+        # Rigify绑定中没有forearm_ik等IK控制骨骼,每个角色配一个骨骼命名与插件一致的测试手臂
+        test_rigs = [build_pole_test_rig(context, f"PoleTest{index}", (index * 2.0, 4.0, 0.0)) for index in range(count)]
+        stages['pole'] = compare_pole_solvers(context, test_rigs)
+    
+    if "playblast" in args.stages:
+        # 后台模式没有视口,计时与playblast-worker相同的路径: 应用预览设置后用Workbench引擎直接渲染,
+        # 不经过界面中的预览操作符(视口渲染、版本库和性能分析)
+        if context.mode != 'OBJECT':
+            bpy.ops.object.mode_set(mode='OBJECT')
+        camera = bpy.data.objects.new("BenchmarkCamera", bpy.data.cameras.new("BenchmarkCamera"))
+        scene.collection.objects.link(camera)
+        camera.location = (count - 1.0, -4.0 - count * 1.2, 1.0)
+        camera.rotation_euler = (math.pi / 2, 0.0, 0.0)
+        scene.camera = camera
+        basepath = os.path.join(output_dir, f"benchmark_{count}")
+        
+        def render_playblast():
+            apply_playblast_settings(scene, basepath, args.quality, args.format)
+            return bpy.ops.render.render(animation=True)
+        stages['playblast'] = benchmark_operator("render.render", render_playblast)
+        stages['playblast']['path'] = "playblast-worker (apply_playblast_settings + render.render)"
+    
+    for name, stage in stages.items():
+        if 'seconds' in stage:
+            print(f"{count} 个角色 {name}: {stage['seconds']:.3f} 秒 ({stage['status']})", flush=True)
+        else:
+            print(f"{count} 个角色 {name}: 解析 {stage['analytic']['mean_ms']} 毫秒/肢体,"
+                  f"迭代 {stage['iterative']['mean_ms']} 毫秒/肢体,"
+                  f"最大误差 {stage['analytic']['max_error_deg']}/{stage['iterative']['max_error_deg']} 度 ({stage['status']})", flush=True)
+    return result
+
+def cli_pole_check(args):
+    """极目标回归检查: 解析算法与FK骨骼链一致,且不比迭代算法差"""
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    rig = build_pole_test_rig(bpy.context, "PoleTest")
+    result = compare_pole_solvers(bpy.context, [rig], args.poses, args.tolerance)
+    for solver in ('analytic', 'iterative'):
+        stats = result[solver]
+        print(f"{solver}: 平均 {stats['mean_ms']} 毫秒,平均误差 {stats['mean_error_deg']} 度,最大误差 {stats['max_error_deg']} 度")
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    print("通过" if result['status'] == 'ok' else f"失败: {result['error']}")
+    return 0 if result['status'] == 'ok' else 1
+
+def cli_benchmark(args):
+    """用程序生成的Rigify角色在不同规模下测试各操作符的耗时"""
+    # 作为脚本运行时插件尚未注册,操作符需要先注册才能调用
+    registered = hasattr(bpy.types.Scene, "pipeline_active_section")
+    if not registered:
+        register()
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else tempfile.mkdtemp(prefix="pipeline_benchmark_")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    
+    try:
+        results = [run_benchmark_scale(count, args, output_dir) for count in args.characters]
+    finally:
+        if not registered:
+            unregister()
+    
+    summary = {
+        'created': datetime.datetime.now().isoformat(timespec="seconds"),
+        'commit': benchmark_commit(),
+        'blender': bpy.app.version_string,
+        'cpu_count': os.cpu_count(),
+        'frames': args.frames,
+        'quality': args.quality,
+        'format': args.format,
+        'results': results,
+    }
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入: {args.summary}")
+    failed = any(stage.get('status', 'ok') != 'ok' for result in results for stage in result['stages'].values())
+    return 1 if failed else 0
+
+def build_cli_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="blender -b -P __init__.py --",
+        description="Null Project Pipeline Toolbox 后台批处理"
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    playblast = commands.add_parser("playblast", help="批量预览多个.blend文件")
+    playblast.add_argument("files", nargs="*", help=".blend文件路径或通配符(支持**)")
+    playblast.add_argument("--list", help="包含.blend文件路径的文本文件,每行一个")
+    playblast.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="后台进程数")
+    playblast.add_argument("--quality", choices=sorted(PLAYBLAST_QUALITIES), default='LOW')
+    playblast.add_argument("--format", choices=sorted(PLAYBLAST_FORMATS), default='QUICKTIME')
+    playblast.add_argument("--output-dir", help="输出目录(默认输出到各.blend文件所在目录)")
+    playblast.add_argument("--scene", help="要预览的场景名称(默认使用文件的活动场景)")
+    playblast.add_argument("--summary", default="playblast_summary.json", help="JSON汇总输出路径")
+    playblast.add_argument("--blender", help="Blender可执行文件路径(默认使用当前Blender)")
+    playblast.add_argument("--timeout", type=float, help="单个文件的超时时间(秒)")
+    playblast.add_argument("--incremental", action="store_true", help="使用帧缓存,只重新渲染变化的帧")
+    playblast.add_argument("--speed", choices=list(PLAYBLAST_SPEED_PRESETS), default='FULL', help="提速预设")
+    playblast.add_argument("--profile", action="store_true", help="在每个输出文件旁写入逐帧性能报告")
+    playblast.add_argument("--skip-unchanged", action="store_true", help="场景内容指纹与已有输出一致时跳过渲染")
+    playblast.add_argument("--sequence", choices=list(PLAYBLAST_SEQUENCE_FORMATS),
+                           help="先渲染可续渲的图像序列,再在编码线程池中编码为视频(需要ffmpeg)")
+    playblast.add_argument("--encode-workers", type=int, default=2, help="图像序列的编码线程数")
+    playblast.set_defaults(handler=cli_playblast)
+    
+    worker = commands.add_parser("playblast-worker", help=argparse.SUPPRESS)
+    worker.add_argument("--quality", choices=sorted(PLAYBLAST_QUALITIES), default='LOW')
+    worker.add_argument("--format", choices=sorted(PLAYBLAST_FORMATS), default='QUICKTIME')
+    worker.add_argument("--output", help="输出路径(不含扩展名)")
+    worker.add_argument("--scene")
+    worker.add_argument("--incremental", action="store_true")
+    worker.add_argument("--speed", choices=list(PLAYBLAST_SPEED_PRESETS), default='FULL')
+    worker.add_argument("--profile", action="store_true")
+    worker.add_argument("--skip-unchanged", action="store_true")
+    worker.add_argument("--sequence", choices=list(PLAYBLAST_SEQUENCE_FORMATS))
+    worker.add_argument("--frame-start", type=int)
+    worker.add_argument("--frame-end", type=int)
+    worker.add_argument("--image-sequence", action="store_true")
+    worker.set_defaults(handler=cli_playblast_worker)
+    
+    benchmark = commands.add_parser("playblast-benchmark", help="比较单进程和并行分段预览的耗时")
+    benchmark.add_argument("file", help=".blend文件路径")
+    benchmark.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8], help="要测试的进程数,1为单进程")
+    benchmark.add_argument("--quality", choices=sorted(PLAYBLAST_QUALITIES), default='LOW')
+    benchmark.add_argument("--format", choices=sorted(PLAYBLAST_FORMATS), default='QUICKTIME')
+    benchmark.add_argument("--speed", choices=list(PLAYBLAST_SPEED_PRESETS), default='FULL', help="提速预设")
+    benchmark.add_argument("--output-dir", help="测试输出目录(默认使用临时目录)")
+    benchmark.add_argument("--summary", default="playblast_benchmark.json", help="JSON结果输出路径")
+    benchmark.add_argument("--blender", help="Blender可执行文件路径(默认使用当前Blender)")
+    benchmark.set_defaults(handler=cli_playblast_benchmark)
+    
+    rigify = commands.add_parser("rigify", help="批量重新生成多个.blend文件中的Rigify绑定")
+    rigify.add_argument("files", nargs="*", help=".blend文件路径、目录或通配符(支持**)")
+    rigify.add_argument("--list", help="包含.blend文件路径的文本文件,每行一个")
+    rigify.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="后台进程数")
+    rigify.add_argument("--metarig", action="append", help="只生成指定名称的Metarig(可重复)")
+    rigify.add_argument("--force", action="store_true", help="即使Metarig没有变化也重新生成")
+    rigify.add_argument("--no-save", action="store_true", help="只生成并报告,不保存文件")
+    rigify.add_argument("--summary", default="rigify_summary.json", help="JSON汇总输出路径")
+    rigify.add_argument("--blender", help="Blender可执行文件路径(默认使用当前Blender)")
+    rigify.add_argument("--timeout", type=float, help="单个文件的超时时间(秒)")
+    rigify.set_defaults(handler=cli_rigify)
+    
+    rigify_worker = commands.add_parser("rigify-worker", help=argparse.SUPPRESS)
+    rigify_worker.add_argument("--metarig", action="append")
+    rigify_worker.add_argument("--force", action="store_true")
+    rigify_worker.add_argument("--no-save", action="store_true")
+    rigify_worker.add_argument("--report", help="逐绑定结果的JSON输出路径")
+    rigify_worker.set_defaults(handler=cli_rigify_worker)
+    
+    suite = commands.add_parser("benchmark", help="用程序生成的Rigify角色测试各操作符的耗时")
+    suite.add_argument("--characters", type=int, nargs="+", default=[1, 10, 50], help="要测试的角色数量")
+    suite.add_argument("--frames", type=int, default=48, help="动画帧数")
+    suite.add_argument("--stages", nargs="+", choices=BENCHMARK_STAGES[1:], default=list(BENCHMARK_STAGES[1:]),
+                       help="要测试的阶段(生成绑定总是会计时)")
+    suite.add_argument("--quality", choices=sorted(PLAYBLAST_QUALITIES), default='LOW')
+    suite.add_argument("--format", choices=sorted(PLAYBLAST_FORMATS), default='QUICKTIME')
+    suite.add_argument("--output-dir", help="预览输出目录(默认使用临时目录)")
+    suite.add_argument("--summary", default="pipeline_benchmark.json", help="JSON结果输出路径")
+    suite.set_defaults(handler=cli_benchmark)
+    
+    pole_check = commands.add_parser("pole-check", help="检查解析极目标算法与旧的迭代算法的误差")
+    pole_check.add_argument("--poses", type=int, default=POLE_CHECK_POSES, help="测试的FK姿态数")
+    pole_check.add_argument("--tolerance", type=float, default=POLE_CHECK_TOLERANCE, help="允许的骨骼方向误差(度)")
+    pole_check.add_argument("--summary", help="JSON结果输出路径")
+    pole_check.set_defaults(handler=cli_pole_check)
+    return parser
+
+def main(argv):
+    """命令行入口,返回进程退出码"""
+    args = build_cli_parser().parse_args(argv)
+    return args.handler(args)
+
+# 当脚本直接运行时注册插件,带"--"参数时作为命令行工具运行
 if __name__ == "__main__":
+    if "--" in sys.argv:
+        sys.exit(main(sys.argv[sys.argv.index("--") + 1:]))
     register()
\ No newline at end of file